@@ -1,27 +1,73 @@
 from .core import (
+    as_completed,
+    cached_shell,
+    CommandCache,
+    CompletedShell,
+    expand_wildcards,
     expose_tilde,
+    ForkServer,
+    get_fork_server,
+    get_working_directory,
     normalize_short_and_long_args,
+    parallel_map,
+    parallel_pipe,
+    Pipeline,
     quotes_wrapper,
     shell,
     Shell,
-    ShortArgsOption
+    shell_quote_many,
+    ShortArgsOption,
+    start_fork_server,
+    stop_fork_server,
+    wait_all,
+    wait_any,
+    working_directory
 )
 from .extra import (
+    ColumnarListing,
     force_sudo_password_promt,
+    get_privileged_session,
     get_root_privileges,
     get_root_privileges_or_exit,
     has_root_privileges,
+    list_columnar,
     list_dirs,
-    list_files
+    list_files,
+    ListingCache,
+    PrivilegedSession,
+    start_privileged_session,
+    stop_privileged_session,
+    sync
+)
+from .gnu_coreutils import (
+    cd,
+    cp,
+    find,
+    journaled_batch,
+    ln,
+    ls,
+    ls_entries,
+    LsEntry,
+    mv,
+    pwd,
+    rm,
+    Script
 )
-from .gnu_coreutils import cd, cp, ln, ls, mv, pwd, rm
 
-__all__ = ["cd", "cp", "expose_tilde", "force_sudo_password_promt",
-           "get_root_privileges", "get_root_privileges_or_exit", "GID",
-           "GROUP", "has_root_privileges", "HOME", "list_dirs", "list_files",
-           "ln", "ls", "mv", "normalize_short_and_long_args", "pwd",
-           "quotes_wrapper", "rm", "shell", "Shell", "ShortArgsOption", "UID",
-           "USER"]
+__all__ = ["as_completed", "cached_shell", "cd", "ColumnarListing",
+           "CommandCache", "CompletedShell", "cp", "expand_wildcards",
+           "expose_tilde", "find", "force_sudo_password_promt", "ForkServer",
+           "get_fork_server", "get_privileged_session", "get_root_privileges",
+           "get_root_privileges_or_exit", "get_working_directory", "GID",
+           "GROUP", "has_root_privileges", "HOME", "journaled_batch",
+           "list_columnar", "list_dirs", "list_files", "ListingCache", "ln",
+           "ls", "ls_entries", "LsEntry", "mv",
+           "normalize_short_and_long_args", "parallel_map", "parallel_pipe",
+           "Pipeline", "PrivilegedSession", "pwd", "quotes_wrapper", "rm",
+           "Script", "shell", "Shell", "shell_quote_many", "ShortArgsOption",
+           "start_fork_server", "start_privileged_session", "stop_fork_server",
+           "stop_privileged_session", "sync", "UID", "USER", "wait_all",
+           "wait_any", "working_directory"]
 __author__ = "Andrew Voynov"
 __version__ = "2.0.3"
 
@@ -0,0 +1,105 @@
+"""
+Fork server of niceshell.core.ForkServer. The file is executed as a script
+(isolated mode) with fd of the connected Unix socket as the only argument.
+
+Request: 4-byte length + JSON (spawn requests carry stdin, stdout and stderr
+fds as SCM_RIGHTS). Reply: kind, pid, value (struct "!cii"): b"S" (spawned,
+0), b"F" (0, errno) or b"X" (exit code).
+"""
+import array
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+
+
+def main(socket_fd: int):
+    signal.signal(signal.SIGINT, lambda signum, frame: None)  # For children
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0,
+                               socket_fd)
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    selector = selectors.DefaultSelector()
+    selector.register(connection, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+    processes, data, fds = {}, b"", []
+    connection.sendall(b"R")
+
+    def reply(kind: bytes, pid: int, value: int):
+        connection.sendall(struct.pack("!cii", kind, pid, value))
+
+    def handle(request: dict):
+        if "signal" in request:
+            process = processes.get(request["pid"])
+            if process is not None:
+                process.send_signal(request["signal"])
+            return
+        stdio = fds[:3]
+        del fds[:3]
+        try:
+            process = subprocess.Popen(
+                request["args"], executable=request["executable"],
+                cwd=request["cwd"], env=request["env"],
+                stdin=stdio[0], stdout=stdio[1], stderr=stdio[2])
+        except OSError as error:
+            reply(b"F", 0, error.errno or 0)
+        except Exception:
+            reply(b"F", 0, 0)
+        else:
+            processes[process.pid] = process
+            reply(b"S", process.pid, 0)
+        finally:
+            for fd in stdio:
+                os.close(fd)
+
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is connection:
+                chunk, ancdata, _, _ = connection.recvmsg(
+                    65536, socket.CMSG_SPACE(1024 * 4))
+                if not chunk:
+                    os._exit(0)
+                for level, kind, items in ancdata:
+                    if (level == socket.SOL_SOCKET and
+                            kind == socket.SCM_RIGHTS):
+                        fds.extend(array.array(
+                            "i", items[:len(items) - len(items) % 4]))
+                data += chunk
+                while len(data) >= 4:
+                    size = 4 + struct.unpack("!I", data[:4])[0]
+                    if len(data) < size:
+                        break
+                    request, data = json.loads(data[4:size]), data[size:]
+                    handle(request)
+                continue
+            try:
+                while os.read(wakeup_read, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+            while processes:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if not pid:
+                    break
+                process = processes.pop(pid, None)
+                if process is None:
+                    continue
+                if os.WIFSIGNALED(status):
+                    process.returncode = -os.WTERMSIG(status)
+                else:
+                    process.returncode = os.WEXITSTATUS(status)
+                reply(b"X", pid, process.returncode)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
@@ -0,0 +1,1164 @@
+"""
+Native (in-process) implementations of file operations which are used by
+gnu_coreutils instead of executing a process.
+"""
+import errno
+import hashlib
+import os
+import stat
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import regex as re
+
+from .core import CompletedShell
+
+try:
+    import fcntl
+except ImportError:  # Not Unix
+    fcntl = None
+
+_BUFFER_SIZE = 1024 * 1024
+_FIND_BATCH_SIZE = 1024
+_COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+_REMOVE_SPLIT_DEPTH = 3
+_FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+_FILE_TYPES = {stat.S_IFBLK: 'b', stat.S_IFCHR: 'c', stat.S_IFDIR: 'd',
+               stat.S_IFIFO: 'p', stat.S_IFLNK: 'l', stat.S_IFREG: 'f',
+               stat.S_IFSOCK: 's'}
+_PRESERVE_ATTRIBUTES = {"all", "links", "mode", "ownership", "timestamps",
+                        "xattr"}
+# Errors which mean that method isn't supported for particular files
+_UNSUPPORTED_ERRNOS = {errno.EBADF, errno.EINVAL, errno.ENOSYS, errno.ENOTSUP,
+                       errno.ENOTTY, errno.EOPNOTSUPP, errno.EXDEV}
+
+
+def expand_tilde(path: str) -> str:
+    '''Expands '~' the same way as expose_tilde(quotes_wrapper()) does.'''
+    if path == '~' or path.startswith("~/"):
+        return os.path.expanduser('~') + path[1:]
+    return path
+
+
+def parse_args(short_args: Union[str, Iterable[str]],
+               long_args: Iterable[str],
+               aliases: Dict[str, str],
+               supported: Iterable[str]) -> Dict[str, Union[str, None]]:
+    """
+    Converts short and long arguments to dict of long argument names and
+    their values (None if argument doesn't have value).
+
+    Parameters:
+        short_args (str | Iterable[str]): string or array of short arguments.
+        long_args (Iterable[str]): array of long arguments.
+        aliases (Dict[str, str]): long argument name of every supported short
+            argument.
+        supported (Iterable[str]): supported long arguments.
+
+    Raises:
+        ValueError: argument isn't supported.
+
+    Returns:
+        Dict[str, str | None]: long arguments and their values.
+    """
+    args = {}
+    if isinstance(short_args, str):
+        short_args = list(short_args.lstrip('-'))
+    for arg in short_args:
+        arg = arg.lstrip('-')
+        if not arg:
+            continue
+        if arg[0] not in aliases:
+            raise ValueError(f"-{arg} isn't supported in native mode.")
+        args[aliases[arg[0]]] = arg[1:].strip() or None
+    for arg in long_args:
+        name, separator, value = arg.lstrip('-').partition('=')
+        if name not in supported:
+            raise ValueError(f"--{name} isn't supported in native mode.")
+        args[name] = value if separator else None
+    return args
+
+
+def _result(command: str, messages: List[str],
+            errors: List[Tuple[str, OSError]], stats: dict,
+            output='') -> CompletedShell:
+    stderr = ''.join(f"{message}\n" for message in messages)
+    return CompletedShell(command, None, 1 if errors else 0,
+                          output.encode("utf-8", "surrogateescape"),
+                          stderr.encode("utf-8", "surrogateescape"),
+                          stats, errors)
+
+
+def _get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _preserve_metadata(path: str, st: os.stat_result):
+    follow_symlinks = not stat.S_ISLNK(st.st_mode)
+    try:
+        os.chown(path, st.st_uid, st.st_gid, follow_symlinks=follow_symlinks)
+    except PermissionError:
+        pass  # Only root can give files away (cp -p ignores it too)
+    if follow_symlinks:
+        os.chmod(path, stat.S_IMODE(st.st_mode))
+    if follow_symlinks or os.utime in os.supports_follow_symlinks:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns),
+                 follow_symlinks=follow_symlinks)
+
+
+def _copy_xattrs(source: str, destination: str, follow_symlinks: bool):
+    # Extended attributes (quietly skipped where they aren't supported)
+    if not hasattr(os, "listxattr"):
+        return
+    try:
+        for name in os.listxattr(source, follow_symlinks=follow_symlinks):
+            value = os.getxattr(source, name, follow_symlinks=follow_symlinks)
+            os.setxattr(destination, name, value,
+                        follow_symlinks=follow_symlinks)
+    except OSError as error:
+        if error.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+
+
+def _copy_fd_data(source_fd: int, destination_fd: int, reflink: str):
+    # 1. Reflink (btrfs, xfs, etc.): data isn't copied at all
+    if reflink != "never" and fcntl is not None:
+        try:
+            fcntl.ioctl(destination_fd, _FICLONE, source_fd)
+            return
+        except OSError as error:
+            if reflink == "always" or error.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+    elif reflink == "always":
+        raise OSError(errno.EOPNOTSUPP, "Reflinks aren't supported")
+    # 2. copy_file_range(): in-kernel copy (can be offloaded to storage)
+    if hasattr(os, "copy_file_range"):
+        try:
+            while os.copy_file_range(source_fd, destination_fd,
+                                     _COPY_CHUNK_SIZE):
+                pass
+            return
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+    # 3. sendfile(): in-kernel copy. File offsets are used to continue
+    # from the position where previous method has stopped.
+    offset = os.lseek(source_fd, 0, os.SEEK_CUR)
+    try:
+        while True:
+            sent = os.sendfile(destination_fd, source_fd, offset,
+                               _COPY_CHUNK_SIZE)
+            if not sent:
+                return
+            offset += sent
+    except OSError as error:
+        if error.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+    # 4. Buffered copy through user space
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    buffer = bytearray(_BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        size = os.readv(source_fd, [buffer])
+        if not size:
+            return
+        written = 0
+        while written < size:
+            written += os.write(destination_fd, view[written:size])
+
+
+def _copy_data(source: str, destination: str, st: os.stat_result,
+               force: bool, reflink: str, exclusive=False):
+    source_fd = os.open(source, os.O_RDONLY)
+    try:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if exclusive:
+            flags |= os.O_EXCL
+        mode = stat.S_IMODE(st.st_mode) & 0o777
+        try:
+            destination_fd = os.open(destination, flags, mode)
+        except OSError:
+            if not force or not os.path.lexists(destination):
+                raise
+            os.unlink(destination)
+            destination_fd = os.open(destination, flags, mode)
+        try:
+            _copy_fd_data(source_fd, destination_fd, reflink)
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+
+
+def copy(sources: List[str],
+         destination: str,
+         args: Dict[str, Union[str, None]],
+         jobs: int,
+         command: str) -> CompletedShell:
+    """
+    Copies files and directories using thread pool. Directory structure is
+    created before any file is copied. Data of every file is copied with the
+    fastest available method: reflink (FICLONE), copy_file_range(),
+    sendfile() or buffered copy (in that order). With -a (or
+    --preserve=links/xattr/all) hardlinked sources are hardlinked in
+    destination too (after the pool is done) and extended attributes are
+    copied.
+
+    Parameters:
+        sources (List[str]): files and/or directories that need to be copied.
+        destination (str): destination directory (or file) path.
+        args (Dict[str, str | None]): arguments returned by parse_args().
+        jobs (int): amount of threads that copy files.
+        command (str): equivalent shell command.
+
+    Returns:
+        CompletedShell: result with "files", "bytes" and "bytes_per_second"
+        stats and per-path errors.
+
+    Raises:
+        ValueError: invalid value of --reflink or --preserve.
+    """
+    reflink = args.get("reflink", "auto")
+    if "reflink" in args and reflink is None:
+        reflink = "always"  # Same as cp --reflink
+    if reflink not in ("always", "auto", "never"):
+        raise ValueError(
+            "Invalid value of --reflink. Valid values are: auto, always, "
+            "never.")
+    # mode, ownership and timestamps are always preserved together
+    attributes = set((args.get("preserve") or "mode").split(','))
+    if not attributes <= _PRESERVE_ATTRIBUTES:
+        raise ValueError(
+            "Invalid value of --preserve. Valid values are: mode, ownership, "
+            "timestamps, links, xattr, all.")
+    start_time = monotonic()
+    archive = "archive" in args
+    recursive = archive or "recursive" in args
+    preserve = archive or "preserve" in args
+    preserve_links = archive or bool(attributes & {"all", "links"})
+    preserve_xattr = archive or bool(attributes & {"all", "xattr"})
+    no_clobber = "no-clobber" in args
+    force = "force" in args
+    # cp -R doesn't dereference symlinks by default
+    dereference = "dereference" in args or (
+        not recursive and "no-dereference" not in args)
+    dereference_top = dereference or "dereference-command-line" in args
+    umask = _get_umask()
+    errors = []
+    messages = []
+
+    def fail(message: str, path: str, error: OSError):
+        errors.append((path, error))
+        messages.append(f"cp: {message}: {error.strerror}")
+
+    destination_is_dir = os.path.isdir(destination)
+    dirs = []  # (source, destination, stat, is new)
+    files = []  # (source, destination, stat)
+    if len(sources) > 1 and not destination_is_dir:
+        error = NotADirectoryError(20, "Not a directory", destination)
+        fail(f"target '{destination}'", destination, error)
+        sources = []
+    for source in sources:
+        target = destination
+        if destination_is_dir:
+            name = os.path.basename(os.path.normpath(source))
+            target = os.path.join(destination, name)
+        try:
+            st = os.stat(source) if dereference_top else os.lstat(source)
+        except OSError as error:
+            fail(f"cannot stat '{source}'", source, error)
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            files.append((source, target, st))
+            continue
+        if not recursive:
+            errors.append((source, IsADirectoryError(
+                21, "Is a directory", source)))
+            messages.append(
+                f"cp: -r not specified; omitting directory '{source}'")
+            continue
+        real_source = os.path.realpath(source)
+        real_target = os.path.realpath(target)
+        if (real_target + '/').startswith(real_source + '/'):
+            errors.append((source, OSError(
+                22, "Invalid argument", source)))
+            messages.append(f"cp: cannot copy a directory, '{source}', "
+                            f"into itself, '{target}'")
+            continue
+        stack = [(source, target, st)]
+        while stack:
+            source_dir, target_dir, dir_st = stack.pop()
+            try:
+                is_new = not os.path.isdir(target_dir)
+                if is_new:
+                    os.mkdir(target_dir, 0o700)  # Final mode is set later
+            except OSError as error:
+                fail(f"cannot create directory '{target_dir}'",
+                     target_dir, error)
+                continue
+            dirs.append((source_dir, target_dir, dir_st, is_new))
+            try:
+                with os.scandir(source_dir) as entries:
+                    for entry in entries:
+                        entry_target = os.path.join(target_dir, entry.name)
+                        try:
+                            entry_st = entry.stat(follow_symlinks=dereference)
+                        except OSError as error:
+                            fail(f"cannot stat '{entry.path}'",
+                                 entry.path, error)
+                            continue
+                        if stat.S_ISDIR(entry_st.st_mode):
+                            stack.append((entry.path, entry_target, entry_st))
+                        else:
+                            files.append((entry.path, entry_target, entry_st))
+            except OSError as error:
+                fail(f"cannot access '{source_dir}'", source_dir, error)
+
+    def copy_file(source: str, target: str, st: os.stat_result):
+        # Returns amount of copied bytes, None if skipped or -1 on error
+        try:
+            try:
+                target_st = (os.lstat(target) if stat.S_ISLNK(st.st_mode)
+                             else os.stat(target))
+            except FileNotFoundError:
+                target_st = None
+            if target_st is not None and os.path.samestat(st, target_st):
+                errors.append((source, OSError(
+                    errno.EINVAL, "Invalid argument", source)))
+                messages.append(
+                    f"cp: '{source}' and '{target}' are the same file")
+                return -1
+            if no_clobber and os.path.lexists(target):
+                return None
+            if stat.S_ISLNK(st.st_mode):
+                link = os.readlink(source)
+                if os.path.lexists(target):
+                    os.unlink(target)
+                os.symlink(link, target)
+            elif stat.S_ISREG(st.st_mode):
+                _copy_data(source, target, st, force, reflink)
+            else:
+                if os.path.lexists(target):
+                    os.unlink(target)
+                os.mknod(target, st.st_mode, st.st_rdev)
+            if preserve_xattr:
+                _copy_xattrs(source, target, not stat.S_ISLNK(st.st_mode))
+            if preserve:
+                _preserve_metadata(target, st)
+            return st.st_size if stat.S_ISREG(st.st_mode) else 0
+        except OSError as error:
+            fail(f"cannot copy '{source}' to '{target}'", source, error)
+            return -1
+
+    def link_file(source: str, target: str, first_target: str):
+        # Same as copy_file() for other names of an already copied file
+        try:
+            if os.path.lexists(target):
+                if os.path.samestat(os.lstat(first_target),
+                                    os.lstat(target)):
+                    return 0
+                if no_clobber:
+                    return None
+                os.unlink(target)
+            os.link(first_target, target, follow_symlinks=False)
+            return 0
+        except OSError as error:
+            fail(f"cannot create hard link '{target}' to '{first_target}'",
+                 source, error)
+            return -1
+
+    links = []  # (source, target, first target)
+    if preserve_links:
+        first_targets = {}
+        unique_files = []
+        for source, target, st in files:
+            if st.st_nlink > 1:
+                first_target = first_targets.setdefault(
+                    (st.st_dev, st.st_ino), target)
+                if first_target != target:
+                    links.append((source, target, first_target))
+                    continue
+            unique_files.append((source, target, st))
+        files = unique_files
+    with ThreadPoolExecutor(jobs) as executor:
+        sizes = list(executor.map(lambda file: copy_file(*file), files))
+    sizes.extend(link_file(*link) for link in links)
+    for source_dir, target_dir, dir_st, is_new in reversed(dirs):
+        try:
+            if preserve_xattr:
+                _copy_xattrs(source_dir, target_dir, True)
+            if preserve:
+                _preserve_metadata(target_dir, dir_st)
+            elif is_new:
+                os.chmod(target_dir, stat.S_IMODE(dir_st.st_mode) & ~umask)
+        except OSError as error:
+            fail(f"cannot set permissions of '{target_dir}'",
+                 target_dir, error)
+
+    elapsed = monotonic() - start_time
+    copied = sum(size for size in sizes if size is not None and size > 0)
+    stats = {
+        "elapsed": elapsed,
+        "files": sum(1 for size in sizes if size is not None and size >= 0),
+        "bytes": copied,
+        "bytes_per_second": copied / elapsed if elapsed else 0.0,
+    }
+    return _result(command, messages, errors, stats)
+
+
+def _remove(path: str):
+    st = os.lstat(path)
+    if stat.S_ISDIR(st.st_mode):
+        errors = []
+        _remove_tree(path, 1, lambda message, path, error: errors.append(
+            error))
+        if errors:
+            raise errors[0]
+    else:
+        os.unlink(path)
+
+
+def _remove_subtree(parent_fd: int, name: str, path: str, fail) -> int:
+    # Iterative post-order removal, every directory is opened relative to
+    # its parent without following symlinks. Returns amount of removed paths.
+    removed = 0
+    try:
+        fd = os.open(name, _DIR_FLAGS, dir_fd=parent_fd)
+        try:
+            entries = os.scandir(fd)
+        except OSError:
+            os.close(fd)
+            raise
+    except OSError as error:
+        fail(f"cannot remove '{path}'", path, error)
+        return removed
+    stack = [(fd, entries, parent_fd, name, path)]
+    try:
+        while stack:
+            fd, entries, parent_fd, name, path = stack[-1]
+            for entry in entries:
+                entry_path = os.path.join(path, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        child_fd = os.open(entry.name, _DIR_FLAGS, dir_fd=fd)
+                        try:
+                            child_entries = os.scandir(child_fd)
+                        except OSError:
+                            os.close(child_fd)
+                            raise
+                        stack.append((child_fd, child_entries, fd,
+                                      entry.name, entry_path))
+                        break
+                    os.unlink(entry.name, dir_fd=fd)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as error:
+                    fail(f"cannot remove '{entry_path}'", entry_path, error)
+            else:
+                stack.pop()
+                entries.close()
+                os.close(fd)
+                try:
+                    os.rmdir(name, dir_fd=parent_fd)
+                    removed += 1
+                except OSError as error:
+                    fail(f"cannot remove '{path}'", path, error)
+    finally:
+        for fd, entries, *_ in stack:  # Only if an unexpected error occurred
+            entries.close()
+            os.close(fd)
+    return removed
+
+
+def _remove_tree(path: str, jobs: int, fail) -> int:
+    # Top levels of the tree are removed by this thread until there are
+    # enough subtrees for all jobs. Subtrees are removed by a thread pool
+    # and then empty top-level directories are removed (deepest first).
+    parent_path, name = os.path.split(os.path.normpath(path))
+    # Symlinks are followed only in the parent path (like rm -r does)
+    root_parent_fd = os.open(parent_path or '.', os.O_RDONLY | os.O_DIRECTORY)
+    removed = 0
+    top_dirs = []  # (parent fd, name, path, fd)
+    subtrees = [(root_parent_fd, name, path)]
+    try:
+        for depth in range(_REMOVE_SPLIT_DEPTH):
+            if len(subtrees) >= jobs * 4:
+                break
+            next_subtrees = []
+            for parent_fd, name, dir_path in subtrees:
+                try:
+                    fd = os.open(name, _DIR_FLAGS, dir_fd=parent_fd)
+                except OSError as error:
+                    fail(f"cannot remove '{dir_path}'", dir_path, error)
+                    continue
+                top_dirs.append((parent_fd, name, dir_path, fd))
+                try:
+                    with os.scandir(fd) as entries:
+                        for entry in entries:
+                            entry_path = os.path.join(dir_path, entry.name)
+                            if entry.is_dir(follow_symlinks=False):
+                                next_subtrees.append(
+                                    (fd, entry.name, entry_path))
+                                continue
+                            try:
+                                os.unlink(entry.name, dir_fd=fd)
+                                removed += 1
+                            except FileNotFoundError:
+                                pass
+                            except OSError as error:
+                                fail(f"cannot remove '{entry_path}'",
+                                     entry_path, error)
+                except OSError as error:
+                    fail(f"cannot remove '{dir_path}'", dir_path, error)
+            subtrees = next_subtrees
+        with ThreadPoolExecutor(jobs) as executor:
+            removed += sum(executor.map(
+                lambda subtree: _remove_subtree(*subtree, fail), subtrees))
+    finally:
+        for parent_fd, name, dir_path, fd in reversed(top_dirs):
+            os.close(fd)
+            try:
+                os.rmdir(name, dir_fd=parent_fd)
+                removed += 1
+            except OSError as error:
+                fail(f"cannot remove '{dir_path}'", dir_path, error)
+        os.close(root_parent_fd)
+    return removed
+
+
+def remove(paths: List[str],
+           args: Dict[str, Union[str, None]],
+           jobs: int,
+           command: str) -> CompletedShell:
+    """
+    Removes files and directories. Directory trees are removed relative to
+    opened directories (symlinks are never followed) by a thread pool, each
+    thread removes its own subtrees.
+
+    Parameters:
+        paths (List[str]): files and/or directories that need to be removed.
+        args (Dict[str, str | None]): arguments returned by parse_args().
+        jobs (int): amount of threads that remove subtrees.
+        command (str): equivalent shell command.
+
+    Returns:
+        CompletedShell: result with "removed" stat and per-path errors.
+    """
+    start_time = monotonic()
+    recursive = "recursive" in args
+    force = "force" in args
+    preserve_root = "no-preserve-root" not in args
+    root_st = os.lstat('/')
+    errors = []
+    messages = []
+    removed = 0
+
+    def fail(message: str, path: str, error: OSError):
+        errors.append((path, error))
+        messages.append(f"rm: {message}: {error.strerror}")
+
+    for path in paths:
+        if os.path.basename(path.rstrip('/')) in ('.', ".."):
+            errors.append((path, OSError(errno.EINVAL, "Invalid argument",
+                                         path)))
+            messages.append("rm: refusing to remove '.' or '..' directory: "
+                            f"skipping '{path}'")
+            continue
+        try:
+            st = os.lstat(path)
+        except OSError as error:
+            if not force or not isinstance(error, FileNotFoundError):
+                fail(f"cannot remove '{path}'", path, error)
+            continue
+        try:
+            if not stat.S_ISDIR(st.st_mode):
+                os.unlink(path)
+                removed += 1
+            elif recursive:
+                if preserve_root and os.path.samestat(st, root_st):
+                    errors.append((path, PermissionError(
+                        errno.EPERM, "Operation not permitted", path)))
+                    messages.append(
+                        f"rm: it is dangerous to operate recursively on "
+                        f"'{path}'\nrm: use --no-preserve-root to override "
+                        f"this failsafe")
+                    continue
+                removed += _remove_tree(path, jobs, fail)
+            elif "dir" in args:
+                os.rmdir(path)
+                removed += 1
+            else:
+                fail(f"cannot remove '{path}'", path,
+                     IsADirectoryError(errno.EISDIR, "Is a directory", path))
+        except OSError as error:
+            fail(f"cannot remove '{path}'", path, error)
+    stats = {"elapsed": monotonic() - start_time, "removed": removed}
+    return _result(command, messages, errors, stats)
+
+
+def move(sources: List[str],
+         destination: str,
+         args: Dict[str, Union[str, None]],
+         command: str) -> CompletedShell:
+    """
+    Moves (renames) files and directories. Paths are renamed relative to
+    opened parent directories, so every move on the same filesystem is a
+    single rename(). Paths on other filesystems are copied (data is copied
+    in the kernel when possible) and then removed.
+
+    Parameters:
+        sources (List[str]): files and/or directories that need to be moved.
+        destination (str): destination directory (or new path).
+        args (Dict[str, str | None]): arguments returned by parse_args().
+        command (str): equivalent shell command.
+
+    Returns:
+        CompletedShell: result with "moved" and "copied" (moved across
+        filesystems) stats and per-path errors.
+    """
+    start_time = monotonic()
+    no_clobber = "no-clobber" in args and "force" not in args
+    backup = "backup" in args and args["backup"] not in ("none", "off")
+    suffix = args.get("suffix") or os.environ.get(
+        "SIMPLE_BACKUP_SUFFIX", '~')
+    errors = []
+    messages = []
+    moved = copied = 0
+    dir_fds = {}
+
+    def fail(message: str, path: str, error: OSError):
+        errors.append((path, error))
+        messages.append(f"mv: {message}: {error.strerror}")
+
+    def refuse(path: str, message: str):
+        errors.append((path, OSError(errno.EINVAL, "Invalid argument", path)))
+        messages.append(f"mv: {message}")
+
+    def get_dir_fd(path: str) -> int:
+        if path not in dir_fds:
+            dir_fds[path] = os.open(path or '.', os.O_RDONLY | os.O_DIRECTORY)
+        return dir_fds[path]
+
+    destination_is_dir = os.path.isdir(destination)
+    if len(sources) > 1 and not destination_is_dir:
+        error = NotADirectoryError(20, "Not a directory", destination)
+        fail(f"target '{destination}'", destination, error)
+        sources = []
+    try:
+        for source in sources:
+            source_dir, name = os.path.split(os.path.normpath(source))
+            if destination_is_dir:
+                target = os.path.join(destination, name)
+                target_dir, target_name = destination, name
+            else:
+                target = destination
+                target_dir, target_name = os.path.split(
+                    os.path.normpath(destination))
+            try:
+                source_fd = get_dir_fd(source_dir)
+                target_fd = get_dir_fd(target_dir)
+                source_st = os.lstat(name, dir_fd=source_fd)
+                try:
+                    target_st = os.lstat(target_name, dir_fd=target_fd)
+                except FileNotFoundError:
+                    target_st = None
+                if target_st is not None and os.path.samestat(source_st,
+                                                              target_st):
+                    refuse(source, f"'{source}' and '{target}' are the "
+                                   f"same file")
+                    continue
+                if target_st is not None and no_clobber:
+                    continue
+                if target_st is not None and backup:
+                    try:
+                        backup_st = os.lstat(target_name + suffix,
+                                             dir_fd=target_fd)
+                    except FileNotFoundError:
+                        backup_st = None
+                    if backup_st is not None and os.path.samestat(
+                            source_st, backup_st):
+                        refuse(source, f"backing up '{target}' might destroy "
+                                       f"source;  '{source}' not moved")
+                        continue
+                    os.rename(target_name, target_name + suffix,
+                              src_dir_fd=target_fd, dst_dir_fd=target_fd)
+                os.rename(name, target_name,
+                          src_dir_fd=source_fd, dst_dir_fd=target_fd)
+                moved += 1
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    fail(f"cannot move '{source}' to '{target}'",
+                         source, error)
+                    continue
+                # Different filesystems: copy and then remove source
+                try:
+                    if (os.path.isdir(target) and
+                            not os.path.islink(target)):
+                        os.rmdir(target)  # Only empty directory is replaced
+                    elif os.path.lexists(target):
+                        os.unlink(target)
+                except OSError as error:
+                    fail(f"cannot overwrite '{target}'", target, error)
+                    continue
+                result = copy([source], target, {"archive": None},
+                              os.cpu_count() or 1, command)
+                if result.errors:
+                    errors.extend(result.errors)
+                    messages.extend(line.replace("cp: ", "mv: ", 1)
+                                    for line in result.get_lines(stderr=True))
+                    continue
+                try:
+                    _remove(source)
+                except OSError as error:
+                    fail(f"cannot remove '{source}'", source, error)
+                    continue
+                copied += 1
+                moved += 1
+    finally:
+        for fd in dir_fds.values():
+            os.close(fd)
+    stats = {"elapsed": monotonic() - start_time,
+             "moved": moved,
+             "copied": copied}
+    return _result(command, messages, errors, stats)
+
+
+def _entry_type(entry: os.DirEntry) -> str:
+    # Type letter of find -type (d_type is used when possible, not lstat())
+    if entry.is_symlink():
+        return 'l'
+    if entry.is_dir(follow_symlinks=False):
+        return 'd'
+    if entry.is_file(follow_symlinks=False):
+        return 'f'
+    mode = entry.stat(follow_symlinks=False).st_mode
+    return _FILE_TYPES.get(stat.S_IFMT(mode), '')
+
+
+def find(paths: List[Tuple[str, str]],
+         name: Union[str, None],
+         types: Union[str, None],
+         newer: Union[int, None],
+         size: Union[Tuple[str, int, int], None],
+         maxdepth: Union[int, None],
+         prune: List[str],
+         jobs: int) -> Iterator[str]:
+    """
+    Lazily finds entries like find -P does. Predicates are evaluated during
+    os.scandir() traversal (lstat() is called only if needed), directories
+    are scanned in batches by a thread pool (at most jobs * 2 batches ahead
+    of the consumer). Order of entries is directory order, but directories
+    can be listed in a different order than find lists them.
+
+    Parameters:
+        paths (List[Tuple[str, str]]): starting points (path and path which
+            is used in results).
+        name (str | None): glob pattern of base names (-name).
+        types (str | None): type letters (-type).
+        newer (int | None): modification time (ns) that needs to be exceeded
+            (-newer).
+        size (Tuple[str, int, int] | None): sign ('+', '-' or ''), amount of
+            units and unit size in bytes (-size). Sizes are rounded up.
+        maxdepth (int | None): maximum depth of entries (-maxdepth).
+        prune (List[str]): glob patterns of base names of entries which are
+            skipped with their content (-prune).
+        jobs (int): amount of threads that scan directories.
+
+    Returns:
+        Iterator[str]: found paths.
+    """
+    name_match = re.compile(translate(name)).match if name else None
+    prune_matches = [re.compile(translate(pattern)).match
+                     for pattern in prune]
+
+    has_tests = types is not None or newer is not None or size is not None
+
+    def is_pruned(entry_name: str) -> bool:
+        return any(match(entry_name) for match in prune_matches)
+
+    def is_match(entry_name: str, get_type: Callable[[], str],
+                 get_stat: Callable[[], os.stat_result]) -> bool:
+        if name_match is not None and name_match(entry_name) is None:
+            return False
+        if not has_tests:
+            return True
+        if types is not None and get_type() not in types:
+            return False
+        if newer is not None and get_stat().st_mtime_ns <= newer:
+            return False
+        if size is not None:
+            sign, amount, unit = size
+            units = -(-get_stat().st_size // unit)
+            if sign == '+':
+                return units > amount
+            if sign == '-':
+                return units < amount
+            return units == amount
+        return True
+
+    def scan(directory: Tuple[str, str, int]) -> tuple:
+        # Scans the directory and then its subdirectories (depth first)
+        # until _FIND_BATCH_SIZE entries are seen, so small directories don't
+        # cost a task each. Returns found paths and not scanned directories.
+        found = []
+        stack = [directory]
+        seen = 0
+        while stack and seen < _FIND_BATCH_SIZE:
+            dir_path, prefix, depth = stack.pop()
+            subdirs = []
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        seen += 1
+                        try:
+                            if prune_matches and is_pruned(entry.name):
+                                continue
+                            if is_match(entry.name,
+                                        lambda: _entry_type(entry),
+                                        lambda: entry.stat(
+                                            follow_symlinks=False)):
+                                found.append(prefix + entry.name)
+                            if ((maxdepth is None or depth < maxdepth) and
+                                    entry.is_dir(follow_symlinks=False)):
+                                subdirs.append((entry.path,
+                                                prefix + entry.name + '/',
+                                                depth + 1))
+                        except OSError:
+                            pass  # Entry has been removed
+            except OSError:
+                pass  # Inaccessible directory
+            stack.extend(reversed(subdirs))
+        return found, stack
+
+    pending = []  # (path, prefix of results, depth of entries)
+    running = deque()
+    with ThreadPoolExecutor(jobs) as executor:
+        try:
+            for path, result in paths:
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                start_name = os.path.basename(path.rstrip('/')) or path
+                if prune_matches and is_pruned(start_name):
+                    continue
+                if is_match(start_name,
+                            lambda: _FILE_TYPES.get(
+                                stat.S_IFMT(st.st_mode), ''),
+                            lambda: st):
+                    yield result
+                if (stat.S_ISDIR(st.st_mode) and
+                        (maxdepth is None or maxdepth > 0)):
+                    prefix = result if result.endswith('/') else result + '/'
+                    pending.append((path, prefix, 1))
+                while pending or running:
+                    while pending and len(running) < jobs * 2:
+                        running.append(executor.submit(scan, pending.pop()))
+                    found, subdirs = running.popleft().result()
+                    pending.extend(subdirs)
+                    yield from found
+        finally:
+            for future in running:
+                future.cancel()
+
+
+def _digest(path: str) -> bytes:
+    digest = hashlib.blake2b()
+    buffer = bytearray(_BUFFER_SIZE)
+    view = memoryview(buffer)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        while True:
+            size = os.readv(fd, [buffer])
+            if not size:
+                return digest.digest()
+            digest.update(view[:size])
+    finally:
+        os.close(fd)
+
+
+def _scan_tree(root: str, fail) -> Tuple[Dict[str, os.stat_result], bool]:
+    # Returns lstat() results of all entries of the tree by their paths
+    # relative to root (missing root is empty) and False if any directory
+    # couldn't be read (i.e. the result is incomplete).
+    entries = {}
+    complete = True
+    pending = ['']
+    while pending:
+        prefix = pending.pop()
+        dir_path = os.path.join(root, prefix)
+        try:
+            with os.scandir(dir_path) as dir_entries:
+                for entry in dir_entries:
+                    path = prefix + entry.name
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue  # Entry has been removed
+                    entries[path] = st
+                    if stat.S_ISDIR(st.st_mode):
+                        pending.append(path + '/')
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            complete = False
+            fail(f"cannot access '{dir_path}'", dir_path, error)
+    return entries, complete
+
+
+def sync(source: str,
+         destination: str,
+         delete: bool,
+         checksum: bool,
+         dry_run: bool,
+         jobs: int,
+         command: str) -> CompletedShell:
+    """
+    Synchronizes destination directory with source directory (like rsync -a
+    for local paths). Both trees are scanned concurrently, entries are
+    compared by type, size and modification time (or by content hash) and
+    only changed files are copied by a thread pool with the fastest
+    available method (see copy()) to temporary files which then replace old
+    ones. Metadata is preserved, therefore next synchronization skips copied
+    files.
+
+    Parameters:
+        source (str): source directory.
+        destination (str): destination directory (created if missing).
+        delete (bool): remove entries of destination that don't exist in
+            source (skipped if some source directory couldn't be read).
+        checksum (bool): compare files of the same size by their content
+            hashes (computed by a thread pool) instead of modification time.
+        dry_run (bool): only plan actions, destination isn't changed.
+        jobs (int): amount of threads that compare and copy files.
+        command (str): description of the call (no equivalent command is
+            executed).
+
+    Returns:
+        CompletedShell: result with the plan in stdout (action and path
+        relative to destination per line; actions are "delete", "mkdir",
+        "copy" and "update" (metadata only)), "copied", "bytes", "created",
+        "updated", "deleted" and "unchanged" stats and per-path errors.
+    """
+    start_time = monotonic()
+    errors = []
+    messages = []
+
+    def fail(message: str, path: str, error: OSError):
+        errors.append((path, error))
+        messages.append(f"sync: {message}: {error.strerror}")
+
+    def compare(path: str) -> Union[str, None]:
+        # Returns needed action ("replace" if type differs) or None
+        st = source_entries[path]
+        target_st = destination_entries.get(path)
+        if target_st is None:
+            return "mkdir" if stat.S_ISDIR(st.st_mode) else "copy"
+        if stat.S_IFMT(st.st_mode) != stat.S_IFMT(target_st.st_mode):
+            return "replace"
+        source_path = os.path.join(source, path)
+        target_path = os.path.join(destination, path)
+        try:
+            if stat.S_ISREG(st.st_mode):
+                if st.st_size != target_st.st_size:
+                    return "copy"
+                if checksum:
+                    if _digest(source_path) != _digest(target_path):
+                        return "copy"
+                elif int(st.st_mtime) != int(target_st.st_mtime):
+                    return "copy"
+            elif stat.S_ISLNK(st.st_mode):
+                if os.readlink(source_path) != os.readlink(target_path):
+                    return "copy"
+                return None  # Metadata of symlinks isn't compared
+            elif (not stat.S_ISDIR(st.st_mode) and
+                    st.st_rdev != target_st.st_rdev):
+                return "copy"
+        except OSError as error:
+            fail(f"cannot compare '{source_path}' and '{target_path}'",
+                 source_path, error)
+            return None
+        if (stat.S_IMODE(st.st_mode) != stat.S_IMODE(target_st.st_mode) or
+                int(st.st_mtime) != int(target_st.st_mtime)):
+            return "update"
+        return None
+
+    def has_parent_in(path: str, paths: set) -> bool:
+        index = path.rfind('/')
+        while index != -1:
+            if path[:index] in paths:
+                return True
+            index = path.rfind('/', 0, index)
+        return False
+
+    def copy_entry(path: str) -> int:
+        # Returns amount of copied bytes or -1 on error
+        st = source_entries[path]
+        source_path = os.path.join(source, path)
+        target_path = os.path.join(destination, path)
+        try:
+            if stat.S_ISREG(st.st_mode):
+                # Like rsync: the file is written next to the old one and
+                # then replaces it, so hardlinks of the old one are intact
+                head, tail = os.path.split(target_path)
+                temp_path = os.path.join(head,
+                                         f".{tail}.{os.urandom(4).hex()}")
+                try:
+                    _copy_data(source_path, temp_path, st, False, "auto",
+                               True)
+                    _preserve_metadata(temp_path, st)
+                    os.replace(temp_path, target_path)
+                except BaseException:
+                    try:
+                        os.unlink(temp_path)
+                    except OSError:
+                        pass
+                    raise
+                return st.st_size
+            if os.path.lexists(target_path):
+                os.unlink(target_path)
+            if stat.S_ISLNK(st.st_mode):
+                os.symlink(os.readlink(source_path), target_path)
+            else:
+                os.mknod(target_path, st.st_mode, st.st_rdev)
+            _preserve_metadata(target_path, st)
+            return 0
+        except OSError as error:
+            fail(f"cannot copy '{source_path}' to '{target_path}'",
+                 source_path, error)
+            return -1
+
+    with ThreadPoolExecutor(jobs) as executor:
+        source_scan = executor.submit(_scan_tree, source, fail)
+        destination_scan = executor.submit(_scan_tree, destination, fail)
+        source_entries, source_complete = source_scan.result()
+        destination_entries = destination_scan.result()[0]
+        paths = sorted(source_entries)  # Parents are before their children
+        if checksum:
+            actions = list(executor.map(compare, paths))
+        else:
+            actions = list(map(compare, paths))
+
+        replaced = [path for path, action in zip(paths, actions)
+                    if action == "replace"]
+        extraneous = []
+        if delete and source_complete:
+            extraneous = [path for path in destination_entries
+                          if path not in source_entries]
+        elif delete:
+            messages.append(
+                "sync: IO error encountered -- skipping file deletion")
+        candidates = set(replaced).union(extraneous)
+        removals = sorted(path for path in candidates
+                          if not has_parent_in(path, candidates))
+        removals_set = set(removals)
+        deleted = sum(1 for path in destination_entries
+                      if path in removals_set or
+                      has_parent_in(path, removals_set))
+        mkdirs = []
+        copies = []
+        updates = []
+        for path, action in zip(paths, actions):
+            if action == "replace":
+                is_dir = stat.S_ISDIR(source_entries[path].st_mode)
+                action = "mkdir" if is_dir else "copy"
+            if action == "mkdir":
+                mkdirs.append(path)
+            elif action == "copy":
+                copies.append(path)
+            elif action == "update":
+                updates.append(path)
+        plan = [f"delete {path}" for path in removals]
+        plan.extend(f"mkdir {path}" for path in mkdirs)
+        plan.extend(f"copy {path}" for path in copies)
+        plan.extend(f"update {path}" for path in updates)
+        output = ''.join(f"{line}\n" for line in plan)
+
+        if dry_run:
+            stats = {
+                "elapsed": monotonic() - start_time,
+                "copied": len(copies),
+                "bytes": sum(source_entries[path].st_size
+                             for path in copies
+                             if stat.S_ISREG(source_entries[path].st_mode)),
+                "created": len(mkdirs),
+                "updated": len(updates),
+                "deleted": deleted,
+                "unchanged": actions.count(None),
+            }
+            return _result(command, messages, errors, stats, output)
+
+        try:
+            os.makedirs(destination, exist_ok=True)
+        except OSError as error:
+            fail(f"cannot create directory '{destination}'",
+                 destination, error)
+            return _result(command, messages, errors,
+                           {"elapsed": monotonic() - start_time}, output)
+        deleted = 0
+        for path in removals:
+            target_path = os.path.join(destination, path)
+            try:
+                if stat.S_ISDIR(destination_entries[path].st_mode):
+                    deleted += _remove_tree(target_path, jobs, fail)
+                else:
+                    os.unlink(target_path)
+                    deleted += 1
+            except OSError as error:
+                fail(f"cannot remove '{target_path}'", target_path, error)
+        created = 0
+        for path in mkdirs:
+            target_path = os.path.join(destination, path)
+            try:
+                os.mkdir(target_path, 0o700)  # Final mode is set later
+                created += 1
+            except OSError as error:
+                fail(f"cannot create directory '{target_path}'",
+                     target_path, error)
+        sizes = list(executor.map(copy_entry, copies))
+
+    updated = 0
+    for path in updates:
+        target_path = os.path.join(destination, path)
+        try:
+            _preserve_metadata(target_path, source_entries[path])
+            updated += 1
+        except OSError as error:
+            fail(f"cannot set attributes of '{target_path}'",
+                 target_path, error)
+    # Metadata of changed directories and parents of changed entries is set
+    # last (deepest first), otherwise their modification time is lost.
+    changed_dirs = {''}
+    for path in removals + mkdirs + copies:
+        index = path.rfind('/')
+        while index != -1:
+            changed_dirs.add(path[:index])
+            index = path.rfind('/', 0, index)
+    changed_dirs.update(mkdirs)
+    for path in sorted(changed_dirs, reverse=True):
+        target_path = os.path.join(destination, path)
+        try:
+            st = source_entries[path] if path else os.stat(source)
+            _preserve_metadata(target_path, st)
+        except OSError as error:
+            fail(f"cannot set attributes of '{target_path}'",
+                 target_path, error)
+
+    copied = sum(size for size in sizes if size > 0)
+    stats = {
+        "elapsed": monotonic() - start_time,
+        "copied": sum(1 for size in sizes if size >= 0),
+        "bytes": copied,
+        "created": created,
+        "updated": updated,
+        "deleted": deleted,
+        "unchanged": actions.count(None),
+    }
+    return _result(command, messages, errors, stats, output)
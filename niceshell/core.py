@@ -1,12 +1,736 @@
-from inspect import cleandoc
+import json
+import mmap
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+from array import array
+from codecs import getincrementaldecoder
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed as _futures_as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from inspect import cleandoc, signature
+from io import TextIOBase
+from logging import Logger
 from os import close, pipe, write
-from subprocess import PIPE, Popen
-from typing import Iterable, List, Tuple, Union
+from selectors import EVENT_READ, DefaultSelector
+from subprocess import DEVNULL, PIPE, Popen, SubprocessError, TimeoutExpired
+from threading import (Condition, RLock, Thread, current_thread, local,
+                       main_thread)
+from time import monotonic, sleep
+from typing import Iterable, Iterator, List, Mapping, Tuple, Union
 
 import regex as re
 
-__all__ = ["expose_tilde", "normalize_short_and_long_args", "quotes_wrapper",
-           "shell", "Shell", "ShortArgsOption"]
+from . import _fork_server_helper
+
+_thread_state = local()  # cwd: working directory of the thread (or None)
+
+# Positional parameters of Popen._execute_child() which are overridden by
+# _ForkServerProcess (newer Pythons only append parameters)
+_EXECUTE_CHILD_PARAMETERS = (
+    "self", "args", "executable", "preexec_fn", "close_fds", "pass_fds",
+    "cwd", "env", "startupinfo", "creationflags", "shell", "p2cread",
+    "p2cwrite", "c2pread", "c2pwrite", "errread", "errwrite")
+_FORK_SERVER_REPLY = struct.Struct("!cii")
+_fork_server = None
+
+# Commands that change something (their results must never be cached)
+_MUTATING_COMMANDS = {"chgrp", "chmod", "chown", "cp", "dd", "install", "kill",
+                      "ln", "mkdir", "mkfifo", "mknod", "mv", "rm", "rmdir",
+                      "shred", "sudo", "tee", "touch", "truncate"}
+
+__all__ = ["as_completed", "cached_shell", "CommandCache", "CompletedShell",
+           "expand_wildcards", "expose_tilde", "ForkServer", "get_fork_server",
+           "get_working_directory", "normalize_short_and_long_args",
+           "parallel_map", "parallel_pipe", "Pipeline", "quotes_wrapper",
+           "shell", "Shell", "shell_quote_many", "ShortArgsOption",
+           "start_fork_server", "stop_fork_server", "wait_all", "wait_any",
+           "working_directory"]
+
+
+def _check_shells(shells, timeout) -> list:
+    if isinstance(shells, str) or not isinstance(shells, Iterable):
+        raise TypeError("shells' type must be Iterable[Shell].")
+    shells = list(dict.fromkeys(shells))  # Without duplicates
+    if not all(hasattr(e, "poll") and hasattr(e, "pid") for e in shells):
+        raise TypeError("shells' type must be Iterable[Shell].")
+    if timeout is not None:
+        if type(timeout) not in (int, float):
+            raise TypeError("timeout's type must be int, float or None.")
+        if timeout < 0:
+            raise ValueError("timeout can't be negative.")
+    return shells
+
+
+def _completed_epoll(pidfds: dict, deadline: Union[float, None]):
+    # Yields shells as their pidfds become readable (processes exit)
+    epoll = select.epoll()
+    try:
+        for fd in pidfds:
+            epoll.register(fd, select.EPOLLIN)
+        while pidfds:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - monotonic(), 0)
+            events = epoll.poll(timeout)
+            if not events and timeout is not None and \
+                    monotonic() >= deadline:
+                return
+            for fd, _ in events:
+                shell = pidfds.pop(fd)
+                epoll.unregister(fd)
+                os.close(fd)
+                shell.wait()  # Reap the process (or get its exit code)
+                yield shell
+    finally:
+        epoll.close()
+        for fd in pidfds:
+            os.close(fd)
+
+
+def _completed_polling(pending: list, deadline: Union[float, None]):
+    delay = 0.001
+    while pending:
+        done = [shell for shell in pending if shell.poll() is not None]
+        if done:
+            pending = [shell for shell in pending if shell not in done]
+            yield from done
+            delay = 0.001
+            continue
+        if deadline is not None and monotonic() >= deadline:
+            return
+        if deadline is not None:
+            delay = min(delay, max(deadline - monotonic(), 0))
+        sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def _completed_sigchld(pending: list, deadline: Union[float, None]):
+    # SIGCHLD handler wakes select() up through a pipe
+    read_fd, write_fd = pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+
+    def handler(signum, frame):
+        try:
+            write(write_fd, b'\0')
+        except OSError:
+            pass  # Pipe is full, select() will wake up anyway
+
+    previous_handler = signal.signal(signal.SIGCHLD, handler)
+    try:
+        while pending:
+            done = [shell for shell in pending if shell.poll() is not None]
+            if done:
+                pending = [shell for shell in pending if shell not in done]
+                yield from done
+                continue
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    return
+            if select.select([read_fd], [], [], timeout)[0]:
+                while True:
+                    try:
+                        if not os.read(read_fd, 4096):
+                            break
+                    except BlockingIOError:
+                        break
+    finally:
+        if previous_handler is None:
+            previous_handler = signal.SIG_DFL
+        signal.signal(signal.SIGCHLD, previous_handler)
+        close(read_fd)
+        close(write_fd)
+
+
+def _iter_completed(shells: list, timeout: Union[float, None]):
+    # Yields shells in order of completion until timeout
+    deadline = None if timeout is None else monotonic() + timeout
+    pending = []
+    for shell in shells:
+        if shell.poll() is not None:
+            yield shell
+        else:
+            pending.append(shell)
+    if not pending:
+        return
+    pidfds = _open_pidfds(pending)
+    if pidfds is not None:
+        yield from _completed_epoll(pidfds, deadline)
+    elif current_thread() is main_thread() and not any(
+            isinstance(getattr(shell, "process", None), _ForkServerProcess)
+            for shell in pending):  # SIGCHLD of fork server isn't received
+        yield from _completed_sigchld(pending, deadline)
+    else:  # Signal handlers can be set only in the main thread
+        yield from _completed_polling(pending, deadline)
+
+
+def _open_pidfds(shells: list) -> Union[dict, None]:
+    # Returns {pidfd: shell} or None if pidfd/epoll isn't available
+    if not hasattr(os, "pidfd_open") or not hasattr(select, "epoll"):
+        return None
+    pidfds = {}
+    try:
+        for shell in shells:
+            pidfds[os.pidfd_open(shell.pid)] = shell
+    except OSError:  # E.g., old kernel or too many open files
+        for fd in pidfds:
+            close(fd)
+        return None
+    return pidfds
+
+
+@lru_cache(maxsize=256)
+def _compile_wildcard(component: str):
+    # Returns (regex, literal name) of path component. Only unescaped '*' is
+    # a wildcard; like in sh it doesn't match leading dot of hidden entries.
+    parts = re.split(r'(\\\*|\*)', component)
+    if '*' not in parts:
+        return (None, ''.join('*' if part == '\\*' else part
+                              for part in parts))
+    pattern = ''.join('(?s:.*)' if part == '*' else re.escape(
+        '*' if part == '\\*' else part) for part in parts)
+    if not component.startswith('.'):
+        pattern = r'(?!\.)' + pattern
+    return (re.compile(pattern), None)
+
+
+def _is_command(command) -> bool:
+    return isinstance(command, str) or (
+        isinstance(command, Iterable) and
+        len(command) and
+        all(isinstance(e, str) for e in command))
+
+
+def _line_blocks(data, block_size: int) -> Iterator[Tuple[int, int]]:
+    # Yields (start, end) of blocks of bytes-like data (with find()): each
+    # block is extended to the end of its last line
+    start, size = 0, len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + block_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield (start, end)
+        start = end
+
+
+def _stream_blocks(file, block_size: int) -> Iterator[bytes]:
+    # Yields blocks of binary stream that end with the end of line (only
+    # the last block can be incomplete line)
+    rest = b''
+    while True:
+        chunk = file.read(block_size)
+        if not chunk:
+            break
+        block = rest + chunk
+        end = block.rfind(b'\n') + 1
+        if end:
+            rest = block[end:]
+            yield block[:end]
+        else:  # Line is longer than block_size
+            rest = block
+    if rest:
+        yield rest
+
+
+def _get_cwd(cwd=None) -> Union[str, None]:
+    # Returns working directory for a new process: cwd (relative to the
+    # thread's working directory) or the thread's working directory or None
+    if cwd is not None and not isinstance(cwd, str):
+        raise TypeError("cwd's type must be str or None.")
+    base = getattr(_thread_state, "cwd", None)
+    if cwd is None:
+        return base
+    if cwd == '~' or cwd.startswith("~/"):
+        cwd = os.path.expanduser('~') + cwd[1:]
+    return cwd if base is None else os.path.join(base, cwd)
+
+
+def _get_env(env=None, env_update=None) -> Union[dict, None]:
+    # Returns environment for a new process (None means os.environ)
+    if env is not None and not isinstance(env, Mapping):
+        raise TypeError("env's type must be Mapping[str, str] or None.")
+    if env_update is not None and not isinstance(env_update, Mapping):
+        raise TypeError("env_update's type must be Mapping[str, str] or None.")
+    if env is None and env_update is None:
+        return None
+    environment = dict(os.environ if env is None else env)
+    for key, value in (env_update or {}).items():
+        if value is None:
+            environment.pop(key, None)  # None unsets variable
+        else:
+            environment[key] = value
+    return environment
+
+
+def _set_thread_cwd(path: str) -> bool:
+    # Changes working directory of the thread (if it's set by
+    # working_directory()), returns False otherwise
+    if getattr(_thread_state, "cwd", None) is None:
+        return False
+    _thread_state.cwd = os.path.abspath(os.path.join(_thread_state.cwd, path))
+    return True
+
+
+def _is_cacheable(command) -> bool:
+    # Conservative: any word that is a mutating command (even an argument,
+    # e.g. "env rm" or "xargs rm") or output redirection disables caching.
+    if isinstance(command, str):
+        if '>' in re.sub(r"\d*>>?\s*/dev/null(?=\s|$)|\d*>&\d", '', command):
+            return False
+        command = re.split(r"[\s;&|()`$]+", command)
+    return _MUTATING_COMMANDS.isdisjoint(
+        word.rsplit('/', 1)[-1] for word in command)
+
+
+def _needs_shell(path: str) -> bool:
+    # Whether quotes_wrapper(path) is changed by the shell in ways other than
+    # wildcard/tilde expansion ($, ` and \ are special inside "").
+    return re.search(r'[$`]|\\(?!\*)', path) is not None
+
+
+def _split_lines(output: str, exclude_last_lf: bool) -> List[str]:
+    output = output.split('\n')
+    if exclude_last_lf and len(output) and output[-1] == '':
+        output.pop(-1)
+    return output
+
+
+def as_completed(shells, timeout=None) -> Iterator:
+    """
+    Returns iterator that yields shells as their processes finish (already
+    finished ones first). On Linux pidfds of processes are waited with
+    epoll, so any amount of processes is waited without polling; otherwise
+    SIGCHLD is used (in the main thread) or poll() with backoff.
+    Note: output of processes isn't read, so a process that fills its stdout
+    pipe won't finish (use tee mode or stdout=None for such commands).
+
+    Parameters:
+        shells (Iterable[Shell]): shells (or Popen-like objects with pid and
+            poll()) to wait for.
+        timeout (int | float | None): maximum amount of seconds to wait.
+            Default is None (no limit).
+
+    Raises:
+        TypeError: shells' type isn't Iterable[Shell].
+        TypeError: timeout's type isn't (int | float | None).
+        ValueError: timeout is negative.
+        TimeoutError: (during iteration) timeout has expired before all
+            processes finished.
+
+    Returns:
+        Iterator[Shell]: finished shells.
+    """
+    shells = _check_shells(shells, timeout)
+
+    def iterator():
+        amount = 0
+        for shell in _iter_completed(shells, timeout):
+            amount += 1
+            yield shell
+        if amount < len(shells):
+            raise TimeoutError(
+                f"{len(shells) - amount} (of {len(shells)}) processes "
+                "haven't finished.")
+    return iterator()
+
+
+def cached_shell(command, input_text=None, ttl=None, cache=None,
+                 cwd=None, env=None, env_update=None):
+    """
+    Executes command (like Shell(command, input_text).finish()) or returns
+    result of the same command that has been executed less than ttl seconds
+    ago (see CommandCache). Commands with sudo, mutating commands (cp, mv,
+    rm, etc.) and output redirections are always executed.
+
+    Parameters:
+        command (str | Iterable[str]): shell command that needs to be
+            executed.
+        input_text (str | None): input text for command. Default is None.
+        ttl (int | float | None): maximum age of cached result in seconds.
+            Default is None (ttl of the cache).
+        cache (CommandCache | None): cache of results. Default is None (shared
+            cache of the module).
+        cwd (str | None): working directory of the command (see Shell).
+            Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): changes of environment.
+            Default is None.
+
+    Raises:
+        TypeError: command's type isn't (str | Iterable[str]).
+        TypeError: invalid type of cwd, env or env_update.
+
+    Returns:
+        CompletedShell: result of the command.
+    """
+    if cache is None:
+        cache = _command_cache
+    return cache.run(command, input_text, ttl, cwd, env, env_update)
+
+
+class CommandCache:
+    """
+    LRU cache with TTL of results of idempotent read-only commands. Results
+    are keyed by command, input text, cwd and values of env_keys environment
+    variables. Commands with sudo, mutating commands and output redirections
+    are never cached. Instances are thread-safe (command itself is executed
+    without lock, so same command can be executed several times at once).
+
+    Parameters:
+        maxsize (int): maximum amount of cached results. Default is 256.
+        ttl (int | float): default maximum age of results in seconds. Default
+            is 30.
+        env_keys (Iterable[str]): environment variables that affect results.
+            Default is ("HOME", "LANG", "LC_ALL", "PATH").
+
+    Attributes:
+        hits (int): amount of results returned from the cache.
+        misses (int): amount of executed cacheable commands.
+
+    Raises:
+        TypeError: maxsize's type isn't int.
+        TypeError: ttl's type isn't (int | float).
+        ValueError: maxsize or ttl isn't positive.
+    """
+
+    def __init__(self, maxsize=256, ttl=30,
+                 env_keys=("HOME", "LANG", "LC_ALL", "PATH")):
+        if type(maxsize) != int:
+            raise TypeError("maxsize's type must be int.")
+        if type(ttl) not in (int, float):
+            raise TypeError("ttl's type must be int or float.")
+        if maxsize < 1 or ttl <= 0:
+            raise ValueError("maxsize and ttl must be positive.")
+        self.env_keys = tuple(env_keys)
+        self.hits = 0
+        self.maxsize = maxsize
+        self.misses = 0
+        self.ttl = ttl
+        self.__lock = RLock()
+        self.__results = OrderedDict()  # key: (creation time, result)
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__results)
+
+    def __get_key(self, command, input_text, cwd, env) -> tuple:
+        if not isinstance(command, str):
+            command = tuple(command)
+        cwd = os.path.abspath(os.getcwd() if cwd is None else cwd)
+        if env is None:
+            env = tuple(os.environ.get(key) for key in self.env_keys)
+        else:  # Explicit environment can affect anything
+            env = tuple(sorted(env.items()))
+        return (command, input_text, cwd, env)
+
+    def clear(self):
+        '''Removes all results and resets counters.'''
+        with self.__lock:
+            self.__results.clear()
+            self.hits = self.misses = 0
+
+    def invalidate(self, command=None):
+        """
+        Removes cached results of the command (in any cwd/environment) or all
+        results if command is None.
+
+        Parameters:
+            command (str | Iterable[str] | None): command which results must
+                be removed. Default is None (all commands).
+        """
+        with self.__lock:
+            if command is None:
+                self.__results.clear()
+                return
+            if not isinstance(command, str):
+                command = tuple(command)
+            for key in [key for key in self.__results if key[0] == command]:
+                del self.__results[key]
+
+    def run(self, command, input_text=None, ttl=None,
+            cwd=None, env=None, env_update=None) -> "CompletedShell":
+        """
+        Returns cached result of the command or executes it (see
+        cached_shell()).
+
+        Parameters:
+            command (str | Iterable[str]): shell command that needs to be
+                executed.
+            input_text (str | None): input text for command. Default is None.
+            ttl (int | float | None): maximum age of cached result in seconds.
+                Default is None (ttl of the cache).
+            cwd (str | None): working directory of the command (see Shell).
+                Default is None.
+            env (Mapping[str, str] | None): environment of the command.
+                Default is None (os.environ).
+            env_update (Mapping[str, str | None] | None): changes of
+                environment. Default is None.
+
+        Raises:
+            TypeError: command's type isn't (str | Iterable[str]).
+            TypeError: invalid type of cwd, env or env_update.
+
+        Returns:
+            CompletedShell: result of the command.
+        """
+        if not _is_command(command):
+            raise TypeError("command's type must be str or Iterable[str].")
+        cwd = _get_cwd(cwd)
+        env = _get_env(env, env_update)
+        if not _is_cacheable(command):
+            return Shell(command, input_text, cwd=cwd, env=env).finish()
+        if ttl is None:
+            ttl = self.ttl
+        key = self.__get_key(command, input_text, cwd, env)
+        with self.__lock:
+            cached = self.__results.get(key)
+            if cached is not None:
+                if monotonic() - cached[0] < ttl:
+                    self.__results.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+                del self.__results[key]
+            self.misses += 1
+        result = Shell(command, input_text, cwd=cwd, env=env).finish()
+        with self.__lock:
+            self.__results[key] = (monotonic(), result)
+            self.__results.move_to_end(key)
+            while len(self.__results) > self.maxsize:
+                self.__results.popitem(False)
+        return result
+
+
+class _TeeSink:
+    # Adapts a sink of Shell's tee mode to bytes chunks. Sinks that raise an
+    # exception are disabled (the command must not be blocked by them).
+    def __init__(self, sink):
+        if not (isinstance(sink, Logger) or hasattr(sink, "write") or
+                callable(sink)):
+            raise TypeError(
+                "tee sink's type must be file, logging.Logger or callable.")
+        self.sink = sink
+        self.__decoder = None
+        self.__is_enabled = True
+        self.__line = b''
+        if isinstance(sink, TextIOBase) and not hasattr(sink, "buffer"):
+            self.__decoder = getincrementaldecoder("utf-8")("replace")
+
+    def __call(self, function, *args):
+        if self.__is_enabled:
+            try:
+                function(*args)
+            except Exception:
+                self.__is_enabled = False
+
+    def __log_lines(self, chunk: bytes, final=False):
+        lines = (self.__line + chunk).split(b'\n')
+        self.__line = lines.pop()
+        if final and self.__line:
+            lines.append(self.__line)
+        for line in lines:
+            self.sink.info("%s", line.decode("utf-8", "replace"))
+
+    def __write_text(self, chunk: bytes):
+        sink = self.sink
+        sink.flush()  # Keep order of text that was written before
+        sink.buffer.write(chunk)
+        sink.buffer.flush()
+
+    def close(self):
+        '''Writes buffered data (invoked at the end of the stream).'''
+        if isinstance(self.sink, Logger):
+            self.__call(self.__log_lines, b'', True)
+        elif self.__decoder is not None:
+            self.__call(self.sink.write, self.__decoder.decode(b'', True))
+
+    def write(self, chunk: bytes):
+        '''Passes chunk to the sink.'''
+        sink = self.sink
+        if isinstance(sink, Logger):
+            self.__call(self.__log_lines, chunk)
+        elif self.__decoder is not None:
+            self.__call(sink.write, self.__decoder.decode(chunk))
+        elif isinstance(sink, TextIOBase):
+            self.__call(self.__write_text, chunk)
+        elif hasattr(sink, "write"):
+            self.__call(sink.write, chunk)
+            if hasattr(sink, "flush"):
+                self.__call(sink.flush)
+        else:
+            self.__call(sink, chunk)
+
+
+def _tee_sinks(sinks) -> List[_TeeSink]:
+    if sinks is None:
+        return []
+    if isinstance(sinks, (list, tuple)):
+        return [_TeeSink(sink) for sink in sinks]
+    return [_TeeSink(sinks)]
+
+
+class CompletedShell:
+    """
+    Compact result of a finished shell command. Unlike Shell it doesn't keep
+    subprocess.Popen or any pipes: stdout and stderr are stored in a single
+    bytes buffer which is decoded only when output() or error_output() is
+    called (decoded text isn't cached to avoid storing output twice).
+
+    Attributes:
+        command (str | Iterable[str] | None): executed command.
+        pid (int | None): PID of the finished process (if any).
+        stats (dict): execution statistics (e.g., "elapsed" in seconds).
+        errors (List[Tuple[str, OSError]]): per-path errors of operations
+            which are performed natively (without a process).
+    """
+    __slots__ = ("command", "errors", "pid", "stats", "__buffer",
+                 "__exit_code", "__stdout_size")
+
+    def __init__(self, command, pid, exit_code: int,
+                 stdout=b'', stderr=b'', stats=None, errors=None):
+        self.command = command
+        self.errors = [] if errors is None else errors
+        self.pid = pid
+        self.stats = {} if stats is None else stats
+        self.__buffer = bytes(stdout or b'') + bytes(stderr or b'')
+        self.__exit_code = exit_code
+        self.__stdout_size = len(stdout or b'')
+
+    def __repr__(self) -> str:
+        return (f"CompletedShell(command={self.command!r}, "
+                f"exit_code={self.__exit_code})")
+
+    def error_output(self) -> str:
+        '''Returns decoded content of stderr.'''
+        return self.error_output_bytes().decode("utf-8")
+
+    def error_output_bytes(self) -> bytes:
+        '''Returns raw content of stderr.'''
+        return self.__buffer[self.__stdout_size:]
+
+    def exit_code(self) -> int:
+        '''Returns exit code of the command.'''
+        return self.__exit_code
+
+    def get_lines(self, exclude_last_lf=True, stderr=False) -> List[str]:
+        R"""
+        Returns content of stdout splitted by lines excluding last "\n"
+        character (if present). Default output is stdout (also can be stderr).
+
+        Parameters:
+            exclude_last_lf (bool): remove last blank line in list. Default is
+                True.
+            stderr (bool): grab output of stdout or stderr. Default is False
+                (grab output of stdout).
+
+        Returns:
+            List[str]: output splitted by lines.
+        """
+        output = self.error_output() if stderr else self.output()
+        return _split_lines(output, exclude_last_lf)
+
+    def output(self) -> str:
+        '''Returns decoded content of stdout.'''
+        return self.output_bytes().decode("utf-8")
+
+    def output_bytes(self) -> bytes:
+        '''Returns raw content of stdout.'''
+        return self.__buffer[:self.__stdout_size]
+
+    def wait(self) -> int:
+        '''Returns exit code of the command (for compatibility with Shell).'''
+        return self.__exit_code
+
+
+class _FinishedProcess:
+    # Popen-like process of a command which has already finished
+    def __init__(self, result: CompletedShell):
+        self.args = result.command
+        self.pid = result.pid
+        self.returncode = result.exit_code()
+        self.stdin = self.stdout = self.stderr = None
+        self.__result = (result.output_bytes(), result.error_output_bytes())
+
+    def communicate(self, input=None, timeout=None) -> Tuple[bytes, bytes]:
+        return self.__result
+
+    def kill(self):
+        pass
+
+    def poll(self) -> int:
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        pass  # Same as Popen.send_signal() of a finished process
+
+    def terminate(self):
+        pass
+
+    def wait(self, timeout=None) -> int:
+        return self.returncode
+
+
+def expand_wildcards(path: str, dirs_only=False) -> List[str]:
+    R"""
+    Expands wildcards (*) of path in-process like sh does for
+    expose_tilde(quotes_wrapper(path)) with exposed wildcards: '*' matches
+    any characters except leading dot, '\*' is a normal '*', and '~' or
+    '~/' at the beginning is expanded. Compiled patterns are cached.
+
+    Parameters:
+        path (str): path with wildcards.
+        dirs_only (bool): return only directories (or symlinks to them).
+            Default is False.
+
+    Raises:
+        TypeError: path's type isn't str.
+
+    Returns:
+        List[str]: sorted list of existing matched paths ([] if nothing
+        matches). Relative paths are relative to get_working_directory().
+    """
+    if not isinstance(path, str):
+        raise TypeError("path's type must be str.")
+    if path == '~' or path.startswith("~/"):
+        path = os.path.expanduser('~') + path[1:]
+    base = getattr(_thread_state, "cwd", None)
+
+    def resolve(path: str) -> str:
+        return path if base is None else os.path.join(base, path)
+
+    paths = ['']
+    components = path.split('/')
+    for i, component in enumerate(components):
+        separator = '/' if i else ''
+        regex, name = _compile_wildcard(component)
+        if regex is None:
+            paths = [f"{prefix}{separator}{name}" for prefix in paths]
+            continue
+        matches = []
+        for prefix in paths:
+            try:
+                with os.scandir(resolve(prefix + separator or '.')) as entries:
+                    names = [entry.name for entry in entries
+                             if regex.fullmatch(entry.name) and (
+                                 i == len(components) - 1 or
+                                 entry.is_dir())]
+            except OSError:
+                continue
+            if component.startswith('.'):  # sh also matches '.' and '..'
+                names += [name for name in ('.', '..')
+                          if regex.fullmatch(name)]
+            matches += [f"{prefix}{separator}{name}" for name in sorted(names)]
+        paths = matches
+    is_valid = os.path.isdir if dirs_only else os.path.lexists
+    return [path for path in paths if path and is_valid(resolve(path))]
 
 
 def expose_tilde(quoted_path: str) -> str:
@@ -19,6 +743,281 @@ def expose_tilde(quoted_path: str) -> str:
     return quoted_path
 
 
+@lru_cache(maxsize=None)
+def _is_fork_server_supported() -> bool:
+    # _ForkServerProcess replaces private parts of POSIX Popen, so they must
+    # be the ones it was written for (otherwise plain Popen is used)
+    try:
+        parameters = tuple(signature(Popen._execute_child).parameters)
+        poll_parameters = signature(Popen._internal_poll).parameters
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return (os.name == "posix" and
+            parameters[:len(_EXECUTE_CHILD_PARAMETERS)] ==
+            _EXECUTE_CHILD_PARAMETERS and
+            "_deadstate" in poll_parameters and
+            callable(getattr(Popen, "__del__", None)))
+
+
+class _ForkServerProcess(Popen):
+    # Popen whose child is spawned (and waited for) by the fork server.
+    # Only POSIX parts of Popen that are used by Shell are replaced.
+    def __init__(self, server, *args, **kwargs):
+        self.__server = server
+        super().__init__(*args, **kwargs)
+
+    def __del__(self):
+        super().__del__()
+        if self.returncode is not None:
+            self.__server._forget(self.pid)
+
+    def _execute_child(self, args, executable, preexec_fn, close_fds,
+                       pass_fds, cwd, env, startupinfo, creationflags, shell,
+                       p2cread, p2cwrite, c2pread, c2pwrite, errread, errwrite,
+                       *unused_args):
+        if isinstance(args, (str, bytes)):
+            args = [args]
+        args = [os.fsdecode(arg) for arg in args]
+        if shell:
+            args = ["/bin/sh", "-c"] + args
+        executable = os.fsdecode(args[0] if executable is None else executable)
+        cwd = os.path.abspath(os.getcwd() if cwd is None else os.fsdecode(cwd))
+        env = {os.fsdecode(key): os.fsdecode(value)
+               for key, value in (os.environ if env is None else env).items()}
+        # -1 means that the child inherits stdin/stdout/stderr of this process
+        fds = [fd if fd != -1 else i
+               for i, fd in enumerate((p2cread, c2pwrite, errwrite))]
+        try:
+            self.pid = self.__server._spawn(
+                {"args": args, "executable": executable, "cwd": cwd,
+                 "env": env}, fds)
+            self._child_created = True
+        finally:
+            devnull = getattr(self, "_devnull", None)
+            for fd, parent_fd in ((p2cread, p2cwrite), (c2pwrite, c2pread),
+                                  (errwrite, errread)):
+                if fd != -1 and parent_fd != -1 and fd != devnull:
+                    close(fd)
+            if devnull is not None:
+                close(devnull)
+            self._closed_child_pipe_fds = True
+
+    def _internal_poll(self, _deadstate=None, **unused_kwargs):
+        if self.returncode is None:
+            self.returncode = self.__server._get_exit_code(self.pid, 0)
+            if self.returncode is None and not self.__server.is_alive():
+                self.returncode = _deadstate
+        return self.returncode
+
+    def send_signal(self, sig):
+        # The server doesn't send signals to the reaped (and reused) pids
+        if self.poll() is None:
+            self.__server._send_signal(self.pid, sig)
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            self.returncode = self.__server._get_exit_code(self.pid, timeout)
+            if self.returncode is None:
+                if not self.__server.is_alive():
+                    raise RuntimeError("Fork server has been terminated.")
+                raise TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+
+class ForkServer:
+    """
+    Small helper process that spawns commands instead of this process, so
+    cost of spawning doesn't depend on the size (memory, threads) of this
+    process. Start it early (before this process grows). Commands and their
+    stdin/stdout/stderr fds are passed to the server through a Unix socket
+    (fds as SCM_RIGHTS), the server replies with pids and reports exit
+    codes. Signals are also sent by the server.
+
+    Note: Shell and Pipeline use the server which is started by
+    start_fork_server(). Processes that haven't finished before close() can't
+    be waited for.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.__condition = Condition()
+        self.__exit_codes = {}
+        self.__is_connected = False
+        self.__lock = RLock()
+        self.__reader = None
+        self.__replies = []
+        self.__socket = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __read_replies(self, connection):
+        replies = connection.makefile("rb")
+        try:
+            while True:
+                reply = replies.read(_FORK_SERVER_REPLY.size)
+                if len(reply) != _FORK_SERVER_REPLY.size:
+                    break
+                kind, pid, value = _FORK_SERVER_REPLY.unpack(reply)
+                with self.__condition:
+                    if kind == b"X":
+                        self.__exit_codes[pid] = value
+                    else:
+                        if kind == b"S":  # pid can be reused
+                            self.__exit_codes.pop(pid, None)
+                        self.__replies.append((kind, pid, value))
+                    self.__condition.notify_all()
+        except OSError:
+            pass  # Socket has been closed
+        finally:
+            replies.close()
+            with self.__condition:
+                self.__is_connected = False
+                self.__condition.notify_all()
+
+    def __send(self, request: dict, fds=None):
+        message = json.dumps(request).encode("utf-8")
+        message = struct.pack("!I", len(message)) + message
+        try:
+            if fds:
+                sent = self.__socket.sendmsg([message], [(
+                    socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", fds))])
+                message = message[sent:]
+            self.__socket.sendall(message)
+        except BrokenPipeError:
+            self.close()
+            raise RuntimeError("Fork server has been terminated.")
+
+    def _forget(self, pid: int):
+        with self.__condition:
+            self.__exit_codes.pop(pid, None)
+
+    def _get_exit_code(self, pid: int, timeout=None) -> Union[int, None]:
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: pid in self.__exit_codes or not self.__is_connected,
+                timeout)
+            return self.__exit_codes.get(pid)
+
+    def _send_signal(self, pid: int, sig: int):
+        with self.__lock:
+            if self.is_alive():
+                self.__send({"signal": int(sig), "pid": pid})
+
+    def _spawn(self, request: dict, fds: List[int]) -> int:
+        with self.__lock:
+            if not self.is_alive():
+                raise RuntimeError("Fork server isn't started.")
+            self.__send(request, fds)
+            with self.__condition:
+                self.__condition.wait_for(
+                    lambda: self.__replies or not self.__is_connected)
+                if not self.__replies:
+                    raise RuntimeError("Fork server has been terminated.")
+                kind, pid, error = self.__replies.pop(0)
+        if kind == b"S":
+            return pid
+        if error:
+            raise OSError(error, os.strerror(error), request["executable"])
+        raise SubprocessError("Fork server couldn't execute the command.")
+
+    def close(self):
+        '''Shuts down the server (if it's running).'''
+        with self.__lock:
+            if self.process is None:
+                return
+            self.__socket.shutdown(socket.SHUT_RDWR)  # EOF stops the server
+            self.__socket.close()
+            self.process.wait()
+            self.__reader.join()
+            self.process = None
+            self.__socket = None
+
+    def is_alive(self) -> bool:
+        '''Checks if the server is running.'''
+        process = self.process
+        return (process is not None and self.__is_connected and
+                process.poll() is None)
+
+    def popen(self, *args, **kwargs) -> Popen:
+        """
+        Executes command using the server. Accepts the same arguments as
+        subprocess.Popen except POSIX-specific ones (preexec_fn, pass_fds,
+        start_new_session, etc.).
+        Note: if Popen internals of this Python version aren't supported
+        then the command is executed by plain subprocess.Popen.
+
+        Raises:
+            RuntimeError: server isn't started or has been terminated.
+            OSError: command can't be executed.
+
+        Returns:
+            Popen: process object (exit code is received from the server).
+        """
+        if not _is_fork_server_supported():
+            if not self.is_alive():
+                raise RuntimeError("Fork server isn't started.")
+            return Popen(*args, **kwargs)
+        return _ForkServerProcess(self, *args, **kwargs)
+
+    def start(self):
+        """
+        Starts the server. Does nothing if it's already running.
+
+        Raises:
+            RuntimeError: server hasn't started.
+
+        Returns:
+            ForkServer: object from which this method was invoked.
+        """
+        with self.__lock:
+            if self.is_alive():
+                return self
+            parent_socket, child_socket = socket.socketpair(
+                socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.process = Popen(
+                    [sys.executable, "-I", _fork_server_helper.__file__,
+                     str(child_socket.fileno())],
+                    stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL, cwd='/',
+                    pass_fds=(child_socket.fileno(),))
+            finally:
+                child_socket.close()
+            if parent_socket.recv(1) != b"R":
+                parent_socket.close()
+                self.process.wait()
+                self.process = None
+                raise RuntimeError("Fork server hasn't started.")
+            self.__socket = parent_socket
+            self.__is_connected = True
+            self.__exit_codes.clear()
+            self.__replies.clear()
+            self.__reader = Thread(target=self.__read_replies,
+                                   args=(parent_socket,), daemon=True)
+            self.__reader.start()
+        return self
+
+
+def get_fork_server() -> Union[ForkServer, None]:
+    '''Returns running server started by start_fork_server().'''
+    server = _fork_server
+    if server is not None and server.is_alive():
+        return server
+    return None
+
+
+def get_working_directory() -> str:
+    """
+    Returns working directory of the current thread: directory set by
+    working_directory() or os.getcwd() (outside of it).
+    """
+    cwd = getattr(_thread_state, "cwd", None)
+    return os.getcwd() if cwd is None else cwd
+
+
 class ShortArgsOption:
     '''Enum object for normalize_short_and_long_args()'''
     TOGETHER = 0
@@ -122,6 +1121,423 @@ def normalize_short_and_long_args(
             return ''
 
 
+def parallel_map(template: str, items, jobs=None, chunk=1, progress=None,
+                 cwd=None, env=None, env_update=None) -> List[CompletedShell]:
+    """
+    Executes shell command template for every chunk of items in parallel
+    (like GNU parallel or xargs -P). Every '{}' in template is replaced with
+    chunk items, each of them is wrapped in single quotes (see
+    shell_quote_many()), items are appended to the end of the command if
+    template doesn't have '{}'. E.g., parallel_map("gzip -- {}", files,
+    jobs=8, chunk=16).
+
+    Parameters:
+        template (str): shell command template.
+        items (Iterable[str]): arguments of the command (e.g., paths).
+        jobs (int | None): maximum amount of commands executed at once.
+            Default is None (amount of CPUs).
+        chunk (int): maximum amount of items per command. Default is 1.
+        progress (Callable[[int, int], object] | None): invoked with amount
+            of processed items and amount of all items every time a command
+            finishes (in the calling thread). Default is None.
+        cwd (str | None): working directory of commands (see Shell). Default
+            is None.
+        env (Mapping[str, str] | None): environment of commands. Default is
+            None (os.environ).
+        env_update (Mapping[str, str | None] | None): changes of environment.
+            Default is None.
+
+    Raises:
+        TypeError: template's type isn't str.
+        TypeError: items' type isn't Iterable[str].
+        TypeError: jobs' type isn't (int | None) or chunk's type isn't int.
+        ValueError: jobs or chunk is less than 1.
+        ValueError: item contains NUL character.
+
+    Returns:
+        List[CompletedShell]: results of commands in order of items.
+    """
+    if not isinstance(template, str):
+        raise TypeError("template's type must be str.")
+    if isinstance(items, str) or not isinstance(items, Iterable):
+        raise TypeError("items' type must be Iterable[str].")
+    items = list(items)
+    if not all(isinstance(item, str) for item in items):
+        raise TypeError("items' type must be Iterable[str].")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if type(jobs) != int or type(chunk) != int:
+        raise TypeError("jobs' and chunk's type must be int.")
+    if jobs < 1 or chunk < 1:
+        raise ValueError("jobs and chunk must be greater than 0.")
+    if "{}" not in template:
+        template += " {}"
+    commands = [template.replace("{}", shell_quote_many(items[i:i + chunk]))
+                for i in range(0, len(items), chunk)]
+    cwd = _get_cwd(cwd)  # Working directory of the calling thread
+    env = _get_env(env, env_update)
+    results = [None] * len(commands)
+
+    def run(i: int):
+        results[i] = Shell(commands[i], cwd=cwd, env=env).finish()
+        return i
+
+    with ThreadPoolExecutor(min(jobs, len(commands) or 1)) as executor:
+        futures = [executor.submit(run, i) for i in range(len(commands))]
+        try:
+            done = 0
+            for future in _futures_as_completed(futures):
+                i = future.result()
+                done += min(chunk, len(items) - i * chunk)
+                if progress is not None:
+                    progress(done, len(items))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def parallel_pipe(command, source, jobs=None, block_size=1048576,
+                  cwd=None, env=None, env_update=None) -> Iterator:
+    """
+    Splits source into blocks on line boundaries and passes every block to
+    stdin of a separate process of the command (like parallel --pipe). Up to
+    jobs processes are executed at once, results are yielded in order of
+    blocks. Only about 2 * jobs blocks (and their outputs) are kept in
+    memory. Regular file source is mapped into memory (mmap) instead of
+    reading, other files (e.g., FIFOs or procfs files) are read as streams.
+    E.g., b''.join(r.output_bytes() for r in parallel_pipe("gzip", path)).
+
+    Parameters:
+        command (str | Iterable[str]): shell command that processes a block.
+        source (str | bytes | bytearray | BinaryIO): path of a file, data or
+            a stream (file object) that needs to be processed.
+        jobs (int | None): maximum amount of commands executed at once.
+            Default is None (amount of CPUs).
+        block_size (int): minimal size of a block in bytes (block ends with
+            the end of a line). Default is 1048576 (1 MiB).
+        cwd (str | None): working directory of commands (see Shell). Default
+            is None.
+        env (Mapping[str, str] | None): environment of commands. Default is
+            None (os.environ).
+        env_update (Mapping[str, str | None] | None): changes of environment.
+            Default is None.
+
+    Raises:
+        TypeError: command's type isn't (str | Iterable[str]).
+        TypeError: invalid type of source.
+        TypeError: jobs' type isn't (int | None) or block_size's type isn't
+            int.
+        ValueError: jobs or block_size is less than 1.
+        FileNotFoundError: source file doesn't exist.
+
+    Returns:
+        Iterator[CompletedShell]: results of commands in order of blocks.
+    """
+    if not _is_command(command):
+        raise TypeError("command's type must be str or Iterable[str].")
+    if not isinstance(source, (str, bytes, bytearray)) and not hasattr(
+            source, "read"):
+        raise TypeError(
+            "source's type must be str, bytes, bytearray or binary file.")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if type(jobs) != int or type(block_size) != int:
+        raise TypeError("jobs' and block_size's type must be int.")
+    if jobs < 1 or block_size < 1:
+        raise ValueError("jobs and block_size must be greater than 0.")
+    cwd = _get_cwd(cwd)  # Working directory of the calling thread
+    env = _get_env(env, env_update)
+    file = data = None
+    if isinstance(source, str):
+        if source == '~' or source.startswith("~/"):
+            source = os.path.expanduser('~') + source[1:]
+        file = open(os.path.join(get_working_directory(), source), "rb")
+        st = os.fstat(file.fileno())
+        source = file  # Pipes, special and empty files (e.g., procfs)
+        if stat.S_ISREG(st.st_mode) and st.st_size:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass  # Filesystem doesn't support mapping
+
+    def run(block) -> CompletedShell:
+        try:
+            return Shell(command, block, cwd=cwd, env=env).finish()
+        finally:
+            if isinstance(block, memoryview):
+                block.release()
+
+    def iterate():
+        if data is not None:
+            view = memoryview(data)
+            blocks = (view[start:end]
+                      for start, end in _line_blocks(data, block_size))
+        elif isinstance(source, (bytes, bytearray)):
+            view = memoryview(source)
+            blocks = (view[start:end]
+                      for start, end in _line_blocks(source, block_size))
+        else:
+            view = None
+            blocks = _stream_blocks(getattr(source, "buffer", source),
+                                    block_size)
+        executor = ThreadPoolExecutor(jobs)
+        pending = deque()
+        try:
+            for block in blocks:
+                pending.append(executor.submit(run, block))
+                del block
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+            if view is not None:
+                view.release()
+            if isinstance(data, mmap.mmap):
+                data.close()
+            if file is not None:
+                file.close()
+
+    return iterate()
+
+
+class Pipeline:
+    """
+    Pipeline of shell commands (like "cmd1 | cmd2 | cmd3") whose stages are
+    all started at once and connected by pipes, so they run in parallel.
+    Unlike a single /bin/sh pipeline, exit code and stderr of every stage are
+    available. stderr of stages is drained by background threads.
+
+    Note: stdout of the last stage can be either streamed (iter_lines() or
+    stdout attribute) or retrieved entirely (output()). Methods that wait the
+    end of execution read the rest of stdout first.
+
+    Instances are thread-safe.
+    """
+
+    def __init__(self, commands, input_text=None, pipefail=False,
+                 cwd=None, env=None, env_update=None):
+        """
+        Creates and executes all stages of the pipeline.
+
+        Parameters:
+            commands (Iterable[str | Iterable[str]]): shell commands of stages
+                (str commands are executed using /bin/sh).
+            input_text (str | None): input text for the first stage. Default is
+                None.
+            pipefail (bool): exit_code() returns exit code of the rightmost
+                failed stage (like "set -o pipefail"). Default is False.
+            cwd (str | None): working directory of all stages (see Shell).
+                Default is None.
+            env (Mapping[str, str] | None): environment of all stages.
+                Default is None.
+            env_update (Mapping[str, str | None] | None): changes of
+                environment. Default is None.
+
+        Raises:
+            TypeError: commands' type isn't Iterable[str | Iterable[str]].
+            TypeError: cwd's type isn't (str | None).
+            TypeError: env's or env_update's type isn't (Mapping | None).
+        """
+        if isinstance(commands, str) or not isinstance(commands, Iterable):
+            raise TypeError(
+                "commands' type must be Iterable[str | Iterable[str]].")
+        commands = list(commands)
+        if not commands or not all(_is_command(e) for e in commands):
+            raise TypeError(
+                "commands' type must be Iterable[str | Iterable[str]].")
+        self.cwd = _get_cwd(cwd)
+        env = _get_env(env, env_update)
+        self.commands = commands
+        self.input_text = input_text
+        self.pipefail = pipefail
+        self.processes = []
+        self.__start_time = monotonic()
+        stdin = PIPE
+        server = get_fork_server()
+        popen = Popen if server is None else server.popen
+        try:
+            for command in commands:
+                if isinstance(command, str):
+                    process = popen(command, shell=True, cwd=self.cwd,
+                                    env=env, stdin=stdin, stdout=PIPE,
+                                    stderr=PIPE)
+                else:
+                    process = popen(list(command), cwd=self.cwd, env=env,
+                                    stdin=stdin, stdout=PIPE, stderr=PIPE)
+                if self.processes:
+                    # Only the next stage must keep the read end open
+                    stdin.close()
+                self.processes.append(process)
+                stdin = process.stdout
+        except BaseException:
+            for process in self.processes:
+                process.kill()
+                process.wait()
+            raise
+        self.pids = [process.pid for process in self.processes]
+        self.stdout = self.processes[-1].stdout
+        self.__elapsed = None
+        self.__error_outputs = [b''] * len(self.processes)
+        self.__exit_codes = None
+        self.__lock = RLock()
+        self.__output = None
+        self.__threads = [
+            Thread(target=self.__drain_stderr, args=(i, process.stderr),
+                   daemon=True)
+            for i, process in enumerate(self.processes)]
+        self.__threads.append(Thread(target=self.__feed_input, daemon=True))
+        for thread in self.__threads:
+            thread.start()
+
+    def __del__(self):
+        # Don't wait for the processes here, only release file descriptors
+        for process in getattr(self, "processes", ()):
+            for file in (process.stdin, process.stdout, process.stderr):
+                if file is not None:
+                    file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __drain_stderr(self, index: int, stderr):
+        with stderr:
+            self.__error_outputs[index] = stderr.read()
+
+    def __feed_input(self):
+        stdin = self.processes[0].stdin
+        try:
+            if self.input_text is not None:
+                stdin.write(bytes(self.input_text, "utf-8"))
+        except BrokenPipeError:
+            pass  # The first stage doesn't read its input
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def __wait(self, read_output: bool) -> List[int]:
+        if self.__exit_codes is None:
+            with self.__lock:
+                if self.__exit_codes is None:
+                    if read_output:
+                        self.output()
+                    else:
+                        self.stdout.close()
+                    exit_codes = [process.wait()
+                                  for process in self.processes]
+                    for thread in self.__threads:
+                        thread.join()
+                    self.__elapsed = monotonic() - self.__start_time
+                    self.__exit_codes = exit_codes
+        return self.__exit_codes
+
+    def close(self):
+        """
+        Waits the end of all stages. Output of the last stage that hasn't
+        been retrieved yet is discarded. Also invoked at the end of a with
+        statement.
+        """
+        self.__wait(False)
+
+    def error_outputs(self) -> List[str]:
+        '''Waits the end of all stages and returns stderr of every stage.'''
+        self.__wait(True)
+        return [output.decode("utf-8") for output in self.__error_outputs]
+
+    def exit_code(self) -> int:
+        """
+        Waits the end of all stages and returns exit code of the last stage
+        (or of the rightmost failed stage if pipefail is True).
+        """
+        exit_codes = self.exit_codes()
+        if self.pipefail:
+            for exit_code in reversed(exit_codes):
+                if exit_code != 0:
+                    return exit_code
+            return 0
+        return exit_codes[-1]
+
+    def exit_codes(self) -> List[int]:
+        '''Waits the end of all stages and returns exit code of every stage.'''
+        return list(self.__wait(True))
+
+    def finish(self) -> CompletedShell:
+        """
+        Waits the end of all stages and returns compact result: stdout of the
+        last stage, stderr of all stages and exit_code(). stats contain
+        "elapsed" and "exit_codes" (of every stage).
+
+        Returns:
+            CompletedShell: result of the pipeline.
+        """
+        exit_codes = self.exit_codes()
+        return CompletedShell(self.commands, self.pids[-1], self.exit_code(),
+                              self.__output, b''.join(self.__error_outputs),
+                              {"elapsed": self.__elapsed,
+                               "exit_codes": exit_codes})
+
+    def get_lines(self, exclude_last_lf=True) -> List[str]:
+        R"""
+        Returns content of stdout of the last stage splitted by lines
+        excluding last "\n" character (if present).
+
+        Parameters:
+            exclude_last_lf (bool): remove last blank line in list. Default is
+                True.
+
+        Returns:
+            List[str]: output splitted by lines.
+        """
+        return _split_lines(self.output(), exclude_last_lf)
+
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Yields lines of stdout of the last stage (with line feed) as soon as
+        they are written.
+        """
+        if self.__output is not None:
+            yield from self.__output.decode("utf-8").splitlines(True)
+            return
+        for line in self.stdout:
+            yield line.decode("utf-8")
+
+    def kill(self):
+        '''Kills all stages (SIGKILL).'''
+        for process in self.processes:
+            process.kill()
+
+    def output(self) -> str:
+        '''Returns (the rest of) content of stdout of the last stage.'''
+        if self.__output is None:
+            with self.__lock:
+                if self.__output is None:
+                    output = b''
+                    if not self.stdout.closed:
+                        output = self.stdout.read()
+                        self.stdout.close()
+                    self.__output = output
+        return self.__output.decode("utf-8")
+
+    def terminate(self):
+        '''Terminates all stages (SIGTERM).'''
+        for process in self.processes:
+            process.terminate()
+
+    def wait(self) -> int:
+        '''Waits the end of all stages and returns exit_code().'''
+        return self.exit_code()
+
+
 def quotes_wrapper(path: Union[str, Iterable[str]]) -> str:
     """
     Wraps string(s) in "double quotes". In case of Iterable[str] each element
@@ -151,7 +1567,9 @@ def quotes_wrapper(path: Union[str, Iterable[str]]) -> str:
     return path
 
 
-def shell(command, input_text=None, stdin=PIPE, stdout=PIPE, stderr=PIPE):
+def shell(command, input_text=None, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+          tee=None, tee_stderr=None, capture_limit=None,
+          cwd=None, env=None, env_update=None):
     """
     Creates and executes a new process using provided command.
 
@@ -160,23 +1578,91 @@ def shell(command, input_text=None, stdin=PIPE, stdout=PIPE, stderr=PIPE):
     • if input_text was provided then it will be used as input for shell
       command which will be executed immediately (may result in program
       stall). sudo prompt (if appears) will consume all input string.
+    • see Shell for tee mode (tee, tee_stderr and capture_limit).
 
     Parameters:
         command (str | Iterable[str]): shell command that needs to be
             executed.
-        input_text (str | None): input text for command. Default is None.
+        input_text (str | bytes-like | None): input text (or bytes) for
+            command. Default is None.
         stdin (str | int): stdin file descriptor or piped text for command.
             Default is PIPE.
         stdout (int): stdout file descriptor. Default is PIPE.
         stderr (int): stderr file descriptor. Default is PIPE.
+        tee (sink | List[sink] | None): sink(s) for stdout. Default is None.
+        tee_stderr (sink | List[sink] | None): sink(s) for stderr. Default is
+            None.
+        capture_limit (int | None): in tee mode keep only last capture_limit
+            bytes of stdout and stderr (each). Default is None.
+        cwd (str | None): working directory of the command (see Shell).
+            Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): changes of environment.
+            Default is None.
 
     Raises:
         TypeError: command's type isn't (str | Iterable[str]).
+        TypeError: invalid type of cwd, env or env_update.
+        ValueError: invalid tee mode arguments (see Shell).
 
     Returns:
         Shell: class instance that can be chained.
     """
-    return Shell(command, input_text, stdin, stdout, stderr)
+    return Shell(command, input_text, stdin, stdout, stderr,
+                 tee, tee_stderr, capture_limit, cwd, env, env_update)
+
+
+def shell_quote_many(paths: Union[str, Iterable[str]], tilde=False) -> str:
+    """
+    Wraps string(s) in 'single quotes' (POSIX escaping: ' becomes '\\''), so
+    nothing inside them is expanded by the shell. Unlike quotes_wrapper() all
+    elements are escaped in one bulk pass (join and replace), which is much
+    faster for large amounts of paths. Quoted elements are separated by single
+    whitespace.
+
+    Parameters:
+        paths (str | Iterable[str]): string or array of strings that needs to
+            be quoted.
+        tilde (bool): expose '~' of elements that are '~' or start with '~/'
+            (like expose_tilde()). Default is False.
+
+    Raises:
+        TypeError: paths' type isn't (str | Iterable[str]).
+        ValueError: paths contain NUL character.
+
+    Returns:
+        str: quoted string(s).
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    elif isinstance(paths, Iterable):
+        paths = list(paths)
+    if not isinstance(paths, list) or not paths:
+        raise TypeError("paths' type must be str or Iterable[str].")
+    first, last = paths[0], paths[-1]
+    try:
+        # Outer quotes are added to the first and the last elements instead of
+        # copying the whole result once more.
+        paths[0] = "'" + first
+        paths[-1] += "'"
+        quoted = "' '".join(paths)
+    except TypeError:
+        raise TypeError("paths' type must be str or Iterable[str].")
+    if '\0' in quoted:
+        raise ValueError("paths can't contain NUL character.")
+    if quoted.count("'") != 2 * len(paths):  # Some elements contain '
+        paths[0], paths[-1] = first, last
+        paths = [path.replace("'", "'\\''") for path in paths]
+        paths[0] = "'" + paths[0]
+        paths[-1] += "'"
+        quoted = "' '".join(paths)
+    if tilde and '~' in quoted:
+        # Inside quotes every ' is escaped, so "'~" after a space or at the
+        # beginning is always the start of an element.
+        quoted = re.sub(r"(?<=^| )'~/", "~/'", quoted)
+        quoted = re.sub(r"(?<=^| )'~'(?= |$)", '~', quoted)
+    return quoted
 
 
 class Shell:
@@ -189,11 +1675,17 @@ class Shell:
     not wait for the end of the command execution. In order to do that you have
     to invoke any method except shell(), poll(), send_signal().
 
-    P.S. subprocess.Popen is used as a base.
+    Instances are thread-safe: only one thread communicates with the process
+    while others wait for the published result.
+
+    P.S. subprocess.Popen is used as a base (commands are spawned by the fork
+    server if it's started, see start_fork_server()).
     """
 
     def __init__(self, command, input_text=None,
-                 stdin=PIPE, stdout=PIPE, stderr=PIPE):
+                 stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                 tee=None, tee_stderr=None, capture_limit=None,
+                 cwd=None, env=None, env_update=None):
         """
         Creates and executes a new process using provided command.
 
@@ -202,46 +1694,134 @@ class Shell:
         • if input_text was provided then it will be used as input for shell
           command which will be executed immediately (may result in program
           stall). sudo prompt (if appears) will consume all input string.
+        • in tee mode (tee or tee_stderr isn't None) a single background
+          thread reads stdout and stderr and passes every chunk to the sinks
+          as soon as it's read, while output() and error_output() still
+          return the captured output. Sink can be a text stream (e.g.,
+          sys.stdout), binary file, logging.Logger (line by line, INFO level)
+          or callable that accepts bytes. Sinks that raise an exception are
+          disabled.
 
         Parameters:
             command (str | Iterable[str]): shell command that needs to be
                 executed.
-            input_text (str | None): input text for command. Default is None.
+            input_text (str | bytes-like | None): input text (or bytes) for
+                command. Default is None.
             stdin (str | int): stdin file descriptor or piped text for command.
                 Default is PIPE.
             stdout (int): stdout file descriptor. Default is PIPE.
             stderr (int): stderr file descriptor. Default is PIPE.
+            tee (sink | List[sink] | None): sink(s) for stdout. Default is
+                None.
+            tee_stderr (sink | List[sink] | None): sink(s) for stderr.
+                Default is None.
+            capture_limit (int | None): in tee mode keep only last
+                capture_limit bytes of stdout and stderr (each). Default is
+                None (keep everything).
+            cwd (str | None): working directory of the command (relative to
+                the working directory of the thread, see working_directory()).
+                Default is None (working directory of the thread).
+            env (Mapping[str, str] | None): environment of the command.
+                Default is None (os.environ).
+            env_update (Mapping[str, str | None] | None): variables that are
+                set (or unset if value is None) in env/os.environ for the
+                command. Default is None.
 
         Raises:
             TypeError: command's type isn't (str | Iterable[str]).
+            TypeError: sink's type isn't (file | logging.Logger | callable).
+            TypeError: capture_limit's type isn't (int | None).
+            TypeError: cwd's type isn't (str | None).
+            TypeError: env's or env_update's type isn't (Mapping | None).
+            ValueError: capture_limit is negative.
+            ValueError: tee mode is used without stdout=PIPE and stderr=PIPE.
         """
         self.command = command
         self.input_text = None
         self.timeout = None
         if input_text is not None:
             self.input_text = input_text
-        if isinstance(stdin, str):
-            stdin = self.__create_stdout_fd(stdin)
-        if isinstance(command, str):
-            self.process = Popen(command, shell=True,
-                                 stdin=stdin, stdout=stdout, stderr=stderr)
-        elif (isinstance(command, Iterable) and
-              len(command) and
-              all(isinstance(e, str) for e in command)):
-            self.process = Popen(list(command),
-                                 stdin=stdin, stdout=stdout, stderr=stderr)
-        else:
+        if not _is_command(command):
             raise TypeError("command's type must be str or Iterable[str].")
-        self.pid = self.process.pid
-        self.stdin = self.process.stdin
-        self.stdout = self.process.stdout
-        self.stderr = self.process.stderr
+        self.cwd = _get_cwd(cwd)
+        env = _get_env(env, env_update)
+        if capture_limit is not None and type(capture_limit) != int:
+            raise TypeError("capture_limit's type must be int or None.")
+        if capture_limit is not None and capture_limit < 0:
+            raise ValueError("capture_limit can't be negative.")
+        tee_sinks = (_tee_sinks(tee), _tee_sinks(tee_stderr))
+        is_tee_mode = tee is not None or tee_stderr is not None
+        if is_tee_mode and (stdout != PIPE or stderr != PIPE):
+            raise ValueError("tee mode requires stdout=PIPE and stderr=PIPE.")
+        piped_text_fd = None
+        if isinstance(stdin, str):
+            stdin = piped_text_fd = self.__create_stdout_fd(stdin)
+        self.__start_time = monotonic()
+        server = get_fork_server()
+        popen = Popen if server is None else server.popen
+        try:
+            if isinstance(command, str):
+                self.process = popen(command, shell=True, cwd=self.cwd,
+                                     env=env, stdin=stdin, stdout=stdout,
+                                     stderr=stderr)
+            else:
+                self.process = popen(list(command), cwd=self.cwd, env=env,
+                                     stdin=stdin, stdout=stdout, stderr=stderr)
+        finally:
+            # The child has its own copy of the read end (if any)
+            if piped_text_fd is not None:
+                close(piped_text_fd)
+        self.__init_process(self.process)
+        if is_tee_mode:
+            self.__captured = (bytearray(), bytearray())
+            self.__reader = Thread(target=self.__tee,
+                                   args=(tee_sinks, capture_limit),
+                                   daemon=True)
+            self.__reader.start()
+        if self.input_text is not None:
+            self.__get_communicate()
+
+    def __del__(self):
+        # Don't wait for the process here, only release file descriptors
+        process = getattr(self, "process", None)
+        if process is not None:
+            for file in (process.stdin, process.stdout, process.stderr):
+                if file is not None:
+                    file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __init_process(self, process):
+        self.process = process
+        self.__elapsed = None
+        self.pid = process.pid
+        self.stdin = process.stdin
+        self.stdout = process.stdout
+        self.stderr = process.stderr
         self.__communicate = None
         self.__error_output = None
         self.__exit_code = None
+        self.__lock = RLock()
         self.__output = None
-        if self.input_text is not None:
-            self.__get_communicate()
+        self.__reader = None
+
+    @classmethod
+    def _from_completed(cls, result: CompletedShell) -> "Shell":
+        # Shell of a command which has already been executed without a new
+        # process (e.g., in-process or by PrivilegedSession), so callers get
+        # the same interface in every case.
+        shell = cls.__new__(cls)
+        shell.command = result.command
+        shell.input_text = None
+        shell.timeout = None
+        shell.cwd = None
+        shell.__start_time = monotonic()
+        shell.__init_process(_FinishedProcess(result))
+        return shell
 
     def __create_stdout_fd(self, text: str) -> int:
         std_out, std_in = pipe()
@@ -249,29 +1829,96 @@ class Shell:
         close(std_in)
         return std_out
 
-    def __get_communicate(self) -> Tuple[bytes, bytes]:
-        _bytes = None
-        if self.input_text is not None:
-            _bytes = bytes(self.input_text, "utf-8")
-        if self.__communicate is None:
+    def __communicate_tee(self, input=None, timeout=None):
+        # Same as Popen.communicate() but output is read by the tee thread
+        stdin = self.process.stdin
+        if stdin is not None and not stdin.closed:
             try:
-                self.__communicate = self.process.communicate(
-                    _bytes, self.timeout)
-            except KeyboardInterrupt:
-                self.__communicate = self.process.communicate()
+                if input:
+                    stdin.write(input)
+                stdin.close()
+            except BrokenPipeError:
+                pass  # The command doesn't read its input
+        self.__reader.join(timeout)
+        if self.__reader.is_alive():
+            raise TimeoutExpired(self.command, timeout)
+        self.process.wait()
+        return (bytes(self.__captured[0]), bytes(self.__captured[1]))
+
+    def __get_communicate(self) -> Tuple[bytes, bytes]:
+        if self.__communicate is not None:
+            return self.__communicate
+        with self.__lock:
+            if self.__communicate is None:
+                _bytes = self.input_text
+                if isinstance(_bytes, str):
+                    _bytes = bytes(_bytes, "utf-8")
+                communicate_function = self.process.communicate
+                if self.__reader is not None:
+                    communicate_function = self.__communicate_tee
+                try:
+                    communicate = communicate_function(_bytes, self.timeout)
+                except KeyboardInterrupt:
+                    communicate = communicate_function()
+                self.__elapsed = monotonic() - self.__start_time
+                self.__communicate = communicate  # Publish result only once
         return self.__communicate
 
+    def __tee(self, sinks: Tuple[List[_TeeSink], List[_TeeSink]],
+              capture_limit: Union[int, None]):
+        selector = DefaultSelector()
+        for index, file in enumerate((self.stdout, self.stderr)):
+            selector.register(file, EVENT_READ, index)
+        while selector.get_map():
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    for sink in sinks[key.data]:
+                        sink.close()
+                    continue
+                captured = self.__captured[key.data]
+                if capture_limit != 0:
+                    captured += chunk
+                    if capture_limit is not None:
+                        del captured[:-capture_limit]
+                for sink in sinks[key.data]:
+                    sink.write(chunk)
+        selector.close()
+
+    def close(self):
+        """
+        Waits the end of the command execution and closes all pipes of the
+        process. Output that hasn't been retrieved yet is read first, so
+        output() and error_output() still work afterwards (use kill() before
+        for commands which never finish). Also invoked at the end of a with
+        statement.
+        """
+        with self.__lock:
+            self.timeout = None  # E.g., input() has timed out before
+            self.__get_communicate()
+            for file in (self.stdin, self.stdout, self.stderr):
+                if file is not None:
+                    file.close()
+            if self.__exit_code is None:
+                self.__exit_code = self.process.wait()
+
     def error_output(self) -> str:
         '''Returns content of stderr file descriptor.'''
         if self.__error_output is None:
-            self.__error_output = self.__get_communicate()[1].decode("utf-8")
+            error_output = self.__get_communicate()[1].decode("utf-8")
+            with self.__lock:
+                if self.__error_output is None:
+                    self.__error_output = error_output
         return self.__error_output
 
     def exit_code(self) -> int:
         '''Waits the end of the command execution and returns its exit code.'''
         if self.__exit_code is None:
             self.__get_communicate()
-            self.__exit_code = self.process.returncode
+            with self.__lock:
+                if self.__exit_code is None:
+                    self.__exit_code = self.process.returncode
         return self.__exit_code
 
     def get_lines(self, exclude_last_lf=True, stderr=False) -> List[str]:
@@ -292,10 +1939,22 @@ class Shell:
             output = self.error_output()
         else:
             output = self.output()
-        output = output.split('\n')
-        if exclude_last_lf and len(output) and output[-1] == '':
-            output.pop(-1)
-        return output
+        return _split_lines(output, exclude_last_lf)
+
+    def finish(self) -> CompletedShell:
+        """
+        Waits the end of the command execution and returns its compact result.
+        All pipes of the process are closed afterwards, so only the returned
+        object should be retained (instead of this one).
+
+        Returns:
+            CompletedShell: result of the command.
+        """
+        stdout, stderr = self.__get_communicate()
+        exit_code = self.exit_code()
+        self.close()
+        return CompletedShell(self.command, self.pid, exit_code,
+                              stdout, stderr, {"elapsed": self.__elapsed})
 
     def input(self, text='', timeout=None):
         """
@@ -306,7 +1965,7 @@ class Shell:
         timeout seconds (until it's finished).
 
         Parameters:
-            text (str): input for shell command. Default is ''.
+            text (str | bytes-like): input for shell command. Default is ''.
             timeout (float | None): amout of seconds to wait. Default is None.
 
         Raises:
@@ -316,9 +1975,10 @@ class Shell:
         Returns:
             Shell: object from which this method was invoked.
         """
-        self.input_text = text
-        self.timeout = timeout
-        self.__get_communicate()
+        with self.__lock:
+            self.input_text = text
+            self.timeout = timeout
+            self.__get_communicate()
         return self
 
     def kill(self):
@@ -328,7 +1988,10 @@ class Shell:
     def output(self) -> str:
         '''Returns content of stdout file descriptor.'''
         if self.__output is None:
-            self.__output = self.__get_communicate()[0].decode("utf-8")
+            output = self.__get_communicate()[0].decode("utf-8")
+            with self.__lock:
+                if self.__output is None:
+                    self.__output = output
         return self.__output
 
     def poll(self) -> Union[int, None]:
@@ -346,7 +2009,9 @@ class Shell:
         return self.process.send_signal(signal)
 
     def shell(self, command, input_text=None,
-              stdin="parent fd", stdout=PIPE, stderr=PIPE):
+              stdin="parent fd", stdout=PIPE, stderr=PIPE,
+              tee=None, tee_stderr=None, capture_limit=None,
+              cwd=None, env=None, env_update=None):
         """
         Creates and executes a new process using provided command. Gives the
         ability to chain shell commands.
@@ -364,24 +2029,40 @@ class Shell:
         Parameters:
             command (str | Iterable[str]): shell command that needs to be
                 executed.
-            input_text (str | None): input text for command. Default is None.
+            input_text (str | bytes-like | None): input text (or bytes) for
+                command. Default is None.
             stdin (str | int): stdin file descriptor or piped text for command.
                 Default is "parent fd" aka self.stdout (to gain ability of
                 chaining shell commands aka piping).
             stdout (int): stdout file descriptor. Default is PIPE.
             stderr (int): stderr file descriptor. Default is PIPE.
+            tee (sink | List[sink] | None): sink(s) for stdout (see
+                __init__()). Default is None.
+            tee_stderr (sink | List[sink] | None): sink(s) for stderr.
+                Default is None.
+            capture_limit (int | None): in tee mode keep only last
+                capture_limit bytes of stdout and stderr (each). Default is
+                None.
+            cwd (str | None): working directory of the command (see
+                __init__()). Default is None.
+            env (Mapping[str, str] | None): environment of the command.
+                Default is None (os.environ).
+            env_update (Mapping[str, str | None] | None): changes of
+                environment. Default is None.
 
         Raises:
             TypeError: command's type isn't (str | Iterable[str]).
+            TypeError: invalid type of cwd, env or env_update.
+            ValueError: invalid tee mode arguments (see __init__()).
 
         Returns:
             Shell: class instance that can be chained.
         """
         if stdin == "parent fd":
-            stdin = self.__create_stdout_fd(self.output())
-        elif isinstance(stdin, str):
-            stdin = self.__create_stdout_fd(stdin)
-        shell = Shell(command, input_text, stdin, stdout, stderr)
+            stdin = self.output()
+        # New instance creates (and closes) file descriptor for str stdin
+        shell = Shell(command, input_text, stdin, stdout, stderr,
+                      tee, tee_stderr, capture_limit, cwd, env, env_update)
         return shell
 
     def terminate(self):
@@ -391,3 +2072,121 @@ class Shell:
     def wait(self) -> int:
         '''Waits the end of the command execution and returns its exit code.'''
         return self.exit_code()
+
+
+def start_fork_server() -> ForkServer:
+    """
+    Starts fork server (see ForkServer) which will be used by Shell, Pipeline
+    (and everything that is based on them) to spawn commands. Should be
+    invoked as early as possible (e.g., right after imports).
+
+    Raises:
+        RuntimeError: server hasn't started.
+
+    Returns:
+        ForkServer: started server.
+    """
+    global _fork_server
+    server = get_fork_server()
+    if server is None:
+        server = ForkServer().start()
+        _fork_server = server
+    return server
+
+
+def stop_fork_server():
+    '''Shuts down server started by start_fork_server() (if any).'''
+    global _fork_server
+    server, _fork_server = _fork_server, None
+    if server is not None:
+        server.close()
+
+
+def wait_all(shells, timeout=None) -> Tuple[list, list]:
+    """
+    Waits until all processes finish or timeout expires (see
+    as_completed()).
+
+    Parameters:
+        shells (Iterable[Shell]): shells to wait for.
+        timeout (int | float | None): maximum amount of seconds to wait.
+            Default is None (no limit).
+
+    Raises:
+        TypeError: shells' type isn't Iterable[Shell].
+        TypeError: timeout's type isn't (int | float | None).
+        ValueError: timeout is negative.
+
+    Returns:
+        Tuple[List[Shell], List[Shell]]: finished and pending shells.
+    """
+    shells = _check_shells(shells, timeout)
+    for _ in _iter_completed(shells, timeout):
+        pass
+    return ([shell for shell in shells if shell.poll() is not None],
+            [shell for shell in shells if shell.poll() is None])
+
+
+def wait_any(shells, timeout=None) -> Tuple[list, list]:
+    """
+    Waits until at least one process finishes or timeout expires (see
+    as_completed()).
+
+    Parameters:
+        shells (Iterable[Shell]): shells to wait for.
+        timeout (int | float | None): maximum amount of seconds to wait.
+            Default is None (no limit).
+
+    Raises:
+        TypeError: shells' type isn't Iterable[Shell].
+        TypeError: timeout's type isn't (int | float | None).
+        ValueError: timeout is negative.
+
+    Returns:
+        Tuple[List[Shell], List[Shell]]: finished and pending shells.
+    """
+    shells = _check_shells(shells, timeout)
+    completed = _iter_completed(shells, timeout)
+    try:
+        next(completed, None)
+    finally:
+        completed.close()
+    return ([shell for shell in shells if shell.poll() is not None],
+            [shell for shell in shells if shell.poll() is None])
+
+
+@contextmanager
+def working_directory(path: str):
+    """
+    Context manager that sets working directory of the current thread (not
+    of the whole process like os.chdir()): commands executed by this thread
+    (Shell, shell(), Pipeline, wrappers of gnu_coreutils, etc.) are run in it
+    and relative paths of native operations are resolved against it. cd()
+    changes it instead of cwd of the process. Can be nested.
+
+    Parameters:
+        path (str): new working directory (relative to the current one).
+
+    Raises:
+        TypeError: path's type isn't str.
+        ValueError: path isn't a directory.
+
+    Returns:
+        str: absolute path of the working directory (as target of "with").
+    """
+    if not isinstance(path, str):
+        raise TypeError("path's type must be str.")
+    if path == '~' or path.startswith("~/"):
+        path = os.path.expanduser('~') + path[1:]
+    path = os.path.abspath(os.path.join(get_working_directory(), path))
+    if not os.path.isdir(path):
+        raise ValueError("Invalid path.")
+    previous_cwd = getattr(_thread_state, "cwd", None)
+    _thread_state.cwd = path
+    try:
+        yield path
+    finally:
+        _thread_state.cwd = previous_cwd
+
+
+_command_cache = CommandCache()
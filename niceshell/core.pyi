@@ -1,10 +1,105 @@
+from logging import Logger
 from subprocess import PIPE, Popen
-from typing import AnyStr, IO, Iterable, List, Union
+from typing import (AnyStr, BinaryIO, Callable, ContextManager, IO, Iterable,
+                    Iterator, List, Mapping, Tuple, Union)
 
+TeeSink = Union[IO, Logger, Callable[[bytes], object]]
+TeeSinks = Union[TeeSink, List[TeeSink], None]
+Env = Union[Mapping[str, str], None]
+EnvUpdate = Union[Mapping[str, Union[str, None]], None]
 
+
+def as_completed(shells: Iterable[Shell],
+                 timeout: Union[float, None] = None) -> Iterator[Shell]: ...
+
+
+def cached_shell(command: Union[str, Iterable[str]],
+                 input_text: Union[str, None] = None,
+                 ttl: Union[float, None] = None,
+                 cache: Union[CommandCache, None] = None,
+                 cwd: Union[str, None] = None,
+                 env: Env = None,
+                 env_update: EnvUpdate = None) -> CompletedShell: ...
+
+
+class CommandCache:
+    env_keys: Tuple[str, ...]
+    hits: int
+    maxsize: int
+    misses: int
+    ttl: float
+
+    def __init__(self,
+                 maxsize: int = 256,
+                 ttl: float = 30,
+                 env_keys: Iterable[str] = ("HOME", "LANG", "LC_ALL", "PATH")
+                 ) -> None: ...
+
+    def __len__(self) -> int: ...
+    def clear(self) -> None: ...
+
+    def invalidate(self,
+                   command: Union[str, Iterable[str], None] = None
+                   ) -> None: ...
+
+    def run(self,
+            command: Union[str, Iterable[str]],
+            input_text: Union[str, None] = None,
+            ttl: Union[float, None] = None,
+            cwd: Union[str, None] = None,
+            env: Env = None,
+            env_update: EnvUpdate = None) -> CompletedShell: ...
+
+
+class CompletedShell:
+    command: Union[str, Iterable[str], None]
+    errors: List[Tuple[str, OSError]]
+    pid: Union[int, None]
+    stats: dict
+
+    def __init__(self,
+                 command: Union[str, Iterable[str], None],
+                 pid: Union[int, None],
+                 exit_code: int,
+                 stdout: Union[bytes, None] = b'',
+                 stderr: Union[bytes, None] = b'',
+                 stats: Union[dict, None] = None,
+                 errors: Union[List[Tuple[str, OSError]], None] = None
+                 ) -> None: ...
+
+    def error_output(self) -> str: ...
+    def error_output_bytes(self) -> bytes: ...
+    def exit_code(self) -> int: ...
+
+    def get_lines(self,
+                  exclude_last_lf: bool = True,
+                  stderr: bool = False) -> List[str]: ...
+
+    def output(self) -> str: ...
+    def output_bytes(self) -> bytes: ...
+    def wait(self) -> int: ...
+
+
+def expand_wildcards(path: str, dirs_only: bool = False) -> List[str]: ...
 def expose_tilde(quoted_path: str) -> str: ...
 
 
+class ForkServer:
+    process: Union[Popen, None]
+
+    def __init__(self) -> None: ...
+    def __enter__(self) -> ForkServer: ...
+    def __exit__(self, exc_type, exc_value, traceback) -> None: ...
+    def close(self) -> None: ...
+    def is_alive(self) -> bool: ...
+    def popen(self, *args, **kwargs) -> Popen: ...
+    def start(self) -> ForkServer: ...
+
+
+def get_fork_server() -> Union[ForkServer, None]: ...
+def get_working_directory() -> str: ...
+
+
 class ShortArgsOption:
     TOGETHER = 0
     APART = 1
@@ -17,19 +112,83 @@ def normalize_short_and_long_args(
     short_args_option: ShortArgsOption = ShortArgsOption.TOGETHER) -> str: ...
 
 
+def parallel_map(template: str,
+                 items: Iterable[str],
+                 jobs: Union[int, None] = None,
+                 chunk: int = 1,
+                 progress: Union[Callable[[int, int], object], None] = None,
+                 cwd: Union[str, None] = None,
+                 env: Env = None,
+                 env_update: EnvUpdate = None) -> List[CompletedShell]: ...
+
+
+def parallel_pipe(command: Union[str, Iterable[str]],
+                  source: Union[str, bytes, bytearray, BinaryIO],
+                  jobs: Union[int, None] = None,
+                  block_size: int = 1048576,
+                  cwd: Union[str, None] = None,
+                  env: Env = None,
+                  env_update: EnvUpdate = None
+                  ) -> Iterator[CompletedShell]: ...
+
+
+class Pipeline:
+    commands: List[Union[str, Iterable[str]]]
+    cwd: Union[str, None]
+    input_text: Union[str, None]
+    pids: List[int]
+    pipefail: bool
+    processes: List[Popen]
+    stdout: IO[bytes]
+
+    def __init__(self,
+                 commands: Iterable[Union[str, Iterable[str]]],
+                 input_text: Union[str, None] = None,
+                 pipefail: bool = False,
+                 cwd: Union[str, None] = None,
+                 env: Env = None,
+                 env_update: EnvUpdate = None) -> None: ...
+
+    def __del__(self) -> None: ...
+    def __enter__(self) -> Pipeline: ...
+    def __exit__(self, exc_type, exc_value, traceback) -> None: ...
+    def close(self) -> None: ...
+    def error_outputs(self) -> List[str]: ...
+    def exit_code(self) -> int: ...
+    def exit_codes(self) -> List[int]: ...
+    def finish(self) -> CompletedShell: ...
+    def get_lines(self, exclude_last_lf: bool = True) -> List[str]: ...
+    def iter_lines(self) -> Iterator[str]: ...
+    def kill(self) -> None: ...
+    def output(self) -> str: ...
+    def terminate(self) -> None: ...
+    def wait(self) -> int: ...
+
+
 def quotes_wrapper(path: Union[str, Iterable[str]]) -> str: ...
 
 
 def shell(command: Union[str, Iterable[str]],
-          input_text: Union[str, None] = None,
+          input_text: Union[str, bytes, None] = None,
           stdin: Union[str, int] = PIPE,
           stdout: int = PIPE,
-          stderr: int = PIPE) -> Shell: ...
+          stderr: int = PIPE,
+          tee: TeeSinks = None,
+          tee_stderr: TeeSinks = None,
+          capture_limit: Union[int, None] = None,
+          cwd: Union[str, None] = None,
+          env: Env = None,
+          env_update: EnvUpdate = None) -> Shell: ...
+
+
+def shell_quote_many(paths: Union[str, Iterable[str]],
+                     tilde: bool = False) -> str: ...
 
 
 class Shell:
     command: Union[str, Iterable[str]]
-    input_text: Union[str, None]
+    cwd: Union[str, None]
+    input_text: Union[str, bytes, None]
     process: Popen
     pid: int
     stdin: IO[AnyStr]
@@ -39,20 +198,30 @@ class Shell:
 
     def __init__(self,
                  command: Union[str, Iterable[str]],
-                 input_text: Union[str, None] = None,
+                 input_text: Union[str, bytes, None] = None,
                  stdin: Union[str, int] = PIPE,
                  stdout: int = PIPE,
-                 stderr: int = PIPE) -> None: ...
+                 stderr: int = PIPE,
+                 tee: TeeSinks = None,
+                 tee_stderr: TeeSinks = None,
+                 capture_limit: Union[int, None] = None,
+                 cwd: Union[str, None] = None,
+                 env: Env = None,
+                 env_update: EnvUpdate = None) -> None: ...
 
+    def __enter__(self) -> Shell: ...
+    def __exit__(self, exc_type, exc_value, traceback) -> None: ...
+    def close(self) -> None: ...
     def error_output(self) -> str: ...
     def exit_code(self) -> int: ...
+    def finish(self) -> CompletedShell: ...
 
     def get_lines(self,
                   exclude_last_lf: bool = True,
                   stderr: bool = False) -> List[str]: ...
 
     def input(self,
-              text: str = '',
+              text: Union[str, bytes] = '',
               timeout: Union[float, None] = None) -> Shell: ...
 
     def kill(self): ...
@@ -62,10 +231,33 @@ class Shell:
 
     def shell(self,
               command: Union[str, Iterable[str]],
-              input_text: Union[str, None] = None,
+              input_text: Union[str, bytes, None] = None,
               stdin: Union[str, int] = "parent fd",
               stdout: int = PIPE,
-              stderr: int = PIPE) -> Shell: ...
+              stderr: int = PIPE,
+              tee: TeeSinks = None,
+              tee_stderr: TeeSinks = None,
+              capture_limit: Union[int, None] = None,
+              cwd: Union[str, None] = None,
+              env: Env = None,
+              env_update: EnvUpdate = None) -> Shell: ...
 
     def terminate(self): ...
     def wait(self) -> int: ...
+
+
+def start_fork_server() -> ForkServer: ...
+def stop_fork_server() -> None: ...
+
+
+def wait_all(shells: Iterable[Shell],
+             timeout: Union[float, None] = None
+             ) -> Tuple[List[Shell], List[Shell]]: ...
+
+
+def wait_any(shells: Iterable[Shell],
+             timeout: Union[float, None] = None
+             ) -> Tuple[List[Shell], List[Shell]]: ...
+
+
+def working_directory(path: str) -> ContextManager[str]: ...
@@ -1,22 +1,625 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from subprocess import PIPE, Popen
+from threading import RLock
+from time import time
+from typing import Iterable, Iterator, List, Union
+
 import regex as re
 
-from .core import expose_tilde, quotes_wrapper, shell
+from . import _native
+from .core import (CompletedShell, expand_wildcards, expose_tilde,
+                   get_working_directory, quotes_wrapper, shell,
+                   shell_quote_many)
+from .core import _needs_shell
+
+__all__ = ["ColumnarListing", "force_sudo_password_promt",
+           "get_privileged_session", "get_root_privileges",
+           "get_root_privileges_or_exit", "has_root_privileges",
+           "list_columnar", "list_dirs", "list_files", "ListingCache",
+           "PrivilegedSession", "start_privileged_session",
+           "stop_privileged_session", "sync"]
+
+# Code of the root coprocess. Request: 4-byte length + JSON. Response: exit
+# code, stdout size, stderr size (struct "!iQQ") + stdout + stderr.
+_PRIVILEGED_HELPER = R"""
+import json, struct, subprocess, sys
+requests, responses = sys.stdin.buffer, sys.stdout.buffer
+responses.write(b"R")
+responses.flush()
+while True:
+    header = requests.read(4)
+    if len(header) < 4:
+        break
+    request = json.loads(requests.read(struct.unpack("!I", header)[0]))
+    command = request["command"]
+    try:
+        process = subprocess.run(
+            command, shell=isinstance(command, str), cwd=request["cwd"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        exit_code = process.returncode
+        out, err = process.stdout, process.stderr
+    except OSError as error:
+        exit_code, out, err = 127, b"", f"{error}\n".encode()
+    responses.write(struct.pack("!iQQ", exit_code, len(out), len(err)))
+    responses.write(out + err)
+    responses.flush()
+"""
+_RESPONSE_HEADER = struct.Struct("!iQQ")
+_privileged_session = None
+
+# inotify(7) constants and event header (wd, mask, cookie, len).
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x01000000
+_IN_WATCH_MASK = (_IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO
+                  | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_INOTIFY_EVENT = struct.Struct("iIII")
+_RACY_MTIME_WINDOW = 1  # Seconds
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _libc.inotify_init1.argtypes = [ctypes.c_int]
+            _libc.inotify_add_watch.argtypes = [
+                ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (AttributeError, OSError):
+            _libc = False  # inotify isn't available
+    return _libc
+
+
+def _filter_hidden(names: Iterable[str], hidden: bool,
+                   non_hidden: bool) -> List[str]:
+    return sorted(name for name in names
+                  if (hidden if name.startswith('.') else non_hidden))
+
+
+def _get_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _resolve_path(path: str) -> str:
+    # Returns quoted path with expanded wildcards (it must match exactly one
+    # path). Paths with shell expansions are still resolved by the shell.
+    if _needs_shell(path):
+        path = expose_tilde(quotes_wrapper(path))
+        path = re.sub(r'(?<=[^\\])\*', '"*"', path)  # Expose wildcard (*)
+        path = re.sub(r'\\\*', '*', path)  # Preserve '*'
+        paths = shell(f"ls -d -- {path}").get_lines()
+    else:
+        paths = expand_wildcards(path)
+    if len(paths) != 1:
+        raise ValueError("Invalid path.")
+    return shell_quote_many(paths[0])
+
+
+class ColumnarListing:
+    """
+    Compact listing of directory entries stored in columns: parallel arrays
+    (array module) of sizes, modification times, modes and inodes plus a
+    single buffer of packed names (encoded with os.fsencode()) with their
+    offsets. Row i consists of i-th element of every column.
+
+    If NumPy is installed then it's used for sorting and filtering and
+    to_numpy() can be used for vectorized operations on columns.
+
+    Attributes:
+        size (array[int]): sizes in bytes.
+        mtime (array[float]): times of last modification (seconds).
+        mode (array[int]): st_mode of entries.
+        inode (array[int]): inode numbers.
+        names (bytearray): packed names.
+        name_offsets (array[int]): offsets of names in names buffer (one
+            more than amount of entries).
+    """
+    COLUMNS = ("size", "mtime", "mode", "inode")
+
+    def __init__(self):
+        self.size = array('q')
+        self.mtime = array('d')
+        self.mode = array('I')
+        self.inode = array('Q')
+        self.names = bytearray()
+        self.name_offsets = array('Q', [0])
+
+    def __len__(self) -> int:
+        return len(self.size)
+
+    def append(self, name: bytes, st: os.stat_result):
+        '''Appends entry (name is bytes) and its stat result as a new row.'''
+        self.size.append(st.st_size)
+        self.mtime.append(st.st_mtime)
+        self.mode.append(st.st_mode)
+        self.inode.append(st.st_ino)
+        self.names += name
+        self.name_offsets.append(len(self.names))
+
+    def argsort(self, key="name", reverse=False) -> array:
+        """
+        Returns indices of rows in sorted order.
+
+        Parameters:
+            key (str): "name" or name of a column. Default is "name".
+            reverse (bool): sort in descending order. Default is False.
+
+        Raises:
+            ValueError: invalid key.
+
+        Returns:
+            array[int]: indices of rows.
+        """
+        if key == "name":
+            names, offsets = bytes(self.names), self.name_offsets
+            indices = sorted(range(len(self)), reverse=reverse,
+                             key=lambda i: names[offsets[i]:offsets[i + 1]])
+            return array('Q', indices)
+        if key not in self.COLUMNS:
+            raise ValueError("Invalid key. Valid keys are: name, "
+                             f"{', '.join(self.COLUMNS)}.")
+        column = getattr(self, key)
+        numpy = _get_numpy()
+        if numpy is None:
+            return array('Q', sorted(range(len(self)), reverse=reverse,
+                                     key=column.__getitem__))
+        indices = numpy.argsort(
+            numpy.frombuffer(column, column.typecode), kind="stable")
+        if reverse:
+            indices = indices[::-1]
+        return array('Q', indices.astype(numpy.uint64).tobytes())
+
+    def filter(self, mask: Iterable[bool]):
+        """
+        Returns new listing with rows for which mask is True (e.g.,
+        listing.to_numpy()["size"] > 1024).
+
+        Parameters:
+            mask (Iterable[bool]): boolean value of every row.
+
+        Returns:
+            ColumnarListing: filtered listing.
+        """
+        return self.take([i for i, keep in enumerate(mask) if keep])
+
+    def name(self, index: int) -> str:
+        '''Returns decoded name of the row.'''
+        offsets = self.name_offsets
+        return os.fsdecode(bytes(self.names[offsets[index]:
+                                            offsets[index + 1]]))
+
+    def iter_names(self) -> Iterator[str]:
+        '''Yields decoded names of all rows.'''
+        for i in range(len(self)):
+            yield self.name(i)
+
+    def sort(self, key="name", reverse=False):
+        '''Returns new listing sorted by key (see argsort()).'''
+        return self.take(self.argsort(key, reverse))
+
+    def take(self, indices: Iterable[int]):
+        """
+        Returns new listing with rows in order of provided indices.
+
+        Parameters:
+            indices (Iterable[int]): indices of rows.
+
+        Returns:
+            ColumnarListing: new listing.
+        """
+        listing = ColumnarListing()
+        numpy = _get_numpy()
+        if numpy is not None:
+            numpy_indices = numpy.asarray(indices, dtype=numpy.int64)
+            for column in self.COLUMNS:
+                values = getattr(self, column)
+                getattr(listing, column).frombytes(numpy.frombuffer(
+                    values, values.typecode)[numpy_indices].tobytes())
+            indices = numpy_indices.tolist()
+        else:
+            indices = list(indices)
+            for column in self.COLUMNS:
+                values = getattr(self, column)
+                getattr(listing, column).extend(values[i] for i in indices)
+        names, offsets = self.names, self.name_offsets
+        new_names, new_offsets = listing.names, listing.name_offsets
+        for i in indices:
+            new_names += names[offsets[i]:offsets[i + 1]]
+            new_offsets.append(len(new_names))
+        return listing
+
+    def to_numpy(self) -> dict:
+        """
+        Returns columns as NumPy arrays (without copying): "size", "mtime",
+        "mode", "inode", "names" (uint8) and "name_offsets".
+
+        Raises:
+            ImportError: NumPy isn't installed.
+
+        Returns:
+            dict: NumPy arrays of columns.
+        """
+        import numpy
+        arrays = {column: numpy.frombuffer(getattr(self, column),
+                                           getattr(self, column).typecode)
+                  for column in self.COLUMNS}
+        arrays["names"] = numpy.frombuffer(self.names, numpy.uint8)
+        arrays["name_offsets"] = numpy.frombuffer(self.name_offsets,
+                                                  self.name_offsets.typecode)
+        return arrays
+
+
+class ListingCache:
+    """
+    In-memory cache of directory listings for list_dirs()/list_files()-like
+    polling. Contents of every cached directory are updated incrementally
+    from inotify events (Linux), so repeated listings don't read the
+    directory again. If inotify is unavailable or its watches are exhausted
+    then mtime of the directory is checked on every call and the directory
+    is re-read only if it has changed (or has been modified less than a
+    second ago). At most max_dirs directories are cached, least recently used
+    ones are evicted. Wildcards in paths are expanded (see expand_wildcards()).
+    Note: like "ls -L", symlinks are classified by their targets (broken
+    ones are files), but changes of targets themselves aren't tracked.
+
+    Parameters:
+        max_dirs (int): maximum amount of cached directories. Default is 128.
+
+    Raises:
+        TypeError: if max_dirs's type isn't int.
+        ValueError: if max_dirs is less than 1.
+    """
+
+    def __init__(self, max_dirs=128):
+        if type(max_dirs) != int:
+            raise TypeError("max_dirs's type must be int.")
+        if max_dirs < 1:
+            raise ValueError("max_dirs must be positive.")
+        self.max_dirs = max_dirs
+        # path: [dirs (set), files (set), watch descriptor, mtime]
+        self.__dirs = OrderedDict()
+        self.__lock = RLock()
+        self.__watches = {}  # watch descriptor: path
+        self.__inotify_fd = None
+        libc = _get_libc()
+        if libc:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.__inotify_fd = fd
+
+    def __del__(self):
+        if getattr(self, "_ListingCache__inotify_fd", None) is not None:
+            os.close(self.__inotify_fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __add_watch(self, path: str) -> Union[int, None]:
+        if self.__inotify_fd is None:
+            return None
+        wd = _get_libc().inotify_add_watch(
+            self.__inotify_fd, os.fsencode(path), _IN_WATCH_MASK)
+        if wd < 0 or wd in self.__watches:
+            return None  # Out of watches (ENOSPC) or same directory
+        self.__watches[wd] = path
+        return wd
+
+    def __classify(self, cached: list, path: str, name: str):
+        try:
+            is_dir = os.path.isdir(os.path.join(path, name))
+        except ValueError:
+            return
+        cached[0].discard(name)  # Name could be replaced (e.g., by rename)
+        cached[1].discard(name)
+        if is_dir:
+            cached[0].add(name)
+        elif os.path.lexists(os.path.join(path, name)):
+            cached[1].add(name)
+
+    def __drop(self, path: str):
+        cached = self.__dirs.pop(path, None)
+        if cached is not None and cached[2] is not None:
+            del self.__watches[cached[2]]
+            _get_libc().inotify_rm_watch(self.__inotify_fd, cached[2])
+
+    def __get(self, path: str) -> list:
+        if not isinstance(path, str):
+            raise TypeError("path's type must be str.")
+        paths = expand_wildcards(path)
+        if len(paths) != 1:
+            raise ValueError("Invalid path.")
+        path = os.path.realpath(
+            os.path.join(get_working_directory(), paths[0]))
+        with self.__lock:
+            self.__read_events()
+            cached = self.__dirs.get(path)
+            if cached is not None and cached[2] is None:
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime is None or mtime != cached[3]:
+                    self.__drop(path)
+                    cached = None
+            if cached is None:
+                cached = self.__scan(path)
+                self.__dirs[path] = cached
+                while len(self.__dirs) > self.max_dirs:
+                    self.__drop(next(iter(self.__dirs)))
+            else:
+                self.__dirs.move_to_end(path)
+            return cached
+
+    def __read_events(self):
+        if self.__inotify_fd is None:
+            return
+        while True:
+            try:
+                data = os.read(self.__inotify_fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, size = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + size].rstrip(b'\0'))
+                offset += size
+                if mask & _IN_Q_OVERFLOW:  # Events were lost
+                    for path in list(self.__dirs):
+                        self.__drop(path)
+                    continue
+                path = self.__watches.get(wd)
+                if path is None:
+                    continue
+                if mask & _IN_IGNORED:
+                    del self.__watches[wd]
+                    self.__dirs.pop(path, None)
+                elif mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                    self.__drop(path)
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    cached = self.__dirs[path]
+                    cached[0].discard(name)
+                    cached[1].discard(name)
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self.__classify(self.__dirs[path], path, name)
+
+    def __scan(self, path: str) -> list:
+        # Watch is added first, so no change is lost while reading.
+        wd = self.__add_watch(path)
+        try:
+            mtime = None if wd is not None else os.stat(path).st_mtime
+            # Timestamps are coarse, so changes made right after reading of
+            # recently modified directory could keep the same mtime.
+            if mtime is not None and time() - mtime < _RACY_MTIME_WINDOW:
+                mtime = None
+            dirs, files = set(), set()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    (dirs if is_dir else files).add(entry.name)
+        except OSError:
+            if wd is not None:
+                del self.__watches[wd]
+                _get_libc().inotify_rm_watch(self.__inotify_fd, wd)
+            raise ValueError("Invalid path.")
+        return [dirs, files, wd, mtime]
+
+    def close(self):
+        '''Clears cache and releases inotify resources.'''
+        with self.__lock:
+            self.__dirs.clear()
+            self.__watches.clear()
+            if self.__inotify_fd is not None:
+                os.close(self.__inotify_fd)
+                self.__inotify_fd = None
+
+    def list_dirs(self, path='.', hidden=True,
+                  non_hidden=True) -> List[str]:
+        """
+        Returns sorted list of directories that are located in path (see
+        list_dirs()).
+
+        Parameters:
+            path (str): directory of needed subdirectories. Default is '.'.
+            hidden (bool): include hidden directories if True. Default is
+                True.
+            non_hidden (bool): include non-hidden directories if True.
+                Default is True.
+
+        Raises:
+            TypeError: if path's type isn't str.
+            ValueError: if path doesn't exist or inaccessible.
+
+        Returns:
+            List[str]: list of directories.
+        """
+        with self.__lock:
+            return _filter_hidden(self.__get(path)[0], hidden, non_hidden)
 
-__all__ = ["force_sudo_password_promt", "get_root_privileges",
-           "get_root_privileges_or_exit", "has_root_privileges", "list_dirs",
-           "list_files"]
+    def list_files(self, path='.', hidden=True,
+                   non_hidden=True) -> List[str]:
+        """
+        Returns sorted list of files that are located in path (see
+        list_files()).
+
+        Parameters:
+            path (str): directory of needed files. Default is '.'.
+            hidden (bool): include hidden files if True. Default is True.
+            non_hidden (bool): include non-hidden files if True. Default is
+                True.
+
+        Raises:
+            TypeError: if path's type isn't str.
+            ValueError: if path doesn't exist or inaccessible.
+
+        Returns:
+            List[str]: list of files.
+        """
+        with self.__lock:
+            return _filter_hidden(self.__get(path)[1], hidden, non_hidden)
+
+
+class PrivilegedSession:
+    """
+    Long-lived root coprocess that executes commands without invoking sudo
+    every time. sudo is invoked only once (in start()), afterwards commands
+    are passed to the coprocess through its stdin and their results are
+    received through its stdout (both are framed).
+
+    Note: sudo=True wrappers from gnu_coreutils use the session which is
+    started by start_privileged_session(). Then they return already finished
+    Shell.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.__lock = RLock()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __read(self, size: int) -> bytes:
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            self.close()
+            raise RuntimeError("Privileged session has been terminated.")
+        return data
+
+    def close(self):
+        '''Shuts down the root coprocess (if it's running).'''
+        with self.__lock:
+            if self.process is None:
+                return
+            self.process.stdin.close()  # EOF stops the coprocess
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def is_alive(self) -> bool:
+        '''Checks if the root coprocess is running.'''
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, command, cwd=None) -> CompletedShell:
+        """
+        Executes command as root using the coprocess.
+
+        Parameters:
+            command (str | Iterable[str]): shell command that needs to be
+                executed. If command's type is str then it will be executed
+                using /bin/sh.
+            cwd (str | None): working directory of the command (relative to
+                get_working_directory()). Default is None (working directory
+                of the thread, see working_directory()).
+
+        Raises:
+            TypeError: command's type isn't (str | Iterable[str]).
+            RuntimeError: session isn't started or has been terminated.
+
+        Returns:
+            CompletedShell: result of the command.
+        """
+        if not isinstance(command, str) and not (
+                isinstance(command, Iterable) and
+                len(command) and
+                all(isinstance(e, str) for e in command)):
+            raise TypeError("command's type must be str or Iterable[str].")
+        if not isinstance(command, str):
+            command = list(command)
+        cwd = get_working_directory() if cwd is None else os.path.join(
+            get_working_directory(), cwd)
+        request = json.dumps({"command": command, "cwd": cwd})
+        request = request.encode("utf-8")
+        with self.__lock:
+            if not self.is_alive():
+                raise RuntimeError("Privileged session isn't started.")
+            try:
+                self.process.stdin.write(struct.pack("!I", len(request)))
+                self.process.stdin.write(request)
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                self.close()
+                raise RuntimeError("Privileged session has been terminated.")
+            exit_code, stdout_size, stderr_size = _RESPONSE_HEADER.unpack(
+                self.__read(_RESPONSE_HEADER.size))
+            data = self.__read(stdout_size + stderr_size)
+            pid = self.process.pid
+        return CompletedShell(command, pid, exit_code,
+                              data[:stdout_size], data[stdout_size:])
+
+    def start(self):
+        """
+        Starts the root coprocess using sudo (password prompt can be shown).
+        Does nothing if it's already running.
+
+        Raises:
+            PermissionError: root privileges weren't granted.
+
+        Returns:
+            PrivilegedSession: object from which this method was invoked.
+        """
+        with self.__lock:
+            if self.is_alive():
+                return self
+            self.process = Popen(
+                ["sudo", "--", sys.executable, "-I", "-c",
+                 _PRIVILEGED_HELPER],
+                stdin=PIPE, stdout=PIPE)
+            if self.process.stdout.read(1) != b"R":
+                self.close()
+                raise PermissionError("Root privileges weren't granted.")
+        return self
 
 
 def force_sudo_password_promt():
     '''Next shell commands with sudo will prompt a password.'''
+    stop_privileged_session()
     shell("sudo -K").wait()
 
 
+def get_privileged_session() -> Union[PrivilegedSession, None]:
+    '''Returns running session started by start_privileged_session().'''
+    session = _privileged_session
+    if session is not None and session.is_alive():
+        return session
+    return None
+
+
 def get_root_privileges():
     """
     Shows sudo password prompt. Returns True if correct password has been
     entered, otherwise returns False (e.g., Ctrl+C was pressed).
     """
+    if get_privileged_session() is not None:
+        return True
     return not shell("sudo true").exit_code()
 
 
@@ -32,9 +635,67 @@ def get_root_privileges_or_exit(exit_code: int = 1):
 
 def has_root_privileges():
     '''Checks if sudo command can be executed without password prompt.'''
+    if get_privileged_session() is not None:
+        return True
     return not shell("sudo -n true").exit_code()
 
 
+def list_columnar(path='.', hidden=True, non_hidden=True,
+                  recursive=False) -> ColumnarListing:
+    """
+    Returns columnar listing of all entries that are located in path. It's
+    filled incrementally from os.scandir() and lstat() results, so only a
+    few bytes per entry are used instead of a Python object per entry.
+    Note: '~' in path is expanded, relative path is relative to
+    get_working_directory().
+
+    Parameters:
+        path (str): directory of needed entries. Default is '.'.
+        hidden (bool): include hidden entries if True. Default is True.
+        non_hidden (bool): include non-hidden entries if True. Default is
+            True.
+        recursive (bool): include entries of subdirectories (symlinks aren't
+            followed, hidden subdirectories are skipped if hidden is False),
+            their names are relative to path. Default is False.
+
+    Raises:
+        TypeError: if path's type isn't str.
+        ValueError: if path isn't an accessible directory.
+
+    Returns:
+        ColumnarListing: listing of entries.
+    """
+    if not isinstance(path, str):
+        raise TypeError("path's type must be str.")
+    if path == '~' or path.startswith("~/"):
+        path = os.path.expanduser('~') + path[1:]
+    path = os.path.join(get_working_directory(), path)
+    listing = ColumnarListing()
+    pending = [(os.fsencode(path), b'')]
+    while pending:
+        dir_path, prefix = pending.pop()
+        try:
+            entries = os.scandir(dir_path)
+        except OSError:
+            if not prefix:
+                raise ValueError("Invalid path.")
+            continue  # Inaccessible subdirectory
+        with entries:
+            for entry in entries:
+                is_hidden = entry.name.startswith(b'.')
+                try:
+                    if (hidden if is_hidden else non_hidden):
+                        listing.append(prefix + entry.name,
+                                       entry.stat(follow_symlinks=False))
+                    if (recursive and (hidden or not is_hidden)
+                            and entry.is_dir(follow_symlinks=False)):
+                        pending.append(
+                            (entry.path, prefix + entry.name + b'/'))
+                except OSError:
+                    pass  # Entry has been removed
+    return listing
+
+
 def list_dirs(path='.', hidden=True, non_hidden=True, with_errors=False):
     """
     Returns list of accessible directories that are located in path. Also
@@ -58,13 +719,7 @@ def list_dirs(path='.', hidden=True, non_hidden=True, with_errors=False):
     """
     if not isinstance(path, str):
         raise TypeError("path's type must be str.")
-    path = expose_tilde(quotes_wrapper(path))
-    path = re.sub(r'(?<=[^\\])\*', '"*"', path)  # Expose wildcard (*)
-    path = re.sub(r'\\\*', '*', path)  # Preserve '*'
-    paths = shell(f"ls -d -- {path}").get_lines()
-    if len(paths) != 1:
-        raise ValueError("Invalid path.")
-    path = paths[0]
+    path = _resolve_path(path)
     process = shell(Rf"ls -ALp {path} | grep / | sed 's|/||'")
     dirs = process.get_lines()
     if not hidden:
@@ -97,13 +752,7 @@ def list_files(path='.', hidden=True, non_hidden=True, with_errors=False):
     """
     if not isinstance(path, str):
         raise TypeError("path's type must be str.")
-    path = expose_tilde(quotes_wrapper(path))
-    path = re.sub(r'(?<=[^\\])\*', '"*"', path)  # Expose wildcard (*)
-    path = re.sub(r'\\\*', '*', path)  # Preserve '*'
-    paths = shell(f"ls -d -- {path}").get_lines()
-    if len(paths) != 1:
-        raise ValueError("Invalid path.")
-    path = paths[0]
+    path = _resolve_path(path)
     process = shell(Rf"ls -ALp {path} | grep -v /")
     files = process.get_lines()
     if not hidden:
@@ -113,3 +762,103 @@ def list_files(path='.', hidden=True, non_hidden=True, with_errors=False):
     if with_errors:
         return (files, process.error_output())
     return files
+
+
+def start_privileged_session() -> PrivilegedSession:
+    """
+    Starts root coprocess (sudo password prompt can be shown) which will be
+    used by all sudo=True wrappers from gnu_coreutils and by
+    has_root_privileges()/get_root_privileges() instead of invoking sudo.
+
+    Raises:
+        PermissionError: root privileges weren't granted.
+
+    Returns:
+        PrivilegedSession: started session.
+    """
+    global _privileged_session
+    session = get_privileged_session()
+    if session is None:
+        session = PrivilegedSession().start()
+        _privileged_session = session
+    return session
+
+
+def stop_privileged_session():
+    '''Shuts down session started by start_privileged_session() (if any).'''
+    global _privileged_session
+    session, _privileged_session = _privileged_session, None
+    if session is not None:
+        session.close()
+
+
+def sync(source_path: str, destination_path: str, delete=False,
+         checksum=False, jobs=None, dry_run=False) -> CompletedShell:
+    """
+    Synchronizes destination directory with source directory in-process
+    (like "rsync -a source_path/ destination_path/"). Trees are compared by
+    type, size and modification time (or by content hash) and only changed
+    files are copied with the fastest available method (reflink,
+    copy_file_range(), sendfile() or buffered copy) by a thread pool.
+    Metadata is preserved, so next sync() skips already copied files. Like
+    rsync, a file is copied to a temporary file in the same directory which
+    then replaces the old one (hardlinks of the old file aren't changed).
+    Note: '~' in paths is expanded, relative paths are relative to
+    get_working_directory(). Symlinks are copied as symlinks.
+
+    Parameters:
+        source_path (str): source directory.
+        destination_path (str): destination directory (created if missing).
+        delete (bool): remove entries of destination that don't exist in
+            source. Default is False.
+        checksum (bool): compare files of the same size by content hash
+            instead of modification time. Default is False.
+        jobs (int | None): amount of threads that compare and copy files.
+            Default is None (amount of CPUs).
+        dry_run (bool): don't change anything, only return the plan. Default
+            is False.
+
+    Raises:
+        TypeError: source_path's or destination_path's type isn't str or
+            jobs' type isn't (int | None).
+        ValueError: jobs is less than 1, source_path isn't a directory,
+            destination_path isn't a directory or one of the paths is
+            inside another.
+
+    Returns:
+        CompletedShell: result with the plan in stdout ("delete", "mkdir",
+        "copy" or "update" (metadata only) and path relative to
+        destination_path per line), "copied", "bytes", "created", "updated",
+        "deleted" and "unchanged" stats and per-path errors (see errors).
+        Its command is a description of the call (e.g., "sync('/a', '/b',
+        delete=False, checksum=False, dry_run=False)").
+    """
+    if not isinstance(source_path, str):
+        raise TypeError("source_path's type must be str.")
+    if not isinstance(destination_path, str):
+        raise TypeError("destination_path's type must be str.")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if type(jobs) != int:
+        raise TypeError("jobs' type must be int.")
+    if jobs < 1:
+        raise ValueError("jobs must be greater than 0.")
+    source = os.path.join(get_working_directory(),
+                          _native.expand_tilde(source_path))
+    destination = os.path.join(get_working_directory(),
+                               _native.expand_tilde(destination_path))
+    if not os.path.isdir(source) or (os.path.lexists(destination) and
+                                     not os.path.isdir(destination)):
+        raise ValueError("Invalid path.")
+    real_source = os.path.realpath(source) + '/'
+    real_destination = os.path.realpath(destination) + '/'
+    if (real_source != real_destination and
+            (real_source.startswith(real_destination) or
+             real_destination.startswith(real_source))):
+        raise ValueError("source_path and destination_path can't be inside "
+                         "each other.")
+    # No process is executed, so the call itself is reported as command
+    command = (f"sync({source!r}, {destination!r}, delete={delete}, "
+               f"checksum={checksum}, dry_run={dry_run})")
+    return _native.sync(source, destination, delete, checksum, dry_run,
+                        jobs, command)
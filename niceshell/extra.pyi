@@ -1,14 +1,87 @@
-from typing import List, Tuple, Union
+from array import array
+from os import stat_result
+from subprocess import Popen
+from typing import Iterable, Iterator, List, Tuple, Union
 
+from .core import CompletedShell
 from .extra import *
 
 
+class ColumnarListing:
+    COLUMNS: Tuple[str, ...]
+    size: array
+    mtime: array
+    mode: array
+    inode: array
+    names: bytearray
+    name_offsets: array
+
+    def __init__(self) -> None: ...
+    def __len__(self) -> int: ...
+    def append(self, name: bytes, st: stat_result) -> None: ...
+    def argsort(self, key: str = "name", reverse: bool = False) -> array: ...
+    def filter(self, mask: Iterable[bool]) -> ColumnarListing: ...
+    def iter_names(self) -> Iterator[str]: ...
+    def name(self, index: int) -> str: ...
+
+    def sort(self,
+             key: str = "name",
+             reverse: bool = False) -> ColumnarListing: ...
+
+    def take(self, indices: Iterable[int]) -> ColumnarListing: ...
+    def to_numpy(self) -> dict: ...
+
+
+class ListingCache:
+    max_dirs: int
+
+    def __init__(self, max_dirs: int = 128) -> None: ...
+    def __del__(self) -> None: ...
+    def __enter__(self) -> ListingCache: ...
+    def __exit__(self, exc_type, exc_value, traceback) -> None: ...
+    def close(self) -> None: ...
+
+    def list_dirs(self,
+                  path: str = '.',
+                  hidden: bool = True,
+                  non_hidden: bool = True) -> List[str]: ...
+
+    def list_files(self,
+                   path: str = '.',
+                   hidden: bool = True,
+                   non_hidden: bool = True) -> List[str]: ...
+
+
+class PrivilegedSession:
+    process: Union[Popen, None]
+
+    def __init__(self) -> None: ...
+    def __enter__(self) -> PrivilegedSession: ...
+    def __exit__(self, exc_type, exc_value, traceback) -> None: ...
+    def close(self) -> None: ...
+    def is_alive(self) -> bool: ...
+
+    def run(self,
+            command: Union[str, Iterable[str]],
+            cwd: Union[str, None] = None) -> CompletedShell: ...
+
+    def start(self) -> PrivilegedSession: ...
+
+
 def force_sudo_password_promt() -> None: ...
+def get_privileged_session() -> Union[PrivilegedSession, None]: ...
 def get_root_privileges() -> bool: ...
 def get_root_privileges_or_exit(exit_code: int) -> None: ...
 def has_root_privileges() -> bool: ...
 
 
+def list_columnar(
+    path: str = '.',
+    hidden: bool = True,
+    non_hidden: bool = True,
+    recursive: bool = False) -> ColumnarListing: ...
+
+
 def list_dirs(
     path: str = '.',
     hidden: bool = True,
@@ -21,3 +94,15 @@ def list_files(
     hidden: bool = True,
     non_hidden: bool = True,
     with_errors: bool = False) -> Union[List[str], Tuple[List[str], str]]: ...
+
+
+def start_privileged_session() -> PrivilegedSession: ...
+def stop_privileged_session() -> None: ...
+
+
+def sync(source_path: str,
+         destination_path: str,
+         delete: bool = False,
+         checksum: bool = False,
+         jobs: Union[int, None] = None,
+         dry_run: bool = False) -> CompletedShell: ...
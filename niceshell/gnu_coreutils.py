@@ -1,21 +1,157 @@
+import json
+import os
+import stat
+from inspect import cleandoc
 from os import chdir
-from typing import Iterable, Union
+from typing import Iterable, Iterator, List, Union
+from uuid import uuid4
 
 import regex as re
 
+from . import _native
 from .core import *
+from .core import _get_cwd, _needs_shell, _set_thread_cwd
+from .extra import get_privileged_session
 
-__all__ = ["cd", "cp", "ln", "ls", "mv", "pwd", "rm"]
+__all__ = ["cd", "cp", "find", "journaled_batch", "ln", "ls", "ls_entries",
+           "LsEntry", "mv", "pwd", "rm", "Script"]
+
+_CP_NATIVE_ARGS = {'a': "archive", 'd': "no-dereference", 'f': "force",
+                   'H': "dereference-command-line", 'L': "dereference",
+                   'n': "no-clobber", 'P': "no-dereference", 'p': "preserve",
+                   'R': "recursive", 'r': "recursive"}
+_FIND_SIZE_UNITS = {'': 512, 'b': 512, 'c': 1, 'w': 2, 'k': 1024,
+                    'M': 1024 ** 2, 'G': 1024 ** 3}
+_MV_NATIVE_ARGS = {'b': "backup", 'f': "force", 'n': "no-clobber",
+                   'S': "suffix"}
+_LS_SORT_KEYS = {
+    "name": lambda entry: entry.name,
+    "none": None,
+    "size": lambda entry: (-entry.size, entry.name),
+    "time": lambda entry: (-entry.mtime, entry.name),
+}
+_RM_NATIVE_ARGS = {'d': "dir", 'f': "force", 'R': "recursive",
+                   'r': "recursive"}
+
+
+class LsEntry:
+    """
+    Lightweight record of directory entry returned by ls_entries().
+
+    Attributes:
+        name (str): name of the entry.
+        path (str): path of the entry.
+        type (str): type character as in ls -l ('-', 'd', 'l', 'p', 's', 'c'
+            or 'b').
+        size (int): size in bytes.
+        mode (int): permission bits (and file type bits) aka st_mode.
+        mtime (float): time of last modification (seconds since epoch).
+        inode (int): inode number.
+        link_target (str | None): target of symlink (None if not symlink).
+    """
+    __slots__ = ("inode", "link_target", "mode", "mtime", "name", "path",
+                 "size", "type")
+
+    def __init__(self, name: str, path: str, st: os.stat_result):
+        self.name = name
+        self.path = path
+        self.type = stat.filemode(st.st_mode)[0]
+        self.size = st.st_size
+        self.mode = st.st_mode
+        self.mtime = st.st_mtime
+        self.inode = st.st_ino
+        self.link_target = None
+        if self.type == 'l':
+            try:
+                self.link_target = os.readlink(path)
+            except OSError:
+                pass
+
+    def __repr__(self) -> str:
+        return f"LsEntry(name={self.name!r}, type={self.type!r})"
+
+
+def _chdir(path: str):
+    # Changes working directory of the thread inside working_directory()
+    # (see core) or of the whole process otherwise
+    if not os.path.isdir(os.path.join(get_working_directory(), path)):
+        raise NotADirectoryError(path)
+    if not _set_thread_cwd(path):
+        chdir(path)
+
+
+def _execute(command: str, sudo: str, cwd=None, env=None,
+             env_update=None) -> Shell:
+    session = get_privileged_session()
+    if sudo and session is not None and env is None and env_update is None:
+        # Root coprocess is used instead of sudo (its result is wrapped, so
+        # the same Shell interface is returned with or without session)
+        return Shell._from_completed(
+            session.run(command[len("sudo "):], _get_cwd(cwd)))
+    return Shell(command, cwd=cwd, env=env, env_update=env_update)
+
+
+def _native_paths(paths: List[str], cwd=None) -> List[str]:
+    # Relative paths of native operations are relative to cwd of the command
+    cwd = _get_cwd(cwd)
+    paths = [_native.expand_tilde(path) for path in paths]
+    if cwd is None:
+        return paths
+    return [os.path.join(cwd, path) for path in paths]
+
+
+def _is_finished(operation: str, path: str, destination_path, cwd) -> bool:
+    # Checks if mv/rm of path has been done (e.g., before a crash)
+    path = _native_paths([path], cwd)[0]
+    if operation == "cp" or os.path.lexists(path):
+        return False
+    if operation == "rm":
+        return True
+    destination = _native_paths([destination_path], cwd)[0]
+    if os.path.isdir(destination):
+        destination = os.path.join(destination,
+                                   os.path.basename(path.rstrip('/')))
+    return os.path.lexists(destination)
+
+
+def _read_journal(path: str, header: dict) -> Union[set, None]:
+    # Returns journaled paths or None if journal doesn't exist. Line that
+    # was interrupted (by a crash) is terminated, so new lines are intact.
+    try:
+        with open(path, "rb") as file:
+            lines = file.read().split(b'\n')
+    except FileNotFoundError:
+        return None
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line.decode("ascii")))
+        except ValueError:
+            pass  # Interrupted line
+    if not entries or entries[0] != header:
+        raise ValueError("Journal belongs to another operation.")
+    if lines[-1]:
+        with open(path, "ab") as file:
+            file.write(b'\n')
+    return set(entries[1:])
 
 
 def cd(path: str = '',
        short_args: Union[str, Iterable[str]] = [],
-       test=False) -> Union[Shell, str]:
+       test=False,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, str]:
     R"""
     Wrapper for cd command from GNU Core Utilities.
     Note: Path will be wrapped in quotes, but '~' will still work (will
     be expanded) as well as wildcard (*). To treat '*' as normal character put
-    backslash before it. This function changes directory using os.chdir().
+    backslash before it. This function changes directory using os.chdir()
+    (or changes working directory of the thread inside working_directory()).
+    Without short_args wildcards are expanded in-process (see
+    expand_wildcards()) and the shell is used only if that fails or if path
+    contains ".." (the shell resolves it logically, e.g. "link/.." is the
+    directory of link). Returned Shell is already finished in both cases.
 
     Parameters:
         path (str): directory that needs to be a new cwd aka present/current
@@ -24,15 +160,23 @@ def cd(path: str = '',
             Prefix-dash is ignored. Default is [] (no short arguments).
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
         TypeError: path's type isn't str.
 
     Returns:
-        (Shell | str): Shell object of executing command or the command itself.
+        (Shell | str): Shell object of executing command or the command
+        itself.
     """
     if not isinstance(path, str):
         raise TypeError("path's type must be str.")
+    raw_path = path
     if path:
         path = expose_tilde(quotes_wrapper(path))
         path = re.sub(r'(?<=[^\\])\*', '"*"', path)  # Expose wildcard (*)
@@ -42,12 +186,26 @@ def cd(path: str = '',
     if test:
         return command
     else:
-        process = Shell(command)
+        # CDPATH, "-" and shell expansions are left to the shell.
+        if (not args and raw_path not in ('', '-') and cwd is None and
+                env is None and env_update is None and
+                "CDPATH" not in os.environ and not _needs_shell(raw_path) and
+                ".." not in raw_path.split('/')):
+            paths = expand_wildcards(raw_path)
+            if len(paths) == 1:
+                try:
+                    _chdir(paths[0])
+                    return Shell._from_completed(
+                        CompletedShell(command, None, 0))
+                except OSError:
+                    pass  # Error message is produced by the shell
+        process = Shell(command, cwd=cwd, env=env, env_update=env_update)
         if process.exit_code() == 0:
             # Necessary if wildcard is present in path
-            process2 = Shell(command + '; echo "|$PWD|"')
+            process2 = Shell(command + '; echo "|$PWD|"', cwd=cwd, env=env,
+                             env_update=env_update)
             new_pwd = process2.output().split('|')[-2]
-            chdir(new_pwd)
+            _chdir(new_pwd)
         return process
 
 
@@ -57,13 +215,29 @@ def cp(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch=False,
        sudo=False,
-       test=False) -> Union[Shell, str]:
+       test=False,
+       jobs=None,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, CompletedShell, str]:
     """
     Wrapper for cp command from GNU Core Utilities.
     Note: destination_path is always wrapped in quotes. If source_path and/or
     destination_path are/is wrapped in quotes (batch=False), '~' will still
     work (will be expanded).
 
+    If jobs is provided then files are copied natively (without cp process)
+    by a thread pool. Directory structure is created first. File data is
+    copied in the kernel when possible (reflink, copy_file_range(),
+    sendfile()).
+    Supported arguments: -a, -d, -f, -H, -L, -n, -P, -p, -R, -r, their long
+    counterparts, --preserve[=ATTR_LIST] (mode, ownership, timestamps, links,
+    xattr, all; first three are always preserved together) and
+    --reflink[=auto|always|never] (default is auto). Like cp, -a preserves
+    hardlinks (between copied files) and extended attributes.
+    Returned CompletedShell has "files", "bytes" and "bytes_per_second" stats
+    and per-file errors.
+
     Parameters:
         source_path (str | Iterable[str]): file(s) and/or directory(-ies) that
             is/are need to be copied.
@@ -74,16 +248,29 @@ def cp(source_path: Union[str, Iterable[str]],
             ignored. Default is [] (no long arguments).
         batch (bool): wraps source_path in double quotes if False. Default is
             False.
-        sudo (bool): adds sudo at the begining of cp command. Default is False.
+        sudo (bool): adds sudo at the begining of cp command (or uses started
+            privileged session). Default is False.
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        jobs (int | None): amount of threads that copy files natively.
+            Default is None (cp process is used).
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
         TypeError: source_path's type isn't (str | Iterable[str]) or
-            destination_path's type isn't str.
+            destination_path's type isn't str or jobs' type isn't int.
+        ValueError: jobs is less than 1 or is used with batch/sudo or with
+            unsupported argument (or invalid value of --preserve or
+            --reflink).
 
     Returns:
-        (Shell | str): Shell object of executing command or the command itself.
+        (Shell | CompletedShell | str): Shell object of executing command
+        (CompletedShell if jobs was provided) or the command itself.
     """
     if (not isinstance(source_path, (str, Iterable)) or
         not all(isinstance(e, str) for e in source_path) or
@@ -91,6 +278,21 @@ def cp(source_path: Union[str, Iterable[str]],
         raise TypeError("source_path's type must be str or Iterable[str].")
     if not isinstance(destination_path, str):
         raise TypeError("destination_path's type must be str.")
+    if jobs is not None:
+        if type(jobs) != int:
+            raise TypeError("jobs' type must be int.")
+        if jobs < 1:
+            raise ValueError("jobs must be greater than 0.")
+        if batch or sudo:
+            raise ValueError("batch and sudo can't be used with jobs.")
+        native_args = _native.parse_args(
+            short_args, long_args, _CP_NATIVE_ARGS,
+            set(_CP_NATIVE_ARGS.values()) - {"dereference-command-line"} |
+            {"reflink"})
+        sources = [source_path] if isinstance(source_path, str) else list(
+            source_path)
+        sources = _native_paths(sources, cwd)
+        native_destination = _native_paths([destination_path], cwd)[0]
     if batch:
         # Concatenate anything but str (batch)
         if not isinstance(source_path, str):
@@ -104,8 +306,307 @@ def cp(source_path: Union[str, Iterable[str]],
     command = f"{sudo} cp {args} -- {source_path} {destination_path}".strip()
     if test:
         return command
+    elif jobs is not None:
+        return _native.copy(sources, native_destination, native_args, jobs,
+                            command)
     else:
-        return Shell(command)
+        return _execute(command, sudo, cwd, env, env_update)
+
+
+def find(path: Union[str, Iterable[str]] = '.',
+         name: Union[str, None] = None,
+         type: Union[str, None] = None,
+         newer: Union[str, None] = None,
+         size: Union[str, None] = None,
+         maxdepth: Union[int, None] = None,
+         prune: Union[str, Iterable[str]] = [],
+         batch=False,
+         sudo=False,
+         test=False,
+         jobs=None,
+         cwd=None,
+         env=None,
+         env_update=None) -> Union[Shell, Iterator[str], str]:
+    """
+    Wrapper for find command from GNU Find Utilities (symlinks aren't
+    followed). Every provided test must be passed by found entry.
+    Note: If path is wrapped in quotes (batch=False), '~' will still work (will
+    be expanded).
+
+    If jobs is provided then entries are found natively (without find
+    process): predicates are evaluated during os.scandir() traversal,
+    directories are scanned by a thread pool and found paths are yielded
+    lazily (in directory order, but directories can be listed in different
+    order than find lists them). Inaccessible directories are skipped.
+
+    Parameters:
+        path (str | Iterable[str]): starting point(s). Default is '.'.
+        name (str | None): glob pattern of base names (-name). Default is
+            None.
+        type (str | None): type letter(s) separated by comma (-type): b, c,
+            d, f, l, p, s. Default is None.
+        newer (str | None): path of file which modification time needs to be
+            exceeded (-newer). Default is None.
+        size (str | None): size in units (-size): [+|-]N[b|c|w|k|M|G], '+'
+            means greater, '-' means less, default unit is 512-byte block.
+            Sizes are rounded up to units (e.g., "-1M" matches only empty
+            files). Default is None.
+        maxdepth (int | None): maximum depth of entries (-maxdepth, starting
+            points have depth 0). Default is None.
+        prune (str | Iterable[str]): glob pattern(s) of base names of entries
+            which are skipped with their content (-name PATTERN -prune).
+            Default is [] (nothing is skipped).
+        batch (bool): wraps path in double quotes if False. Default is False.
+        sudo (bool): adds sudo at the begining of find command (or uses
+            started privileged session). Default is False.
+        test (bool): return command itself without its execution (for test
+            purposes). Default is False.
+        jobs (int | None): amount of threads that scan directories natively.
+            Default is None (find process is used).
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
+
+    Raises:
+        TypeError: path's type isn't (str | Iterable[str]), prune's type isn't
+            (str | Iterable[str]), name's, type's, newer's or size's type
+            isn't (str | None) or maxdepth's or jobs' type isn't int.
+        ValueError: invalid value of type or size, maxdepth is less than 0,
+            jobs is less than 1 or is used with batch/sudo or path/newer
+            doesn't exist (with jobs).
+
+    Returns:
+        (Shell | Iterator[str] | str): Shell object of executing command,
+        iterator of found paths (if jobs was provided) or the command itself.
+    """
+    if (not isinstance(path, (str, Iterable)) or
+        not all(isinstance(e, str) for e in path) or
+            (not isinstance(path, str) and len(path) == 0)):
+        raise TypeError("path's type must be str or Iterable[str].")
+    if (not isinstance(prune, (str, Iterable)) or
+            not all(isinstance(e, str) for e in prune)):
+        raise TypeError("prune's type must be str or Iterable[str].")
+    for value, value_name in ((name, "name"), (type, "type"),
+                              (newer, "newer"), (size, "size")):
+        if value is not None and not isinstance(value, str):
+            raise TypeError(f"{value_name}'s type must be str or None.")
+    if type is not None and (
+            not all(len(letter) == 1 and letter in "bcdflps"
+                    for letter in type.split(','))):
+        raise ValueError(cleandoc(
+            """Invalid value of type. Valid values are:
+            b, c, d, f, l, p, s (or their comma-separated list)."""))
+    if size is not None:
+        size_match = re.fullmatch(r"([+-]?)(\d+)([bcwkMG]?)", size)
+        if size_match is None:
+            raise ValueError(cleandoc(
+                """Invalid value of size. Valid values are:
+                [+|-]N[b|c|w|k|M|G] (e.g., "+10M")."""))
+    if maxdepth is not None:
+        if not isinstance(maxdepth, int) or isinstance(maxdepth, bool):
+            raise TypeError("maxdepth's type must be int.")
+        if maxdepth < 0:
+            raise ValueError("maxdepth must be greater than or equal to 0.")
+    prune = [prune] if isinstance(prune, str) else list(prune)
+    if jobs is not None:
+        if not isinstance(jobs, int) or isinstance(jobs, bool):
+            raise TypeError("jobs' type must be int.")
+        if jobs < 1:
+            raise ValueError("jobs must be greater than 0.")
+        if batch or sudo:
+            raise ValueError("batch and sudo can't be used with jobs.")
+        paths = [path] if isinstance(path, str) else list(path)
+        starts = list(zip(_native_paths(paths, cwd),
+                          [_native.expand_tilde(path) for path in paths]))
+        if not all(os.path.lexists(start) for start, _ in starts):
+            raise ValueError("Invalid path.")
+        newer_mtime = None
+        if newer is not None:
+            try:
+                newer_mtime = os.lstat(
+                    _native_paths([newer], cwd)[0]).st_mtime_ns
+            except OSError:
+                raise ValueError("Invalid path.")
+        native_size = None
+        if size is not None:
+            sign, amount, unit = size_match.groups()
+            native_size = (sign, int(amount), _FIND_SIZE_UNITS[unit])
+    if batch:
+        # Concatenate anything but str (batch)
+        if not isinstance(path, str):
+            path = ' '.join(path)
+    else:
+        path = expose_tilde(quotes_wrapper(path))
+    sudo = "sudo" if sudo else ''
+    expression = []
+    if maxdepth is not None:
+        expression.append(f"-maxdepth {maxdepth}")
+    if prune:
+        names = " -o ".join(f"-name {shell_quote_many(pattern)}"
+                            for pattern in prune)
+        expression.append(
+            f"\\( {names} \\) -prune -o" if len(prune) > 1 else
+            f"{names} -prune -o")
+    if name is not None:
+        expression.append(f"-name {shell_quote_many(name)}")
+    if type is not None:
+        expression.append(f"-type {type}")
+    if newer is not None:
+        expression.append(f"-newer {expose_tilde(quotes_wrapper(newer))}")
+    if size is not None:
+        expression.append(f"-size {size}")
+    if prune:
+        expression.append("-print")
+    expression = ' '.join(expression)
+    command = f"{sudo} find {path} {expression}".strip()
+    if test:
+        return command
+    elif jobs is not None:
+        return _native.find(starts, name, type and type.replace(',', ''),
+                            newer_mtime, native_size, maxdepth, prune, jobs)
+    else:
+        return _execute(command, sudo, cwd, env, env_update)
+
+
+def journaled_batch(operation: str,
+                    paths: Iterable[str],
+                    journal_path: str,
+                    destination_path: Union[str, None] = None,
+                    short_args: Union[str, Iterable[str]] = [],
+                    long_args: Iterable[str] = [],
+                    chunk=1000,
+                    sudo=False,
+                    cwd=None,
+                    env=None,
+                    env_update=None) -> CompletedShell:
+    """
+    Resumable batch cp/mv/rm: paths are processed in chunks (a single
+    cp()/mv()/rm() per chunk) and completed ones are recorded in an
+    append-only journal (JSON lines, synced after every chunk). If the
+    journal already exists (e.g., previous run was interrupted) then
+    journaled paths are skipped, so it's safe to run the same batch again.
+    Items of a failed chunk are retried one by one. mv/rm of paths that
+    don't exist anymore (but their destination does for mv) are considered
+    done. Note: paths are literal (wildcards aren't expanded), but '~' still
+    works.
+
+    Parameters:
+        operation (str): "cp", "mv" or "rm".
+        paths (Iterable[str]): file(s) and/or directory(-ies) that need to be
+            processed.
+        journal_path (str): path of the journal (it's created if needed),
+            relative path is relative to cwd.
+        destination_path (str | None): destination directory of cp and mv.
+            Default is None (rm).
+        short_args (str | Iterable[str]): string or array of short arguments.
+            Prefix-dash is ignored. Default is [] (no short arguments).
+        long_args (Iterable[str]): array of long arguments. Prefix-dashes are
+            ignored. Default is [] (no long arguments).
+        chunk (int): maximum amount of paths per command. Default is 1000.
+        sudo (bool): adds sudo at the begining of commands (or uses started
+            privileged session). Default is False.
+        cwd (str | None): working directory of commands (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of commands. Default is
+            None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for commands. Default is None.
+
+    Raises:
+        TypeError: paths' type isn't Iterable[str] or journal_path's type
+            isn't str or destination_path's type isn't (str | None) or
+            chunk's type isn't int.
+        ValueError: invalid value of operation or destination_path is
+            missing (cp, mv) or provided (rm) or chunk is less than 1.
+        ValueError: journal belongs to another operation.
+
+    Returns:
+        CompletedShell: result with "done" (paths processed by this call),
+        "skipped" (paths which were done before) and "failed" stats and with
+        per-path errors (their stderr is the error output).
+    """
+    if operation not in ("cp", "mv", "rm"):
+        raise ValueError(cleandoc(
+            """Invalid value of operation. Valid values are:
+            "cp", "mv", "rm"."""))
+    if isinstance(paths, str) or not isinstance(paths, Iterable):
+        raise TypeError("paths' type must be Iterable[str].")
+    paths = list(dict.fromkeys(paths))
+    if not all(isinstance(path, str) for path in paths):
+        raise TypeError("paths' type must be Iterable[str].")
+    if not isinstance(journal_path, str):
+        raise TypeError("journal_path's type must be str.")
+    if destination_path is not None and not isinstance(destination_path, str):
+        raise TypeError("destination_path's type must be str or None.")
+    if (operation == "rm") != (destination_path is None):
+        raise ValueError("destination_path must be used only with cp and mv.")
+    if type(chunk) != int:
+        raise TypeError("chunk's type must be int.")
+    if chunk < 1:
+        raise ValueError("chunk must be greater than 0.")
+    function = {"cp": cp, "mv": mv, "rm": rm}[operation]
+    arguments = (short_args, long_args)
+    if destination_path is not None:
+        arguments = (destination_path,) + arguments
+    header = {"operation": operation, "destination_path": destination_path}
+    journal_path = _native_paths([journal_path], cwd)[0]
+    journaled = _read_journal(journal_path, header)
+    pending = paths if journaled is None else [
+        path for path in paths if path not in journaled]
+    stats = {"done": 0, "skipped": len(paths) - len(pending), "failed": 0}
+    errors = []
+    messages = []
+
+    def execute(items: List[str]) -> CompletedShell:
+        process = function(shell_quote_many(items, True), *arguments,
+                           batch=True, sudo=sudo, cwd=cwd, env=env,
+                           env_update=env_update)
+        return process.finish()
+
+    with open(journal_path, "ab") as journal:
+        if journaled is None:
+            journal.write(json.dumps(header).encode("ascii") + b'\n')
+
+        def record(items: List[str]):
+            journal.write(b''.join(json.dumps(item).encode("ascii") + b'\n'
+                                   for item in items))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        # E.g., moved or removed right before the journal was synced
+        finished = [path for path in pending if _is_finished(
+            operation, path, destination_path, cwd)]
+        if finished:
+            record(finished)
+            stats["skipped"] += len(finished)
+            finished = set(finished)
+            pending = [path for path in pending if path not in finished]
+        for i in range(0, len(pending), chunk):
+            items = pending[i:i + chunk]
+            if execute(items).exit_code() == 0:
+                record(items)
+                stats["done"] += len(items)
+                continue
+            for item in items:  # Find out which items have failed
+                if _is_finished(operation, item, destination_path, cwd):
+                    result = None
+                else:
+                    result = execute([item])
+                if result is None or result.exit_code() == 0:
+                    record([item])
+                    stats["done"] += 1
+                else:
+                    message = result.error_output().rstrip('\n')
+                    errors.append((item, OSError(message)))
+                    messages.append(message)
+                    stats["failed"] += 1
+    stderr = ''.join(f"{message}\n" for message in messages)
+    return CompletedShell(operation, None, 1 if errors else 0, b'',
+                          stderr.encode("utf-8", "surrogateescape"), stats,
+                          errors)
 
 
 def ln(source_path: Union[str, Iterable[str]],
@@ -114,7 +615,10 @@ def ln(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch=False,
        sudo=False,
-       test=False) -> Union[Shell, str]:
+       test=False,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, str]:
     """
     Wrapper for ln command from GNU Core Utilities.
     Note: destination_path is always wrapped in quotes. If source_path and/or
@@ -131,9 +635,16 @@ def ln(source_path: Union[str, Iterable[str]],
             ignored. Default is [] (no long arguments).
         batch (bool): wraps source_path in double quotes if False. Default is
             False.
-        sudo (bool): adds sudo at the begining of ln command. Default is False.
+        sudo (bool): adds sudo at the begining of ln command (or uses started
+            privileged session). Default is False.
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
         TypeError: source_path's type isn't (str | Iterable[str]) or
@@ -162,7 +673,7 @@ def ln(source_path: Union[str, Iterable[str]],
     if test:
         return command
     else:
-        return Shell(command)
+        return _execute(command, sudo, cwd, env, env_update)
 
 
 def ls(path: Union[str, Iterable[str]] = '',
@@ -170,7 +681,11 @@ def ls(path: Union[str, Iterable[str]] = '',
        long_args: Iterable[str] = [],
        batch=False,
        sudo=False,
-       test=False) -> Union[Shell, str]:
+       test=False,
+       cache_ttl=None,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, CompletedShell, str]:
     """
     Wrapper for ls command from GNU Core Utilities.
     Note: If path is wrapped in quotes (batch=False), '~' will still work (will
@@ -184,15 +699,27 @@ def ls(path: Union[str, Iterable[str]] = '',
         long_args (Iterable[str]): array of long arguments. Prefix-dashes are
             ignored. Default is [] (no long arguments).
         batch (bool): wraps path in double quotes if False. Default is False.
-        sudo (bool): adds sudo at the begining of ls command. Default is False.
+        sudo (bool): adds sudo at the begining of ls command (or uses started
+            privileged session). Default is False.
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        cache_ttl (int | float | None): return result of the same command
+            (in the same cwd) that has been executed less than cache_ttl
+            seconds ago (see cached_shell()). Ignored if sudo is True.
+            Default is None (no caching).
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
         TypeError: path's type isn't (str | Iterable[str]).
 
     Returns:
-        (Shell | str): Shell object of executing command or the command itself.
+        (Shell | CompletedShell | str): Shell object of executing command
+        (CompletedShell if cache_ttl was used) or the command itself.
     """
     if (not isinstance(path, (str, Iterable)) or
             not all(isinstance(e, str) for e in path)):
@@ -210,8 +737,81 @@ def ls(path: Union[str, Iterable[str]] = '',
     command = f"{sudo} ls {args} -- {path}".strip()
     if test:
         return command
+    elif cache_ttl is not None and not sudo:
+        return cached_shell(command, ttl=cache_ttl, cwd=cwd, env=env,
+                            env_update=env_update)
     else:
-        return Shell(command)
+        return _execute(command, sudo, cwd, env, env_update)
+
+
+def ls_entries(path='.', recursive=False, sort="name", reverse=False,
+               hidden=False) -> List["LsEntry"]:
+    """
+    Structured alternative to ls(): returns entries of the directory
+    gathered with os.scandir() and lstat() (without spawning a process).
+    If path isn't a directory then its own entry is returned.
+    Note: '~' in path is expanded, relative path is relative to
+    get_working_directory(). Names are sorted by code points (not by locale).
+
+    Parameters:
+        path (str): directory of which content is need to be gathered.
+            Default is '.'.
+        recursive (bool): include content of subdirectories (like ls -R,
+            symlinks aren't followed). Default is False.
+        sort (str): "name", "time" (newest first, like ls -t), "size" (largest
+            first, like ls -S) or "none" (directory order, like ls -U).
+            Entries are sorted within each directory. Default is "name".
+        reverse (bool): reverse sort order (like ls -r). Default is False.
+        hidden (bool): include hidden entries (like ls -A). Default is False.
+
+    Raises:
+        TypeError: path's type isn't str.
+        ValueError: path doesn't exist or invalid value of sort.
+
+    Returns:
+        List[LsEntry]: entries of the directory.
+    """
+    if not isinstance(path, str):
+        raise TypeError("path's type must be str.")
+    if sort not in _LS_SORT_KEYS:
+        raise ValueError(cleandoc(
+            """Invalid value of sort. Valid values are:
+            "name", "time", "size", "none"."""))
+    path = _native_paths([path])[0]
+    try:
+        st = os.lstat(path)
+    except OSError:
+        raise ValueError("Invalid path.")
+    if not stat.S_ISDIR(st.st_mode) and not os.path.isdir(path):
+        return [LsEntry(os.path.basename(path), path, st)]
+    key = _LS_SORT_KEYS[sort]
+    result = []
+    pending = [path]
+    while pending:
+        dir_path = pending.pop()
+        entries = []
+        try:
+            with os.scandir(dir_path) as dir_entries:
+                for entry in dir_entries:
+                    if not hidden and entry.name.startswith('.'):
+                        continue
+                    try:
+                        entries.append(LsEntry(
+                            entry.name, entry.path,
+                            entry.stat(follow_symlinks=False)))
+                    except OSError:
+                        pass  # Entry has been removed
+        except OSError:
+            continue  # Inaccessible subdirectory
+        if key is not None:
+            entries.sort(key=key)
+        if reverse:
+            entries.reverse()
+        result.extend(entries)
+        if recursive:
+            pending.extend(entry.path for entry in reversed(entries)
+                           if entry.type == 'd')
+    return result
 
 
 def mv(source_path: Union[str, Iterable[str]],
@@ -220,13 +820,23 @@ def mv(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch=False,
        sudo=False,
-       test=False) -> Union[Shell, str]:
+       test=False,
+       native=False,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, CompletedShell, str]:
     """
     Wrapper for mv command from GNU Core Utilities.
     Note: destination_path is always wrapped in quotes. If source_path and/or
     destination_path are/is wrapped in quotes (batch=False), '~' will still
     work (will be expanded).
 
+    If native=True then paths are moved without mv process: each path on
+    the same filesystem is renamed relative to opened directories (single
+    rename()), other paths are copied and then removed. Supported arguments:
+    -b, -f, -n, -S and their long counterparts. Returned CompletedShell has
+    "moved" and "copied" stats and per-path errors.
+
     Parameters:
         source_path (str | Iterable[str]): file(s) and/or directory(-ies) that
             is/are need to be moved/renamed.
@@ -237,16 +847,27 @@ def mv(source_path: Union[str, Iterable[str]],
             ignored. Default is [] (no long arguments).
         batch (bool): wraps source_path in double quotes if False. Default is
             False.
-        sudo (bool): adds sudo at the begining of mv command. Default is False.
+        sudo (bool): adds sudo at the begining of mv command (or uses started
+            privileged session). Default is False.
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        native (bool): move paths without mv process. Default is False.
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
         TypeError: source_path's type isn't (str | Iterable[str]) or
             destination_path's type isn't str.
+        ValueError: native=True is used with batch/sudo or with unsupported
+            argument.
 
     Returns:
-        (Shell | str): Shell object of executing command or the command itself.
+        (Shell | CompletedShell | str): Shell object of executing command
+        (CompletedShell if native=True) or the command itself.
     """
     if (not isinstance(source_path, (str, Iterable)) or
         not all(isinstance(e, str) for e in source_path) or
@@ -254,6 +875,16 @@ def mv(source_path: Union[str, Iterable[str]],
         raise TypeError("source_path's type must be str or Iterable[str].")
     if not isinstance(destination_path, str):
         raise TypeError("destination_path's type must be str.")
+    if native:
+        if batch or sudo:
+            raise ValueError("batch and sudo can't be used with native=True.")
+        native_args = _native.parse_args(
+            short_args, long_args, _MV_NATIVE_ARGS,
+            _MV_NATIVE_ARGS.values())
+        sources = [source_path] if isinstance(source_path, str) else list(
+            source_path)
+        sources = _native_paths(sources, cwd)
+        native_destination = _native_paths([destination_path], cwd)[0]
     if batch:
         # Concatenate anything but str (batch)
         if not isinstance(source_path, str):
@@ -267,12 +898,18 @@ def mv(source_path: Union[str, Iterable[str]],
     command = f"{sudo} mv {args} -- {source_path} {destination_path}".strip()
     if test:
         return command
+    elif native:
+        return _native.move(sources, native_destination, native_args, command)
     else:
-        return Shell(command)
+        return _execute(command, sudo, cwd, env, env_update)
 
 
 def pwd(short_args: Union[str, Iterable[str]] = [],
-        test=False) -> Union[str, Shell]:
+        test=False,
+        cache_ttl=None,
+        cwd=None,
+        env=None,
+        env_update=None) -> Union[str, Shell, CompletedShell]:
     """
     Returns present/current working directory (str) if no parameters have been
     passed, otherwise returns Shell object.
@@ -282,17 +919,31 @@ def pwd(short_args: Union[str, Iterable[str]] = [],
             Prefix-dash is ignored. Default is [] (no short arguments).
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        cache_ttl (int | float | None): reuse result of the same command (in
+            the same cwd) that has been executed less than cache_ttl seconds
+            ago (see cached_shell()). Default is None (no caching).
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Returns:
-        Union[str, Shell]: PWD string if called without parameters, otherwise
-            Shell object.
+        Union[str, Shell, CompletedShell]: PWD string if called without
+            parameters, otherwise Shell object (CompletedShell if cache_ttl
+            was used).
     """
     args = normalize_short_and_long_args(short_args, [], ShortArgsOption.APART)
     command = f"pwd {args} --"
     if test:
         return command
     else:
-        process = Shell(command)
+        if cache_ttl is not None:
+            process = cached_shell(command, ttl=cache_ttl, cwd=cwd, env=env,
+                                   env_update=env_update)
+        else:
+            process = Shell(command, cwd=cwd, env=env, env_update=env_update)
         if short_args == []:
             return process.output()[:-1]
         return process
@@ -303,12 +954,22 @@ def rm(path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch=False,
        sudo=False,
-       test=False) -> Union[Shell, str]:
+       test=False,
+       jobs=None,
+       cwd=None,
+       env=None,
+       env_update=None) -> Union[Shell, CompletedShell, str]:
     """
     Wrapper for rm command from GNU Core Utilities.
     Note: If path is wrapped in quotes (batch=False), '~' will still work (will
     be expanded).
 
+    If jobs is provided then paths are removed natively (without rm process):
+    directory trees are removed relative to opened directories (symlinks
+    aren't followed) by a thread pool. Supported arguments: -d, -f, -R, -r,
+    their long counterparts and --[no-]preserve-root ('/' isn't removed by
+    default). Returned CompletedShell has "removed" stat and per-path errors.
+
         source_path (str | Iterable[str]): file(s) and/or directory(-ies) that
             is/are need to be removed.
     Parameters:
@@ -319,20 +980,46 @@ def rm(path: Union[str, Iterable[str]],
         long_args (Iterable[str]): array of long arguments. Prefix-dashes are
             ignored. Default is [] (no long arguments).
         batch (bool): wraps path in double quotes if False. Default is False.
-        sudo (bool): adds sudo at the begining of rm command. Default is False.
+        sudo (bool): adds sudo at the begining of rm command (or uses started
+            privileged session). Default is False.
         test (bool): return command itself without its execution (for test
             purposes). Default is False.
+        jobs (int | None): amount of threads that remove paths natively.
+            Default is None (rm process is used).
+        cwd (str | None): working directory of the command (relative to
+            get_working_directory()). Default is None.
+        env (Mapping[str, str] | None): environment of the command. Default
+            is None (os.environ).
+        env_update (Mapping[str, str | None] | None): variables that are set
+            (or unset if value is None) for the command. Default is None.
 
     Raises:
-        TypeError: path's type isn't (str | Iterable[str]).
+        TypeError: path's type isn't (str | Iterable[str]) or jobs' type isn't
+            int.
+        ValueError: jobs is less than 1 or is used with batch/sudo or with
+            unsupported argument.
 
     Returns:
-        (Shell | str): Shell object of executing command or the command itself.
+        (Shell | CompletedShell | str): Shell object of executing command
+        (CompletedShell if jobs was provided) or the command itself.
     """
     if (not isinstance(path, (str, Iterable)) or
         not all(isinstance(e, str) for e in path) or
             (not isinstance(path, str) and len(path) == 0)):
         raise TypeError("path's type must be str or Iterable[str].")
+    if jobs is not None:
+        if type(jobs) != int:
+            raise TypeError("jobs' type must be int.")
+        if jobs < 1:
+            raise ValueError("jobs must be greater than 0.")
+        if batch or sudo:
+            raise ValueError("batch and sudo can't be used with jobs.")
+        native_args = _native.parse_args(
+            short_args, long_args, _RM_NATIVE_ARGS,
+            set(_RM_NATIVE_ARGS.values()) | {"preserve-root",
+                                             "no-preserve-root"})
+        paths = [path] if isinstance(path, str) else list(path)
+        paths = _native_paths(paths, cwd)
     if batch:
         # Concatenate anything but str (batch)
         if not isinstance(path, str):
@@ -345,5 +1032,126 @@ def rm(path: Union[str, Iterable[str]],
     command = f"{sudo} rm {args} -- {path}".strip()
     if test:
         return command
+    elif jobs is not None:
+        return _native.remove(paths, native_args, jobs, command)
     else:
-        return Shell(command)
+        return _execute(command, sudo, cwd, env, env_update)
+
+
+class Script:
+    """
+    Builder that collects commands (e.g., wrappers from this module) and
+    executes all of them in a single /bin/sh process. Each command is a
+    separate step which has its own exit code, stdout and stderr (they are
+    separated from each other with unique delimiters).
+
+    Note: all steps share the same shell, so cd() affects next steps.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def __build(self, delimiter: str, stop_on_error: bool) -> str:
+        lines = []
+        for command in self.commands:
+            lines.append(command)
+            lines.append(f"__niceshell_rc=$?; "
+                         f"printf '%s%d:' {delimiter} $__niceshell_rc; "
+                         f"printf %s {delimiter} >&2")
+            if stop_on_error:
+                lines.append(
+                    '[ $__niceshell_rc -eq 0 ] || exit $__niceshell_rc')
+        return '\n'.join(lines)
+
+    def add(self, command: str):
+        """
+        Adds command as a new step.
+
+        Parameters:
+            command (str): shell command.
+
+        Raises:
+            TypeError: command's type isn't str.
+
+        Returns:
+            Script: object from which this method was invoked.
+        """
+        if not isinstance(command, str):
+            raise TypeError("command's type must be str.")
+        self.commands.append(command)
+        return self
+
+    def cd(self, path='', short_args=[]):
+        '''Adds cd() step. Returns object from which it was invoked.'''
+        return self.add(cd(path, short_args, True))
+
+    def cp(self, source_path, destination_path, short_args=[], long_args=[],
+           batch=False, sudo=False):
+        '''Adds cp() step. Returns object from which it was invoked.'''
+        return self.add(cp(source_path, destination_path, short_args,
+                           long_args, batch, sudo, True))
+
+    def ln(self, source_path, destination_path, short_args=[], long_args=[],
+           batch=False, sudo=False):
+        '''Adds ln() step. Returns object from which it was invoked.'''
+        return self.add(ln(source_path, destination_path, short_args,
+                           long_args, batch, sudo, True))
+
+    def ls(self, path='', short_args=[], long_args=[], batch=False,
+           sudo=False):
+        '''Adds ls() step. Returns object from which it was invoked.'''
+        return self.add(ls(path, short_args, long_args, batch, sudo, True))
+
+    def mv(self, source_path, destination_path, short_args=[], long_args=[],
+           batch=False, sudo=False):
+        '''Adds mv() step. Returns object from which it was invoked.'''
+        return self.add(mv(source_path, destination_path, short_args,
+                           long_args, batch, sudo, True))
+
+    def pwd(self, short_args=[]):
+        '''Adds pwd() step. Returns object from which it was invoked.'''
+        return self.add(pwd(short_args, True))
+
+    def rm(self, path, short_args=[], long_args=[], batch=False, sudo=False):
+        '''Adds rm() step. Returns object from which it was invoked.'''
+        return self.add(rm(path, short_args, long_args, batch, sudo, True))
+
+    def run(self, stop_on_error=False, cwd=None, env=None,
+            env_update=None) -> List[CompletedShell]:
+        """
+        Executes all steps in a single /bin/sh process.
+
+        Parameters:
+            stop_on_error (bool): don't execute next steps after the first
+                step with non-zero exit code. Default is False.
+            cwd (str | None): working directory of the shell (see Shell).
+                Default is None.
+            env (Mapping[str, str] | None): environment of the shell. Default
+                is None (os.environ).
+            env_update (Mapping[str, str | None] | None): changes of
+                environment. Default is None.
+
+        Returns:
+            List[CompletedShell]: results of executed steps (in order).
+        """
+        delimiter = f"__niceshell_step_{uuid4().hex}__"
+        result = Shell(self.__build(delimiter, stop_on_error), cwd=cwd,
+                       env=env, env_update=env_update).finish()
+        stdout = result.output_bytes().split(delimiter.encode())
+        stderr = result.error_output_bytes().split(delimiter.encode())
+        steps = []
+        exit_code = 0
+        output = stdout[0]
+        for i in range(len(stdout) - 1):
+            exit_code, _, next_output = stdout[i + 1].partition(b':')
+            exit_code = int(exit_code)
+            steps.append(CompletedShell(self.commands[i], result.pid,
+                                        exit_code, output, stderr[i]))
+            output = next_output
+        if (len(steps) < len(self.commands) and
+                (exit_code == 0 or not stop_on_error)):
+            # Step has terminated the shell itself (e.g., with exit)
+            steps.append(CompletedShell(
+                self.commands[len(steps)], result.pid, result.exit_code(),
+                output, stderr[len(steps)]))
+        return steps
@@ -1,11 +1,25 @@
-from typing import Iterable, Union
+from typing import Iterable, Iterator, List, Union
 
-from .core import Shell
+from .core import CompletedShell, Env, EnvUpdate, Shell
+
+
+class LsEntry:
+    inode: int
+    link_target: Union[str, None]
+    mode: int
+    mtime: float
+    name: str
+    path: str
+    size: int
+    type: str
 
 
 def cd(path: str = '',
        short_args: Union[str, Iterable[str]] = [],
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, str]: ...
 
 
 def cp(source_path: Union[str, Iterable[str]],
@@ -14,7 +28,40 @@ def cp(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch: bool = False,
        sudo: bool = False,
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       jobs: Union[int, None] = None,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, CompletedShell, str]: ...
+
+
+def find(path: Union[str, Iterable[str]] = '.',
+         name: Union[str, None] = None,
+         type: Union[str, None] = None,
+         newer: Union[str, None] = None,
+         size: Union[str, None] = None,
+         maxdepth: Union[int, None] = None,
+         prune: Union[str, Iterable[str]] = [],
+         batch: bool = False,
+         sudo: bool = False,
+         test: bool = False,
+         jobs: Union[int, None] = None,
+         cwd: Union[str, None] = None,
+         env: Env = None,
+         env_update: EnvUpdate = None) -> Union[Shell, Iterator[str], str]: ...
+
+
+def journaled_batch(operation: str,
+                    paths: Iterable[str],
+                    journal_path: str,
+                    destination_path: Union[str, None] = None,
+                    short_args: Union[str, Iterable[str]] = [],
+                    long_args: Iterable[str] = [],
+                    chunk: int = 1000,
+                    sudo: bool = False,
+                    cwd: Union[str, None] = None,
+                    env: Env = None,
+                    env_update: EnvUpdate = None) -> CompletedShell: ...
 
 
 def ln(source_path: Union[str, Iterable[str]],
@@ -23,7 +70,10 @@ def ln(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch: bool = False,
        sudo: bool = False,
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, str]: ...
 
 
 def ls(path: Union[str, Iterable[str]] = '',
@@ -31,7 +81,18 @@ def ls(path: Union[str, Iterable[str]] = '',
        long_args: Iterable[str] = [],
        batch: bool = False,
        sudo: bool = False,
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       cache_ttl: Union[float, None] = None,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, CompletedShell, str]: ...
+
+
+def ls_entries(path: str = '.',
+               recursive: bool = False,
+               sort: str = "name",
+               reverse: bool = False,
+               hidden: bool = False) -> List[LsEntry]: ...
 
 
 def mv(source_path: Union[str, Iterable[str]],
@@ -40,11 +101,19 @@ def mv(source_path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch: bool = False,
        sudo: bool = False,
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       native: bool = False,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, CompletedShell, str]: ...
 
 
 def pwd(short_args: Union[str, Iterable[str]] = [],
-        test: bool = False) -> Union[str, Shell]: ...
+        test: bool = False,
+        cache_ttl: Union[float, None] = None,
+        cwd: Union[str, None] = None,
+        env: Env = None,
+        env_update: EnvUpdate = None) -> Union[str, Shell, CompletedShell]: ...
 
 
 def rm(path: Union[str, Iterable[str]],
@@ -52,4 +121,65 @@ def rm(path: Union[str, Iterable[str]],
        long_args: Iterable[str] = [],
        batch: bool = False,
        sudo: bool = False,
-       test: bool = False) -> Union[Shell, str]: ...
+       test: bool = False,
+       jobs: Union[int, None] = None,
+       cwd: Union[str, None] = None,
+       env: Env = None,
+       env_update: EnvUpdate = None) -> Union[Shell, CompletedShell, str]: ...
+
+
+class Script:
+    commands: List[str]
+
+    def __init__(self) -> None: ...
+    def add(self, command: str) -> Script: ...
+
+    def cd(self,
+           path: str = '',
+           short_args: Union[str, Iterable[str]] = []) -> Script: ...
+
+    def cp(self,
+           source_path: Union[str, Iterable[str]],
+           destination_path: str,
+           short_args: Union[str, Iterable[str]] = [],
+           long_args: Iterable[str] = [],
+           batch: bool = False,
+           sudo: bool = False) -> Script: ...
+
+    def ln(self,
+           source_path: Union[str, Iterable[str]],
+           destination_path: str,
+           short_args: Union[str, Iterable[str]] = [],
+           long_args: Iterable[str] = [],
+           batch: bool = False,
+           sudo: bool = False) -> Script: ...
+
+    def ls(self,
+           path: Union[str, Iterable[str]] = '',
+           short_args: Union[str, Iterable[str]] = [],
+           long_args: Iterable[str] = [],
+           batch: bool = False,
+           sudo: bool = False) -> Script: ...
+
+    def mv(self,
+           source_path: Union[str, Iterable[str]],
+           destination_path: str,
+           short_args: Union[str, Iterable[str]] = [],
+           long_args: Iterable[str] = [],
+           batch: bool = False,
+           sudo: bool = False) -> Script: ...
+
+    def pwd(self, short_args: Union[str, Iterable[str]] = []) -> Script: ...
+
+    def rm(self,
+           path: Union[str, Iterable[str]],
+           short_args: Union[str, Iterable[str]] = [],
+           long_args: Iterable[str] = [],
+           batch: bool = False,
+           sudo: bool = False) -> Script: ...
+
+    def run(self,
+            stop_on_error: bool = False,
+            cwd: Union[str, None] = None,
+            env: Env = None,
+            env_update: EnvUpdate = None) -> List[CompletedShell]: ...
@@ -1,5 +1,12 @@
 #!/usr/bin/python3
+import gc
+import io
+import logging
+import os
+import random
 import sys
+import threading
+import tracemalloc
 
 import pytest
 
@@ -8,6 +15,117 @@ from niceshell import core
 
 
 class TestCore:
+    def test_CommandCache(self, tmp_path, monkeypatch):
+        CommandCache = core.CommandCache
+
+        # Errors
+        # maxsize's type must be int.
+        with pytest.raises(TypeError):
+            CommandCache("1")
+        # ttl's type must be int or float.
+        with pytest.raises(TypeError):
+            CommandCache(1, "1")
+        # maxsize and ttl must be positive.
+        with pytest.raises(ValueError):
+            CommandCache(0)
+        with pytest.raises(ValueError):
+            CommandCache(1, 0)
+        # command's type must be str or Iterable[str].
+        with pytest.raises(TypeError):
+            CommandCache().run(1)
+
+        # Asserts
+        cache = CommandCache(2, 60)
+        counter = tmp_path / "counter"
+        command = f"echo >> '{counter}'; wc -l < '{counter}'"
+        read_command = f"cat '{counter}' 2>/dev/null | wc -l"
+        assert cache.run(read_command).output() == "0\n"
+        counter.write_text("1\n")
+        assert cache.run(read_command).output() == "0\n"  # Cached
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.run(read_command, ttl=0).output() == "1\n"  # Expired
+        cache.invalidate(read_command)
+        assert len(cache) == 0
+        assert cache.run(read_command).output() == "1\n"
+
+        # Different cwd/environment
+        monkeypatch.chdir(tmp_path)
+        assert cache.run(["pwd"]).output() == f"{tmp_path}\n"
+        monkeypatch.setenv("LANG", "C")
+        cache.run(["pwd"])
+        assert len(cache) == 2  # LRU
+        assert (cache.hits, cache.misses) == (1, 5)
+
+        # Mutating commands and sudo aren't cached
+        for _ in range(2):
+            cache.run(command)
+            cache.run("sudo -n true 2>/dev/null")
+        assert counter.read_text().count('\n') == 3
+        assert (cache.hits, cache.misses) == (1, 5)
+        cache.clear()
+        assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
+
+        assert core.cached_shell(["printf", "text"]).output() == "text"
+        assert core.cached_shell("printf text", cache=cache).output() == "text"
+        assert cache.misses == 1
+
+    def test_CompletedShell(self):
+        Shell = core.Shell
+
+        # Asserts
+        process = Shell("printf 'out\\nput\\n'; printf err >&2; exit 3")
+        result = process.finish()
+        assert type(result) == core.CompletedShell
+        assert not hasattr(result, "__dict__")
+        assert result.command == process.command
+        assert result.pid == process.pid
+        assert result.exit_code() == 3
+        assert result.wait() == 3
+        assert result.output() == "out\nput\n"
+        assert result.output_bytes() == b"out\nput\n"
+        assert result.error_output() == "err"
+        assert result.get_lines() == ["out", "put"]
+        assert result.get_lines(False) == ["out", "put", '']
+        assert result.get_lines(stderr=True) == ["err"]
+        assert result.stats["elapsed"] >= 0
+        assert process.stdout.closed and process.stderr.closed
+
+        result = Shell("true", stdout=None, stderr=None).finish()
+        assert result.output() == ''
+        assert result.error_output() == ''
+
+    def test_expand_wildcards(self, tmp_path, monkeypatch):
+        expand_wildcards = core.expand_wildcards
+
+        # Errors
+        # path must be str.
+        with pytest.raises(TypeError):
+            expand_wildcards(1)
+
+        # Asserts
+        monkeypatch.chdir(tmp_path)
+        for name in ("ab", "ac", ".ah", "a*b", "x y"):
+            (tmp_path / name).write_bytes(b'')
+        (tmp_path / "dir1" / "sub").mkdir(parents=True)
+        (tmp_path / "dir2").mkdir()
+        (tmp_path / "dir2" / "file").write_bytes(b'')
+        assert expand_wildcards("a*") == ["a*b", "ab", "ac"]
+        assert expand_wildcards(R"a\*b") == ["a*b"]
+        assert expand_wildcards(R"a\*") == []
+        assert expand_wildcards(".a*") == [".ah"]
+        assert expand_wildcards(".*") == [".", "..", ".ah"]
+        assert expand_wildcards("x *") == ["x y"]
+        assert expand_wildcards("*/sub") == ["dir1/sub"]
+        assert expand_wildcards("*/") == ["dir1/", "dir2/"]
+        assert expand_wildcards("d*", dirs_only=True) == ["dir1", "dir2"]
+        assert expand_wildcards("*/*") == ["dir1/sub", "dir2/file"]
+        assert expand_wildcards(f"{tmp_path}/a?") == []
+        assert expand_wildcards(f"{tmp_path}/*y") == [f"{tmp_path}/x y"]
+        assert expand_wildcards("missing*") == []
+        assert expand_wildcards("ab") == ["ab"]
+        assert expand_wildcards('') == []
+        assert expand_wildcards('~') == [os.path.expanduser('~')]
+
     def test_expose_tilde(self):
         expose_tilde = core.expose_tilde
         quotes_wrapper = core.quotes_wrapper
@@ -28,6 +146,73 @@ class TestCore:
         assert expose_tilde(quotes_wrapper("dir ~/")) == '"dir ~/"'
         assert expose_tilde(quotes_wrapper('dir "~/')) == R'"dir \"~/"'
 
+    def test_ForkServer(self, tmp_path, monkeypatch):
+        Shell = core.Shell
+        assert core.get_fork_server() is None
+        server = core.start_fork_server()
+        try:
+            assert core.start_fork_server() is server
+            assert core.get_fork_server() is server
+            process = Shell("echo out; echo error >&2; exit 3")
+            assert type(process.process) == core._ForkServerProcess
+            assert process.pid != server.process.pid
+            assert process.output() == "out\n"
+            assert process.error_output() == "error\n"
+            assert process.exit_code() == 3
+            assert Shell(["cat"], "text").output() == "text"
+            assert Shell("pwd", cwd=str(tmp_path)).output() == \
+                f"{tmp_path.resolve()}\n"
+            assert Shell("echo $X", env_update={'X': 'x'}).output() == "x\n"
+            assert Shell("echo 1").shell("cat").output() == "1\n"
+            with pytest.raises(FileNotFoundError):
+                Shell(["/nonexistent/command"])
+
+            # Signals and waiting
+            process = Shell(["sleep", "10"])
+            with pytest.raises(core.TimeoutExpired):
+                process.process.wait(0.01)
+            process.kill()
+            assert process.exit_code() == -9
+            shells = [Shell(f"sleep 0.0{i}") for i in range(5)]
+            assert core.wait_all(shells, 10) == (shells, [])
+
+            # Pipeline stages are spawned by the server too
+            pipeline = core.Pipeline(["printf 'b\\na\\n'", ["sort"],
+                                      "cat; exit 2"], input_text="x")
+            assert all(type(process) == core._ForkServerProcess
+                       for process in pipeline.processes)
+            assert pipeline.output() == "a\nb\n"
+            assert pipeline.exit_codes() == [0, 0, 2]
+
+            # Plain Popen if Popen internals aren't supported
+            monkeypatch.setattr(core, "_is_fork_server_supported",
+                                lambda: False)
+            process = Shell("echo out; exit 3")
+            assert type(process.process) == core.Popen
+            assert process.output() == "out\n"
+            assert process.exit_code() == 3
+            pipeline = core.Pipeline(["echo 1", "cat"])
+            assert type(pipeline.processes[1]) == core.Popen
+            assert pipeline.output() == "1\n"
+            monkeypatch.undo()
+        finally:
+            core.stop_fork_server()
+        assert core.get_fork_server() is None
+        assert not server.is_alive()
+        assert type(Shell("true").process) == core.Popen
+
+        with core.ForkServer() as server:
+            process = server.popen(["echo", "1"], stdout=core.PIPE)
+            assert process.communicate() == (b"1\n", None)
+        assert not server.is_alive()
+        with pytest.raises(RuntimeError):
+            server.popen(["true"])
+        monkeypatch.setattr(core, "_is_fork_server_supported", lambda: False)
+        with pytest.raises(RuntimeError):
+            server.popen(["true"])
+        monkeypatch.undo()
+        assert core._is_fork_server_supported() == (os.name == "posix")
+
     def test_normalize_short_and_long_args(self):
         normalize = core.normalize_short_and_long_args
         ShortArgsOption = core.ShortArgsOption
@@ -147,6 +332,152 @@ class TestCore:
             ShortArgsOption.NO_DASH
         ) == "if=/path/to/smth of=/dev/sda1 --version --help"
 
+    def test_parallel_map(self, tmp_path):
+        parallel_map = core.parallel_map
+        items = [f"file {i}" for i in range(10)] + ["$HOME", "it's"]
+
+        # Order of results, quoting and chunks
+        results = parallel_map("printf '<%s>' {}", items, jobs=4)
+        assert len(results) == 12
+        assert [r.output() for r in results] == [f"<{e}>" for e in items]
+        results = parallel_map("echo", items, jobs=3, chunk=5)
+        assert [r.get_lines() for r in results] == [
+            [' '.join(items[i:i + 5])] for i in range(0, 12, 5)]
+        assert parallel_map("echo {} {}", ['a'])[0].output() == "a a\n"
+        assert parallel_map("echo {}", []) == []
+
+        # Exit codes, progress, cwd and env
+        progress = []
+        results = parallel_map(
+            'test -e {} && echo "$X"', ['a', 'b', 'c'], 2,
+            progress=lambda *args: progress.append(args),
+            cwd=str(tmp_path), env_update={'X': 'x'})
+        (tmp_path / 'b').touch()  # Results are already available
+        assert [r.exit_code() for r in results] == [1, 1, 1]
+        assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+        results = parallel_map("test -e", ['b', 'a'], cwd=str(tmp_path))
+        assert [r.exit_code() for r in results] == [0, 1]
+
+        # Exceptions of progress are propagated
+        with pytest.raises(ZeroDivisionError):
+            parallel_map("true", ['a'], progress=lambda *args: 1 / 0)
+
+        # Errors
+        with pytest.raises(TypeError):
+            parallel_map(["echo"], items)
+        with pytest.raises(TypeError):
+            parallel_map("echo", "items")
+        with pytest.raises(TypeError):
+            parallel_map("echo", [1])
+        with pytest.raises(TypeError):
+            parallel_map("echo", items, jobs=1.5)
+        with pytest.raises(ValueError):
+            parallel_map("echo", items, chunk=0)
+
+    def test_parallel_pipe(self, tmp_path):
+        parallel_pipe = core.parallel_pipe
+        data = b''.join(b"line %d\n" % i for i in range(10000)) + b"last"
+        path = tmp_path / "input"
+        path.write_bytes(data)
+
+        # File (mmap), bytes and stream sources
+        file = open(path, "rb")
+        for source in (str(path), data, bytearray(data), io.BytesIO(data),
+                       file):
+            results = list(parallel_pipe("cat", source, 3, 1000))
+            assert b''.join(r.output_bytes() for r in results) == data
+            assert all(r.output_bytes().endswith(b'\n')
+                       for r in results[:-1])
+            assert 80 <= len(results) <= 100
+        file.close()
+        results = list(parallel_pipe(["wc", "-l"], str(path), 2, 4096))
+        assert sum(int(r.output()) for r in results) == 10000
+        assert list(parallel_pipe("cat", b'')) == []
+        (tmp_path / "empty").touch()
+        assert list(parallel_pipe("cat", str(tmp_path / "empty"))) == []
+
+        # Non-regular files and files with unknown size are streamed
+        fifo = tmp_path / "fifo"
+        os.mkfifo(str(fifo))
+        writer = threading.Thread(target=fifo.write_bytes, args=(data,))
+        writer.start()
+        results = list(parallel_pipe("cat", str(fifo), 2, 1000))
+        writer.join()
+        assert b''.join(r.output_bytes() for r in results) == data
+        if os.path.exists("/proc/self/status"):
+            results = list(parallel_pipe("cat", "/proc/self/status"))
+            assert b"Name:" in b''.join(r.output_bytes() for r in results)
+
+        # Long lines aren't split, cwd and env
+        results = list(parallel_pipe(
+            'cat > "$X$$"; echo "$PWD"', b"a" * 100 + b"\nb\n", 1, 10,
+            cwd=str(tmp_path), env_update={'X': "block"}))
+        assert len(results) == 2
+        assert results[0].output() == f"{tmp_path}\n"
+        assert sorted(path.stat().st_size
+                      for path in tmp_path.glob("block*")) == [2, 101]
+
+        # Early exit
+        results = parallel_pipe("cat", str(path), 2, 100)
+        output = next(results).output_bytes()
+        assert output == data[:data.index(b'\n', 99) + 1]
+        results.close()
+        assert core.Shell("cat", b"bytes").output() == "bytes"
+
+        # Errors
+        with pytest.raises(TypeError):
+            parallel_pipe(1, data)
+        with pytest.raises(TypeError):
+            parallel_pipe("cat", [data])
+        with pytest.raises(ValueError):
+            parallel_pipe("cat", data, block_size=0)
+        with pytest.raises(FileNotFoundError):
+            parallel_pipe("cat", str(tmp_path / "missing"))
+
+    def test_Pipeline(self):
+        Pipeline = core.Pipeline
+
+        # Errors
+        # commands' type must be Iterable[str | Iterable[str]].
+        with pytest.raises(TypeError):
+            Pipeline("cat")
+        with pytest.raises(TypeError):
+            Pipeline([])
+        with pytest.raises(TypeError):
+            Pipeline(["cat", 1])
+        with pytest.raises(TypeError):
+            Pipeline(["cat", []])
+
+        # Asserts
+        pipeline = Pipeline(["printf 'b\\na\\nb\\n'", "sort", ["uniq", "-c"]])
+        assert pipeline.get_lines() == ["      1 a", "      2 b"]
+        assert pipeline.exit_codes() == [0, 0, 0]
+        assert pipeline.error_outputs() == ['', '', '']
+
+        pipeline = Pipeline(["printf err >&2; exit 3", "cat"])
+        assert pipeline.exit_codes() == [3, 0]
+        assert pipeline.exit_code() == 0
+        assert pipeline.error_outputs() == ["err", '']
+        pipeline = Pipeline(["exit 3", "exit 4", "cat"], pipefail=True)
+        assert pipeline.exit_code() == 4
+        assert pipeline.wait() == 4
+
+        # Stages are run at the same time
+        pipeline = Pipeline(["yes", "head -n 2"])
+        assert pipeline.output() == "y\ny\n"
+        assert pipeline.exit_codes()[0] != 0
+        assert pipeline.exit_codes()[1] == 0
+
+        pipeline = Pipeline(["cat", "tr a-z A-Z"], "line\n" * 3)
+        assert list(pipeline.iter_lines()) == ["LINE\n"] * 3
+        result = pipeline.finish()
+        assert result.exit_code() == 0
+        assert result.stats["exit_codes"] == [0, 0]
+
+        with Pipeline(["cat"], "text") as pipeline:
+            assert pipeline.output() == "text"
+        assert pipeline.exit_codes() == [0]
+
     def test_quotes_wrapper(self):
         wrapper = core.quotes_wrapper
         # Errors
@@ -183,6 +514,49 @@ class TestCore:
         with pytest.raises(TypeError):
             shell([1])
 
+    def test_shell_quote_many(self):
+        shell_quote_many = core.shell_quote_many
+
+        # Errors
+        # paths' type must be str or Iterable[str].
+        with pytest.raises(TypeError):
+            shell_quote_many(1)
+        with pytest.raises(TypeError):
+            shell_quote_many([])
+        with pytest.raises(TypeError):
+            shell_quote_many(["path", 1])
+        with pytest.raises(TypeError):
+            shell_quote_many([1])
+
+        # paths can't contain NUL character.
+        with pytest.raises(ValueError):
+            shell_quote_many(["path", "pa\0th"])
+
+        # Asserts
+        assert shell_quote_many('') == "''"
+        assert shell_quote_many("path") == "'path'"
+        assert shell_quote_many(("a b", "$HOME", R'"`\\')
+                                ) == R"""'a b' '$HOME' '"`\\'"""
+        assert shell_quote_many(["it's", "'"]) == R"""'it'\''s' ''\'''"""
+        assert shell_quote_many(["~", "~/", "~/dir", "dir ~/", "~user"], True
+                                ) == "~ ~/'' ~/'dir' 'dir ~/' '~user'"
+        assert shell_quote_many(["~", "~'/", "'~/"],
+                                tilde=True) == R"""~ '~'\''/' ''\''~/'"""
+        assert shell_quote_many("~/dir") == "'~/dir'"
+
+    def test_shell_quote_many_round_trip(self):
+        shell_quote_many = core.shell_quote_many
+        rng = random.Random(0)
+        for _ in range(20):
+            names = [bytes(rng.randrange(1, 256)
+                           for _ in range(rng.randrange(0, 16)))
+                     for _ in range(rng.randrange(1, 50))]
+            names += [b"'", b"\\'", b" '~' ", b"$(false)", b"*"]
+            quoted = shell_quote_many(os.fsdecode(name) for name in names)
+            process = core.Shell(f"printf '%s\\0' {quoted}").finish()
+            assert process.output_bytes() == b''.join(
+                name + b'\0' for name in names)
+
     def test_Shell(self):
         Shell = core.Shell
 
@@ -195,6 +569,263 @@ class TestCore:
         with pytest.raises(TypeError):
             Shell([1])
 
+        # Asserts
+        with Shell("printf text") as process:
+            assert process.output() == "text"
+        assert process.stdout.closed
+        assert process.exit_code() == 0
+        process = Shell("cat")
+        process.close()
+        assert process.stdout.closed
+        assert process.exit_code() == 0
+        # Output isn't lost after close()
+        process = Shell("echo hi; echo error >&2")
+        process.close()
+        assert process.output() == "hi\n"
+        assert process.error_output() == "error\n"
+        assert process.finish().output() == "hi\n"
+        process = Shell("sleep 0.2; echo late")
+        with pytest.raises(core.TimeoutExpired):
+            process.input(timeout=0.01)
+        process.close()
+        assert process.output() == "late\n"
+
+    def test_Shell_tee(self, capfd, caplog):
+        Shell = core.Shell
+
+        # Errors
+        # sink's type must be file, logging.Logger or callable.
+        with pytest.raises(TypeError):
+            Shell("true", tee=1)
+        # capture_limit's type must be int or None.
+        with pytest.raises(TypeError):
+            Shell("true", tee=sys.stdout, capture_limit="1")
+        # capture_limit can't be negative.
+        with pytest.raises(ValueError):
+            Shell("true", tee=sys.stdout, capture_limit=-1)
+        # tee mode requires stdout=PIPE and stderr=PIPE.
+        with pytest.raises(ValueError):
+            Shell("true", tee=sys.stdout, stdout=None)
+
+        # Asserts
+        binary, text, chunks = io.BytesIO(), io.StringIO(), []
+        logger = logging.getLogger("niceshell.test")
+        with caplog.at_level(logging.INFO, "niceshell.test"):
+            process = Shell("printf 'out\\nput'; printf err >&2",
+                            tee=[binary, text, chunks.append, logger],
+                            tee_stderr=sys.stderr)
+            assert process.output() == "out\nput"
+            assert process.error_output() == "err"
+            assert process.exit_code() == 0
+        assert binary.getvalue() == b"out\nput"
+        assert text.getvalue() == "out\nput"
+        assert b''.join(chunks) == b"out\nput"
+        assert [record.getMessage() for record in caplog.records
+                ] == ["out", "put"]
+        assert capfd.readouterr().err == "err"
+
+        process = Shell("cat", "text", tee=sys.stdout)
+        assert process.finish().output() == "text"
+        assert capfd.readouterr().out == "text"
+
+        # Bounded capture
+        process = Shell("seq 10000", tee=binary, capture_limit=6)
+        assert process.output() == "10000\n"
+        assert binary.getvalue().endswith(b"9999\n10000\n")
+        assert Shell("seq 3", tee=[], capture_limit=0).output() == ''
+
+        # Failed sink is disabled
+        process = Shell("seq 3", tee=[lambda chunk: 1 / 0, chunks.append])
+        assert process.get_lines() == ['1', '2', '3']
+        assert chunks[-1].endswith(b"3\n")
+
+    def test_Shell_thread_safety(self):
+        Shell = core.Shell
+        threads_count = 32
+
+        for i in range(10):
+            process = Shell("seq 10000; seq 100 >&2; exit 7")
+            barrier = threading.Barrier(threads_count)
+            results = []
+
+            def hammer(index: int):
+                barrier.wait()
+                if index % 3 == 0:
+                    results.append(process.exit_code())
+                elif index % 3 == 1:
+                    results.append(len(process.get_lines()))
+                else:
+                    results.append(len(process.get_lines(stderr=True)))
+
+            threads = [threading.Thread(target=hammer, args=(i,))
+                       for i in range(threads_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(results) == threads_count
+            assert set(results) == {7, 10000, 100}
+            assert process.output() == Shell("seq 10000").output()
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"),
+                        reason="/proc/self/fd isn't available")
+    def test_Shell_fd_cleanup(self):
+        Shell = core.Shell
+
+        def count_fds() -> int:
+            gc.collect()
+            return len(os.listdir("/proc/self/fd"))
+
+        def run(iterations: int):
+            for i in range(iterations):
+                Shell("printf text").shell("cat").shell(
+                    "cat", stdin="text").wait()
+                with Shell("cat", stdin="text") as process:
+                    process.output()
+
+        run(10)  # Warm-up (e.g., lazily created objects)
+        fds = count_fds()
+        tracemalloc.start()
+        memory = tracemalloc.get_traced_memory()[0]
+        run(2000)
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - memory
+        tracemalloc.stop()
+        assert count_fds() == fds
+        assert growth < 256 * 1024
+
+    def test_wait(self, monkeypatch):
+        as_completed, wait_all, wait_any = (core.as_completed, core.wait_all,
+                                            core.wait_any)
+
+        # Errors
+        # shells' type must be Iterable[Shell].
+        with pytest.raises(TypeError):
+            wait_all(1)
+        with pytest.raises(TypeError):
+            wait_any([1])
+        # timeout's type must be int, float or None.
+        with pytest.raises(TypeError):
+            as_completed([], "1")
+        # timeout can't be negative.
+        with pytest.raises(ValueError):
+            wait_any([], -1)
+
+        # Asserts
+        def check():
+            shells = [core.Shell(f"sleep {delay}", stdout=None)
+                      for delay in (0.3, 0.01, 0.2)]
+            done, pending = wait_any(shells)
+            assert done == [shells[1]]
+            assert pending == [shells[0], shells[2]]
+            assert list(as_completed(shells)) == [
+                shells[1], shells[2], shells[0]]
+            assert wait_all(shells) == (shells, [])
+            assert [shell.exit_code() for shell in shells] == [0, 0, 0]
+
+            shells = [core.Shell("sleep 10"), core.Shell("true")]
+            assert wait_all(shells, 0.05) == (shells[1:], shells[:1])
+            with pytest.raises(TimeoutError):
+                for shell in as_completed(shells, 0):
+                    assert shell is shells[1]
+            shells[0].kill()
+            assert wait_all(shells, 10) == (shells, [])
+
+        check()  # pidfd and epoll (if available)
+        monkeypatch.delattr(os, "pidfd_open", raising=False)
+        check()  # SIGCHLD
+        errors = []
+
+        def check_in_thread():
+            try:
+                check()
+            except BaseException as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=check_in_thread)  # Polling
+        thread.start()
+        thread.join()
+        assert errors == []
+        assert wait_any([]) == ([], [])
+
+    def test_working_directory(self, tmp_path):
+        get_working_directory = core.get_working_directory
+        working_directory = core.working_directory
+        Shell = core.Shell
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        (tmp_path / "a" / "file a").touch()
+        process_cwd = os.getcwd()
+
+        # Threads don't affect each other and the process
+        barrier = threading.Barrier(2)
+        results = {}
+        errors = []
+
+        def run(name):
+            try:
+                with working_directory(str(tmp_path / name)) as path:
+                    barrier.wait(10)
+                    results[name] = (path, get_working_directory(),
+                                     Shell("pwd").output()[:-1],
+                                     core.expand_wildcards("*"))
+            except BaseException as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(name,))
+                   for name in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert results['a'] == (str(tmp_path / 'a'),) * 3 + (["file a"],)
+        assert results['b'] == (str(tmp_path / 'b'),) * 3 + ([],)
+        assert os.getcwd() == get_working_directory() == process_cwd
+
+        # Nesting and relative paths
+        with working_directory(str(tmp_path)):
+            with working_directory('a') as path:
+                assert path == str(tmp_path / 'a')
+                assert Shell("pwd", cwd="..").output() == f"{tmp_path}\n"
+                assert core.Pipeline(["ls", "cat"]).output() == "file a\n"
+            assert get_working_directory() == str(tmp_path)
+            assert core.shell("pwd", cwd='b').output() == \
+                f"{tmp_path / 'b'}\n"
+        assert get_working_directory() == process_cwd
+
+        # Environment
+        os.environ["NICESHELL_TEST"] = "1"
+        try:
+            command = 'echo "$NICESHELL_TEST,${NICESHELL_X-unset}"'
+            assert Shell(command).output() == "1,unset\n"
+            assert Shell(command, env_update={"NICESHELL_X": 'x'}
+                         ).output() == "1,x\n"
+            assert Shell(command, env_update={"NICESHELL_TEST": None}
+                         ).output() == ",unset\n"
+            assert Shell(command, env={"NICESHELL_X": 'y'}
+                         ).output() == ",y\n"
+            assert core.cached_shell(
+                "echo $NICESHELL_X", env_update={"NICESHELL_X": 'z'}
+            ).output() == "z\n"
+        finally:
+            del os.environ["NICESHELL_TEST"]
+
+        # Errors
+        with pytest.raises(TypeError):
+            with working_directory(None):
+                pass
+        with pytest.raises(ValueError):
+            with working_directory(str(tmp_path / "missing")):
+                pass
+        with pytest.raises(TypeError):
+            Shell("true", cwd=1)
+        with pytest.raises(TypeError):
+            Shell("true", env=[])
+        with pytest.raises(TypeError):
+            Shell("true", env_update="x")
+
 
 if __name__ == "__main__":
     pytest.main()
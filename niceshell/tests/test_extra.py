@@ -1,16 +1,141 @@
 #!/usr/bin/python3
+import os
 import sys
 
 import pytest
 
 sys.path.extend([f"{sys.path[0]}/..", f"{sys.path[0]}/../.."])
 from niceshell import extra
+from niceshell import gnu_coreutils
 
 
 class TestExtra:
     def test_has_root_privileges(self):
         assert type(extra.has_root_privileges()) == bool
 
+    def test_ListingCache(self, tmp_path, monkeypatch):
+        ListingCache = extra.ListingCache
+
+        # Errors
+        # max_dirs's type must be int.
+        with pytest.raises(TypeError):
+            ListingCache("1")
+        # max_dirs must be positive.
+        with pytest.raises(ValueError):
+            ListingCache(0)
+        # path's type must be str.
+        with pytest.raises(TypeError):
+            ListingCache().list_files(1)
+        # Invalid path.
+        with pytest.raises(ValueError):
+            ListingCache().list_dirs(str(tmp_path / "nonexistent"))
+
+        # Asserts
+        def check(cache, path):
+            path.mkdir()
+            (path / "dir").mkdir()
+            (path / "file").write_bytes(b'')
+            (path / "link").symlink_to("dir")
+            assert cache.list_dirs(str(path)) == ["dir", "link"]
+            assert cache.list_files(str(path)) == ["file"]
+            (path / ".hidden").mkdir()
+            assert cache.list_dirs(str(path)) == [".hidden", "dir", "link"]
+            (path / ".hidden").rmdir()
+            (path / "file").rename(path / "dir" / "file")
+            (path / "new").write_bytes(b'')
+            assert cache.list_dirs(str(path)) == ["dir", "link"]
+            assert cache.list_files(str(path)) == ["new"]
+            assert cache.list_files(str(path / "dir")) == ["file"]
+            assert cache.list_files(str(path), non_hidden=False) == []
+            # File is renamed over symlink to directory
+            (path / "new").rename(path / "link")
+            assert cache.list_dirs(str(path)) == ["dir"]
+            assert cache.list_files(str(path)) == ["link"]
+
+        with ListingCache(1) as cache:
+            check(cache, tmp_path / "inotify")
+            assert cache.list_dirs(str(tmp_path)) == ["inotify"]
+
+        # Without inotify mtime of directories is checked.
+        monkeypatch.setattr(extra, "_libc", False)
+        check(ListingCache(), tmp_path / "mtime")
+
+    def test_PrivilegedSession(self):
+        PrivilegedSession = extra.PrivilegedSession
+
+        # Errors
+        # command's type must be str or Iterable[str].
+        with pytest.raises(TypeError):
+            PrivilegedSession().run(1)
+        with pytest.raises(TypeError):
+            PrivilegedSession().run([])
+
+        # Session isn't started.
+        with pytest.raises(RuntimeError):
+            PrivilegedSession().run("true")
+
+        # Asserts
+        if not extra.has_root_privileges():
+            pytest.skip("sudo can't be used without password prompt")
+        with PrivilegedSession() as session:
+            assert session.is_alive()
+            assert session.run("id -u").output() == "0\n"
+            result = session.run(["ls", "--", "/nonexistent/path"])
+            assert result.exit_code() != 0
+            assert result.error_output() != ''
+            assert session.run("pwd", "/").output() == "/\n"
+        assert not session.is_alive()
+
+        session = extra.start_privileged_session()
+        assert extra.get_privileged_session() is session
+        assert extra.has_root_privileges()
+        process = gnu_coreutils.ls('/', sudo=True)
+        assert process.poll() == 0 and process.exit_code() == 0
+        extra.stop_privileged_session()
+        assert extra.get_privileged_session() is None
+
+    def test_list_columnar(self, tmp_path):
+        list_columnar = extra.list_columnar
+
+        # Errors
+        # path must be str.
+        with pytest.raises(TypeError):
+            list_columnar(1)
+
+        # Invalid path.
+        with pytest.raises(ValueError):
+            list_columnar(str(tmp_path / "nonexistent"))
+
+        # Asserts
+        (tmp_path / "big").write_bytes(b'1' * 100)
+        (tmp_path / "small").write_bytes(b'1')
+        (tmp_path / ".hidden").write_bytes(b'')
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "nested").write_bytes(b'12')
+        listing = list_columnar(str(tmp_path))
+        assert len(listing) == 4
+        assert sorted(listing.iter_names()) == [
+            ".hidden", "big", "dir", "small"]
+        listing = listing.sort()
+        assert list(listing.iter_names()) == [".hidden", "big", "dir", "small"]
+        assert list(listing.size)[1] == 100
+        files = listing.filter(
+            [not os.path.isdir(str(tmp_path / name))
+             for name in listing.iter_names()])
+        assert list(files.iter_names()) == [".hidden", "big", "small"]
+        assert list(files.size) == [0, 100, 1]
+        assert list(files.sort("size", True).iter_names()) == [
+            "big", "small", ".hidden"]
+        assert len(listing.filter([False] * 4)) == 0
+        with pytest.raises(ValueError):
+            listing.argsort("color")
+
+        listing = list_columnar(str(tmp_path), hidden=False, recursive=True)
+        assert sorted(listing.iter_names()) == [
+            "big", "dir", "dir/nested", "small"]
+        listing = list_columnar(str(tmp_path), non_hidden=False)
+        assert list(listing.iter_names()) == [".hidden"]
+
     def test_list_dirs(self):
         list_dirs = extra.list_dirs
 
@@ -49,6 +174,98 @@ class TestExtra:
         assert type(files) == list
         assert len(files) != 0
 
+    def test_sync(self, tmp_path):
+        sync = extra.sync
+        source = tmp_path / "source"
+        destination = tmp_path / "destination"
+
+        # Errors
+        # source_path's and destination_path's type must be str.
+        with pytest.raises(TypeError):
+            sync(1, str(destination))
+        with pytest.raises(TypeError):
+            sync(str(source), None)
+        # jobs' type must be int.
+        with pytest.raises(TypeError):
+            sync(str(tmp_path), str(destination), jobs="1")
+        # jobs must be greater than 0.
+        with pytest.raises(ValueError):
+            sync(str(tmp_path), str(destination), jobs=0)
+        # Invalid path.
+        with pytest.raises(ValueError):
+            sync(str(source), str(destination))
+        # Paths can't be inside each other.
+        source.mkdir()
+        with pytest.raises(ValueError):
+            sync(str(source), str(source / "copy"))
+        with pytest.raises(ValueError):
+            sync(str(source), str(tmp_path))
+
+        # Asserts
+        (source / "dir" / "nested").mkdir(parents=True)
+        (source / "dir" / "nested" / "file").write_bytes(b'123')
+        (source / "file").write_bytes(b'1')
+        (source / "link").symlink_to("file")
+        process = sync(str(source), str(destination), dry_run=True)
+        assert process.command == (
+            f"sync({str(source)!r}, {str(destination)!r}, delete=False, "
+            f"checksum=False, dry_run=True)")
+        assert process.get_lines() == [
+            "mkdir dir", "mkdir dir/nested", "copy dir/nested/file",
+            "copy file", "copy link"]
+        assert process.stats["bytes"] == 4
+        assert not destination.exists()
+
+        process = sync(str(source), str(destination), jobs=2)
+        assert process.exit_code() == 0
+        assert process.stats["copied"] == 3
+        assert process.stats["created"] == 2
+        assert (destination / "dir" / "nested" / "file").read_bytes() == b'123'
+        assert os.readlink(str(destination / "link")) == "file"
+        st = (source / "dir").stat()
+        assert (destination / "dir").stat().st_mtime_ns == st.st_mtime_ns
+        assert sync(str(source), str(destination)).output() == ''
+
+        # Changed, replaced and extraneous entries
+        (source / "file").write_bytes(b'2')
+        os.utime(str(source / "file"), (1, 1))
+        (source / "dir" / "nested" / "file").chmod(0o600)
+        (source / "link").unlink()
+        (source / "link").mkdir()
+        (destination / "extra").mkdir()
+        (destination / "extra" / "file").write_bytes(b'')
+        process = sync(str(source), str(destination))
+        assert process.get_lines() == [
+            "delete link", "mkdir link", "copy file",
+            "update dir/nested/file"]
+        assert (destination / "extra" / "file").exists()
+        assert (destination / "file").read_bytes() == b'2'
+        assert (destination / "link").is_dir()
+        mode = (destination / "dir" / "nested" / "file").stat().st_mode
+        assert mode & 0o777 == 0o600
+        process = sync(str(source), str(destination), delete=True)
+        assert process.get_lines() == ["delete extra"]
+        assert process.stats["deleted"] == 2
+        assert not (destination / "extra").exists()
+
+        # Same size and modification time, but different content
+        (destination / "file").write_bytes(b'3')
+        os.utime(str(destination / "file"), (1, 1))
+        assert sync(str(source), str(destination)).output() == ''
+        process = sync(str(source), str(destination), checksum=True)
+        assert process.get_lines() == ["copy file"]
+        assert (destination / "file").read_bytes() == b'2'
+
+        # Old file is replaced (not rewritten), so its hardlinks are intact
+        os.link(str(destination / "file"), str(tmp_path / "hardlink"))
+        (source / "file").write_bytes(b'45')
+        process = sync(str(source), str(destination))
+        assert process.get_lines() == ["copy file"]
+        assert (destination / "file").read_bytes() == b'45'
+        assert (tmp_path / "hardlink").read_bytes() == b'2'
+        assert (tmp_path / "hardlink").stat().st_nlink == 1
+        assert sorted(os.listdir(str(destination))) == ["dir", "file", "link"]
+
 
 if __name__ == "__main__":
     pytest.main()
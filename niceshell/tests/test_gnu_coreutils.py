@@ -1,4 +1,5 @@
 #!/usr/bin/python3
+import os
 import sys
 from typing import Iterable, Union
 
@@ -43,6 +44,39 @@ class TestGNUcoreutils:
         assert cd('path/with"*"quotes_and_asterisk'
                   ) == R'cd  -- "path/with\""*"\"quotes_and_asterisk"'
 
+    def test_cd_wildcards(self, tmp_path, monkeypatch):
+        cd = gnu_coreutils.cd
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.delenv("CDPATH", raising=False)
+        (tmp_path / "dir one").mkdir()
+        (tmp_path / "a*b").mkdir()
+
+        # Changed in-process (result is finished Shell)
+        process = cd("dir*")
+        assert type(process) == core.Shell
+        assert process.poll() == 0 and process.exit_code() == 0
+        assert process.finish().exit_code() == 0
+        assert process.shell("echo chained").output() == "chained\n"
+        assert os.getcwd() == str(tmp_path / "dir one")
+        assert cd(R"../a\*b").exit_code() == 0
+        assert os.getcwd() == str(tmp_path / "a*b")
+
+        # Errors are reported by the shell
+        process = cd("missing*")
+        assert type(process) == core.Shell
+        assert process.exit_code() != 0
+        assert process.error_output() != ''
+        assert os.getcwd() == str(tmp_path / "a*b")
+
+        # ".." after symlink is resolved logically (like the shell does)
+        (tmp_path / "a*b" / "sub").mkdir()
+        (tmp_path / "link").symlink_to(tmp_path / "a*b" / "sub")
+        os.chdir(str(tmp_path))
+        assert cd("link/..").exit_code() == 0
+        assert os.getcwd() == str(tmp_path)
+        assert cd("li*/..").exit_code() == 0
+        assert os.getcwd() == str(tmp_path)
+
     def test_cp(self):
         cp = gnu_coreutils.cp
         # Errors
@@ -127,6 +161,266 @@ class TestGNUcoreutils:
         assert cp(['"/dir 1" dir2/*'], '~', 'r'
                   ) == 'cp -r -- "/dir 1" dir2/* ~'
 
+    def test_cp_jobs(self, tmp_path):
+        cp = gnu_coreutils.cp
+        # Errors
+        # jobs' type must be int.
+        with pytest.raises(TypeError):
+            cp('', '', jobs="2")
+
+        # jobs must be greater than 0.
+        with pytest.raises(ValueError):
+            cp('', '', jobs=0)
+
+        # batch and sudo can't be used with jobs.
+        with pytest.raises(ValueError):
+            cp('', '', batch=True, jobs=2)
+        with pytest.raises(ValueError):
+            cp('', '', sudo=True, jobs=2)
+
+        # Argument isn't supported in native mode.
+        with pytest.raises(ValueError):
+            cp('', '', "rb", jobs=2)
+
+        # Invalid value of --reflink.
+        with pytest.raises(ValueError):
+            cp('', '', [], ["reflink=maybe"], jobs=2)
+
+        # Invalid value of --preserve.
+        with pytest.raises(ValueError):
+            cp('', '', [], ["preserve=mode,context"], jobs=2)
+
+        # Asserts
+        source = tmp_path / "source"
+        (source / "dir").mkdir(parents=True)
+        for i in range(20):
+            (source / "dir" / f"file{i}").write_bytes(b'x' * i)
+        (source / "link").symlink_to("dir/file1")
+        os.utime(source / "dir" / "file1", (0, 0))
+        assert cp(str(source), str(tmp_path / "copy"), 'a', jobs=4,
+                  test=True) == f'cp -a -- "{source}" "{tmp_path}/copy"'
+        result = cp(str(source), str(tmp_path / "copy"), 'a', jobs=4)
+        assert result.exit_code() == 0
+        assert result.stats["files"] == 21
+        assert result.stats["bytes"] == sum(range(20))
+        copy = tmp_path / "copy"
+        assert sorted(os.listdir(copy / "dir")) == sorted(
+            os.listdir(source / "dir"))
+        assert (copy / "dir" / "file19").read_bytes() == b'x' * 19
+        assert os.readlink(copy / "link") == "dir/file1"
+        assert os.stat(copy / "dir" / "file1").st_mtime == 0
+
+        # Every copy method
+        data = os.urandom(3 * 1024 * 1024 + 1)
+        (tmp_path / "big").write_bytes(data)
+        for reflink in ("auto", "never"):
+            result = cp(str(tmp_path / "big"), str(tmp_path / reflink), [],
+                        [f"reflink={reflink}"], jobs=1)
+            assert result.exit_code() == 0
+            assert (tmp_path / reflink).read_bytes() == data
+
+        # Per-file errors
+        result = cp([str(source), str(tmp_path / "missing")],
+                    str(copy), jobs=2)
+        assert result.exit_code() == 1
+        assert [path for path, error in result.errors] == [
+            str(source), str(tmp_path / "missing")]
+        assert result.get_lines(stderr=True) == [
+            f"cp: -r not specified; omitting directory '{source}'",
+            f"cp: cannot stat '{tmp_path}/missing': No such file or directory"]
+
+        # Source and destination are the same file
+        same = tmp_path / "same"
+        same.write_bytes(b'data')
+        (tmp_path / "same_link").symlink_to("same")
+        for target in (same, tmp_path / "same_link"):
+            result = cp(str(same), str(target), jobs=2)
+            assert result.exit_code() == 1
+            assert result.get_lines(stderr=True) == [
+                f"cp: '{same}' and '{target}' are the same file"]
+            assert same.read_bytes() == b'data'
+
+        # Hardlinks and extended attributes (-a, --preserve=links,xattr)
+        linked = tmp_path / "linked"
+        (linked / "dir").mkdir(parents=True)
+        (linked / "file").write_bytes(b'data')
+        os.link(linked / "file", linked / "dir" / "hardlink")
+        try:
+            os.setxattr(linked / "file", "user.key", b'value')
+            has_xattrs = True
+        except OSError:  # Not supported by the file system
+            has_xattrs = False
+        for name, short_args, long_args in (
+                ("a", 'a', []), ("links", 'r', ["preserve=links,xattr"]),
+                ("plain", 'r', [])):
+            copy = tmp_path / f"linked_{name}"
+            result = cp(str(linked), str(copy), short_args, long_args,
+                        jobs=2)
+            assert result.exit_code() == 0
+            assert result.stats["files"] == 2
+            assert result.stats["bytes"] == (4 if name != "plain" else 8)
+            is_linked = os.path.samefile(copy / "file",
+                                         copy / "dir" / "hardlink")
+            assert is_linked == (name != "plain")
+            if has_xattrs:
+                assert (os.listxattr(copy / "file") == ["user.key"]) == (
+                    name != "plain")
+        # Existing hardlinks are kept
+        result = cp([str(linked / "file"), str(linked / "dir")],
+                    str(tmp_path / "linked_a"), 'a', jobs=2)
+        assert result.exit_code() == 0
+        assert (tmp_path / "linked_a" / "file").stat().st_nlink == 2
+        assert not (tmp_path / "linked_a" / "linked").exists()
+
+    def test_find(self, tmp_path):
+        find = gnu_coreutils.find
+        # Errors
+        # path's and prune's type must be str or Iterable[str].
+        with pytest.raises(TypeError):
+            find(1)
+        with pytest.raises(TypeError):
+            find([])
+        with pytest.raises(TypeError):
+            find(prune=1)
+        # name's, type's, newer's and size's type must be str or None.
+        with pytest.raises(TypeError):
+            find(name=1)
+        with pytest.raises(TypeError):
+            find(size=10)
+        # maxdepth's and jobs' type must be int.
+        with pytest.raises(TypeError):
+            find(maxdepth="1")
+        with pytest.raises(TypeError):
+            find(jobs="2")
+
+        # Invalid value of type/size/maxdepth/jobs.
+        with pytest.raises(ValueError):
+            find(type="x")
+        with pytest.raises(ValueError):
+            find(type="f,")
+        with pytest.raises(ValueError):
+            find(size="10T")
+        with pytest.raises(ValueError):
+            find(maxdepth=-1)
+        with pytest.raises(ValueError):
+            find(jobs=0)
+
+        # batch and sudo can't be used with jobs.
+        with pytest.raises(ValueError):
+            find(batch=True, jobs=2)
+        with pytest.raises(ValueError):
+            find(sudo=True, jobs=2)
+
+        # Invalid path.
+        with pytest.raises(ValueError):
+            find(str(tmp_path / "missing"), jobs=2)
+        with pytest.raises(ValueError):
+            find(str(tmp_path), newer=str(tmp_path / "missing"), jobs=2)
+
+        # Asserts
+        assert find(test=True) == 'find "."'
+        assert find("~/dir", name="*.py", type="f,l", newer="ref",
+                    size="+1k", maxdepth=2, sudo=True, test=True) == (
+            "sudo find ~/\"dir\" -maxdepth 2 -name '*.py' -type f,l "
+            "-newer \"ref\" -size +1k")
+        assert find(["a", "b"], prune=".git", test=True) == (
+            "find \"a\" \"b\" -name '.git' -prune -o -print")
+        assert find("*", prune=[".git", "x"], batch=True, test=True) == (
+            "find * \\( -name '.git' -o -name 'x' \\) -prune -o -print")
+
+        (tmp_path / "a" / ".git" / "objects").mkdir(parents=True)
+        (tmp_path / "a" / ".git" / "HEAD").write_bytes(b'')
+        (tmp_path / "a" / "big").write_bytes(b'x' * 2000)
+        (tmp_path / "a" / "empty").write_bytes(b'')
+        (tmp_path / "b" / "c").mkdir(parents=True)
+        (tmp_path / "b" / "c" / "script.py").write_bytes(b'1')
+        (tmp_path / "link").symlink_to("a")
+        (tmp_path / "ref").write_bytes(b'')
+        os.utime(tmp_path / "ref", (0, 0))
+        os.utime(tmp_path / "a" / "empty", (0, 0))
+        for kwargs in ({}, {"name": "*.py"}, {"type": 'f'},
+                       {"type": "d,l"}, {"size": "+3"}, {"size": "-1k"},
+                       {"size": '4'}, {"size": "2000c"}, {"maxdepth": 0},
+                       {"maxdepth": 1}, {"prune": ".git"},
+                       {"prune": [".git", 'c'], "type": 'd'},
+                       {"newer": "ref"}, {"path": ["a", "b/"]}):
+            process = find(cwd=str(tmp_path), **kwargs)
+            found = find(cwd=str(tmp_path), jobs=2, **kwargs)
+            assert type(found) != str
+            assert sorted(found) == sorted(process.get_lines()), kwargs
+        assert sorted(find(str(tmp_path / "b"), jobs=1)) == [
+            str(tmp_path / "b"), str(tmp_path / "b" / "c"),
+            str(tmp_path / "b" / "c" / "script.py")]
+
+    def test_journaled_batch(self, tmp_path):
+        journaled_batch = gnu_coreutils.journaled_batch
+        # Errors
+        # Invalid value of operation.
+        with pytest.raises(ValueError):
+            journaled_batch("ln", ['a'], "journal", "dst")
+
+        # paths' type must be Iterable[str].
+        with pytest.raises(TypeError):
+            journaled_batch("rm", 'a', "journal")
+
+        # destination_path must be used only with cp and mv.
+        with pytest.raises(ValueError):
+            journaled_batch("cp", ['a'], "journal")
+        with pytest.raises(ValueError):
+            journaled_batch("rm", ['a'], "journal", "dst")
+
+        # chunk must be greater than 0.
+        with pytest.raises(ValueError):
+            journaled_batch("rm", ['a'], "journal", chunk=0)
+
+        # Asserts
+        cwd = str(tmp_path)
+        (tmp_path / "dst").mkdir()
+        names = [f"file {i}" for i in range(9)] + ["$HOME", "it's"]
+        for name in names:
+            (tmp_path / name).write_text(name)
+        journal = tmp_path / "mv.journal"
+
+        # Interrupted run: 2 paths are journaled, 1 is moved without journal
+        journal.write_text(
+            '{"operation": "mv", "destination_path": "dst"}\n'
+            '"file 0"\n"file 1"\n"file')
+        for name in ("file 0", "file 1", "file 2"):
+            (tmp_path / name).rename(tmp_path / "dst" / name)
+        result = journaled_batch("mv", names + ["missing"], "mv.journal",
+                                 "dst", chunk=4, cwd=cwd)
+        assert result.exit_code() == 1
+        assert result.stats == {"done": 8, "skipped": 3, "failed": 1}
+        assert [path for path, _ in result.errors] == ["missing"]
+        assert "missing" in result.error_output()
+        assert sorted(os.listdir(tmp_path / "dst")) == sorted(names)
+        assert (tmp_path / "dst" / "$HOME").read_text() == "$HOME"
+
+        # Second run only retries failed paths
+        result = journaled_batch("mv", names + ["missing"], "mv.journal",
+                                 "dst", chunk=4, cwd=cwd)
+        assert result.stats == {"done": 0, "skipped": 11, "failed": 1}
+        lines = journal.read_text().split('\n')
+        assert lines[3] == '"file' and lines[-1] == ''
+        assert len(lines) == 1 + 11 + 2  # Header, paths, interrupted, ""
+        with pytest.raises(ValueError):
+            journaled_batch("cp", names, "mv.journal", "dst", cwd=cwd)
+
+        # cp and rm
+        (tmp_path / "copy").mkdir()
+        with core.working_directory(cwd):
+            result = journaled_batch("cp", ["dst/" + e for e in names],
+                                     "cp.journal", "copy", chunk=5)
+            assert result.exit_code() == 0
+            assert result.stats["done"] == 11
+            assert journaled_batch("cp", ["dst/" + e for e in names],
+                                   "cp.journal", "copy").stats["skipped"] == 11
+            result = journaled_batch("rm", ["dst/" + e for e in names],
+                                     "rm.journal", short_args='f')
+            assert result.stats == {"done": 11, "skipped": 0, "failed": 0}
+        assert os.listdir(tmp_path / "dst") == []
+        assert sorted(os.listdir(tmp_path / "copy")) == sorted(names)
+
     def test_ln(self):
         ln = gnu_coreutils.ln
         # Errors
@@ -291,6 +585,55 @@ class TestGNUcoreutils:
         assert ls(['"dir 1" "dir 2" dir3/*']
                   ) == 'ls  -- "dir 1" "dir 2" dir3/*'
 
+    def test_ls_entries(self, tmp_path):
+        ls_entries = gnu_coreutils.ls_entries
+        # Errors
+        # path's type must be str.
+        with pytest.raises(TypeError):
+            ls_entries(1)
+
+        # Invalid path.
+        with pytest.raises(ValueError):
+            ls_entries(str(tmp_path / "missing"))
+
+        # Invalid value of sort.
+        with pytest.raises(ValueError):
+            ls_entries(str(tmp_path), sort="extension")
+
+        # Asserts
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "nested").write_bytes(b'1')
+        (tmp_path / "big").write_bytes(b'1' * 100)
+        (tmp_path / "small").write_bytes(b'1' * 10)
+        (tmp_path / ".hidden").touch()
+        (tmp_path / "link").symlink_to("big")
+        os.utime(tmp_path / "big", (0, 0))
+
+        def names(*args, **kwargs):
+            return [e.name for e in ls_entries(str(tmp_path), *args, **kwargs)]
+        assert names() == ["big", "dir", "link", "small"]
+        assert names(hidden=True) == [".hidden", "big", "dir", "link", "small"]
+        assert names(reverse=True) == ["small", "link", "dir", "big"]
+        by_size = names(sort="size")
+        assert by_size.index("big") < by_size.index("small")
+        assert by_size.index("small") < by_size.index("link")
+        assert names(sort="time")[-1] == "big"
+        assert names(True) == ["big", "dir", "link", "small", "nested"]
+
+        entries = {e.name: e for e in ls_entries(str(tmp_path))}
+        assert type(entries["big"]) == gnu_coreutils.LsEntry
+        assert not hasattr(entries["big"], "__dict__")
+        assert entries["big"].type == '-'
+        assert entries["big"].size == 100
+        assert entries["big"].mtime == 0
+        assert entries["big"].inode == os.stat(tmp_path / "big").st_ino
+        assert entries["dir"].type == 'd'
+        assert entries["link"].type == 'l'
+        assert entries["link"].link_target == "big"
+        assert entries["big"].link_target is None
+        assert [e.path for e in ls_entries(str(tmp_path / "small"))] == [
+            str(tmp_path / "small")]
+
     def test_mv(self):
         mv = gnu_coreutils.mv
         # Errors
@@ -375,12 +718,66 @@ class TestGNUcoreutils:
         assert mv(['"/dir 1" dir2/*'], '~', 'i'
                   ) == 'mv -i -- "/dir 1" dir2/* ~'
 
+    def test_mv_native(self, tmp_path, monkeypatch):
+        mv = gnu_coreutils.mv
+        # Errors
+        # batch and sudo can't be used with native=True.
+        with pytest.raises(ValueError):
+            mv('', '', batch=True, native=True)
+        with pytest.raises(ValueError):
+            mv('', '', sudo=True, native=True)
+
+        # Argument isn't supported in native mode.
+        with pytest.raises(ValueError):
+            mv('', '', 'u', native=True)
+
+        # Asserts
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "dir" / "sub").mkdir(parents=True)
+        (tmp_path / "dest").mkdir()
+        for name in ("file1", "file2", "dest/file1", "dest/file2"):
+            (tmp_path / name).write_text(name)
+        result = mv(["file1", "dir", "missing"], "dest", 'b', native=True)
+        assert result.exit_code() == 1
+        assert result.stats["moved"] == 2
+        assert [path for path, error in result.errors] == ["missing"]
+        assert (tmp_path / "dest" / "file1").read_text() == "file1"
+        assert (tmp_path / "dest" / "file1~").read_text() == "dest/file1"
+        assert (tmp_path / "dest" / "dir" / "sub").is_dir()
+        assert not (tmp_path / "dir").exists()
+
+        # No-clobber and rename
+        result = mv("file2", "dest", 'n', native=True)
+        assert result.exit_code() == 0
+        assert result.stats["moved"] == 0
+        assert (tmp_path / "file2").exists()
+        result = mv("file2", str(tmp_path / "renamed"), native=True)
+        assert result.stats["moved"] == 1
+        assert (tmp_path / "renamed").read_text() == "file2"
+
+        # Source is the target or its backup
+        (tmp_path / "f").write_text("f")
+        (tmp_path / "f~").write_text("f~")
+        result = mv("f~", "f", 'b', native=True)
+        assert result.exit_code() == 1
+        assert result.get_lines(stderr=True) == [
+            "mv: backing up 'f' might destroy source;  'f~' not moved"]
+        assert (tmp_path / "f").read_text() == "f"
+        assert (tmp_path / "f~").read_text() == "f~"
+        result = mv("f", str(tmp_path / "f"), native=True)
+        assert result.exit_code() == 1
+        assert result.get_lines(stderr=True) == [
+            f"mv: 'f' and '{tmp_path}/f' are the same file"]
+        assert (tmp_path / "f").read_text() == "f"
+
     def test_pwd(self):
         pwd = gnu_coreutils.pwd
         # Asserts
         # Test return value
         assert type(pwd()) == str
         assert type(pwd('L')) == core.Shell
+        assert pwd(cache_ttl=30) == os.getcwd()
+        assert type(pwd('L', cache_ttl=30)) == core.CompletedShell
 
         # Test short arguments
         def pwd(short_args: Union[str, Iterable[str]] = []):
@@ -466,6 +863,180 @@ class TestGNUcoreutils:
         assert rm(['"/dir 1" dir2/*'], 'r'
                   ) == 'rm -r -- "/dir 1" dir2/*'
 
+    def test_rm_jobs(self, tmp_path):
+        rm = gnu_coreutils.rm
+        # Errors
+        # jobs' type must be int.
+        with pytest.raises(TypeError):
+            rm('', jobs=1.0)
+
+        # jobs must be greater than 0.
+        with pytest.raises(ValueError):
+            rm('', jobs=-1)
+
+        # batch and sudo can't be used with jobs.
+        with pytest.raises(ValueError):
+            rm('', batch=True, jobs=2)
+        with pytest.raises(ValueError):
+            rm('', sudo=True, jobs=2)
+
+        # Argument isn't supported in native mode.
+        with pytest.raises(ValueError):
+            rm('', 'i', jobs=2)
+
+        # Asserts
+        tree = tmp_path / "tree"
+        for i in range(10):
+            (tree / f"dir{i}" / "sub").mkdir(parents=True)
+            for j in range(10):
+                (tree / f"dir{i}" / "sub" / f"file{j}").touch()
+        (tmp_path / "outside").mkdir()
+        (tmp_path / "outside" / "file").touch()
+        (tree / "dir0" / "link").symlink_to(tmp_path / "outside")
+        result = rm(str(tree), 'r', jobs=4)
+        assert result.exit_code() == 0
+        assert result.stats["removed"] == 100 + 20 + 1 + 1
+        assert not tree.exists()
+        assert (tmp_path / "outside" / "file").exists()
+
+        # Parent path contains a symlink
+        (tmp_path / "outside" / "victim" / "sub").mkdir(parents=True)
+        (tmp_path / "parent_link").symlink_to("outside")
+        result = rm(str(tmp_path / "parent_link" / "victim"), 'r', jobs=4)
+        assert result.exit_code() == 0
+        assert result.stats["removed"] == 2
+        assert not (tmp_path / "outside" / "victim").exists()
+        assert (tmp_path / "parent_link").is_symlink()
+
+        # Refused and missing paths
+        result = rm(['/', str(tmp_path / "missing"), '.'], "rf", jobs=2)
+        assert result.exit_code() == 1
+        assert [path for path, error in result.errors] == ['/', '.']
+        result = rm(str(tmp_path / "outside"), jobs=2)
+        assert result.exit_code() == 1
+        assert (tmp_path / "outside").exists()
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"),
+                        reason="/proc/self/fd isn't available")
+    def test_rm_jobs_fd_cleanup(self, tmp_path, monkeypatch):
+        rm = gnu_coreutils.rm
+        scandir = os.scandir
+
+        def count_fds() -> int:
+            return len(os.listdir("/proc/self/fd"))
+
+        def failing_scandir(path='.'):
+            # Directories deeper than top levels are read by subtree workers
+            if (isinstance(path, int) and
+                    os.readlink(f"/proc/self/fd/{path}").endswith(failing)):
+                raise PermissionError(13, "Permission denied")
+            return scandir(path)
+
+        monkeypatch.setattr(os, "scandir", failing_scandir)
+        for failing in ("/c", "/d"):  # Root and nested directory of subtree
+            (tmp_path / "tree" / "a" / "b" / "c" / "d" / "e").mkdir(
+                parents=True, exist_ok=True)
+            fds = count_fds()
+            result = rm(str(tmp_path / "tree"), 'r', jobs=1)
+            assert count_fds() == fds
+            assert result.exit_code() == 1
+            assert [path for path, error in result.errors][0].endswith(
+                failing)
+        monkeypatch.undo()
+        assert rm(str(tmp_path / "tree"), 'r', jobs=1).exit_code() == 0
+
+    def test_Script(self, tmp_path):
+        Script = gnu_coreutils.Script
+        # Errors
+        # command's type must be str.
+        with pytest.raises(TypeError):
+            Script().add(1)
+
+        # Asserts
+        script = Script()
+        script.cd(str(tmp_path))
+        script.add("printf text > file1").cp("file1", "file2")
+        script.mv("file2", "file 3").ls('', '1').pwd()
+        script.add("printf out; printf error >&2; false").rm("file 3")
+        assert script.commands[2] == 'cp  -- "file1" "file2"'
+        results = script.run()
+        assert [r.exit_code() for r in results] == [0, 0, 0, 0, 0, 0, 1, 0]
+        assert results[4].get_lines() == ["file 3", "file1"]
+        assert results[5].output() == f"{tmp_path}\n"
+        assert results[6].output() == "out"
+        assert results[6].error_output() == "error"
+        assert results[7].command == 'rm  -- "file 3"'
+        assert not (tmp_path / "file 3").exists()
+
+        # stop_on_error=True
+        results = Script().add("true").add("false").add("true").run(True)
+        assert [r.exit_code() for r in results] == [0, 1]
+
+        # Step that terminates the shell
+        results = Script().add("printf a; exit 5").add("true").run()
+        assert len(results) == 1
+        assert results[0].exit_code() == 5
+        assert results[0].output() == 'a'
+        assert Script().run() == []
+
+    def test_sudo_privileged_session(self, monkeypatch, tmp_path):
+        # sudo=True wrappers return results of the session as finished Shell
+        class Session:
+            def run(self, command, cwd=None):
+                commands.append((command, cwd))
+                return core.CompletedShell(command, None, 0, b"out\n")
+
+        commands = []
+        monkeypatch.setattr(gnu_coreutils, "get_privileged_session", Session)
+        result = gnu_coreutils.ls("dir", sudo=True, cwd='/')
+        assert type(result) == core.Shell
+        assert result.poll() == 0 and result.exit_code() == 0
+        assert result.output() == "out\n"
+        assert result.finish().output() == "out\n"
+        assert result.shell("echo chained").output() == "chained\n"
+        assert commands == [('ls  -- "dir"', '/')]
+        # Journaled batches finish session results in the same way
+        (tmp_path / "f").touch()
+        result = gnu_coreutils.journaled_batch("rm", ["f"], "rm.journal",
+                                               sudo=True, cwd=str(tmp_path))
+        assert result.exit_code() == 0 and result.stats["done"] == 1
+        assert commands[1][0] == "rm  -- 'f'"
+        # Session isn't used if only the command is needed
+        assert gnu_coreutils.rm("f", sudo=True, test=True) == 'sudo rm  -- "f"'
+        assert len(commands) == 2
+
+    def test_working_directory(self, tmp_path):
+        cd = gnu_coreutils.cd
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "dir one").mkdir()
+        (tmp_path / "dir one" / "file").touch()
+        process_cwd = os.getcwd()
+
+        # Wrappers with cwd/env
+        ls = gnu_coreutils.ls
+        assert ls(cwd=str(tmp_path / "dir one")).output() == "file\n"
+        assert ls(cwd=str(tmp_path), cache_ttl=10).output() == "dir one\n"
+        assert gnu_coreutils.pwd(cwd=str(tmp_path)) == str(tmp_path)
+        assert gnu_coreutils.Script().add("echo $X").run(
+            cwd=str(tmp_path), env_update={'X': 'x'})[0].output() == "x\n"
+
+        # cd() changes working directory of the thread only
+        with core.working_directory(str(tmp_path)):
+            assert cd("dir*").exit_code() == 0
+            assert core.get_working_directory() == str(tmp_path / "dir one")
+            assert gnu_coreutils.pwd() == str(tmp_path / "dir one")
+            assert os.getcwd() == process_cwd
+            assert gnu_coreutils.cp("file", "copy", jobs=2).exit_code() == 0
+            assert gnu_coreutils.mv("copy", "moved", native=True
+                                    ).exit_code() == 0
+            assert [e.name for e in gnu_coreutils.ls_entries()] == [
+                "file", "moved"]
+            assert gnu_coreutils.rm("moved", jobs=1).exit_code() == 0
+            assert cd("..").exit_code() == 0
+            assert core.get_working_directory() == str(tmp_path)
+        assert os.getcwd() == process_cwd
+        assert os.listdir(tmp_path / "dir one") == ["file"]
+
 
 if __name__ == "__main__":
     pytest.main()